@@ -0,0 +1,99 @@
+"""Capture-to-encoded latency of the old RGB path versus the zero-copy BGRX path.
+
+A 4K mss ScreenShot is built from a synthetic framebuffer, so no display is needed.
+The "before" path is what the host did before: ScreenShot.rgb, Image.frombytes,
+five ImageDraw rectangles for the border and an RGB array for the encoder. The
+"after" path wraps ScreenShot.raw directly. Both run a keyframe and a small
+delta (a clock-sized change) through a single-threaded DeltaEncoder.
+
+Usage: python benchmarks/bench_capture_path.py [--width 3840] [--height 2160] [--runs 10]
+"""
+import sys
+import os
+import io
+import time
+import argparse
+
+import lz4.frame
+import numpy as np
+from mss.screenshot import ScreenShot
+from PIL import Image, ImageDraw
+
+# Add parent dir for common modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.imaging import DeltaEncoder, bgrx_frame
+from benchmarks.bench_encode_workers import synthetic_frame
+
+
+def grab(base, tick, width, height):
+    """Fresh ScreenShot per capture, with a small region changing like a clock"""
+    frame = base.copy()
+    frame[20:40, width - 120:width - 20, :3] = (tick * 37) % 256
+    monitor = {"top": 0, "left": 0, "width": width, "height": height}
+    return ScreenShot(bytearray(frame.tobytes()), monitor)
+
+
+def old_path(shot, encoder):
+    img = Image.frombytes("RGB", shot.size, shot.rgb)
+    draw = ImageDraw.Draw(img)
+    for i in range(5):
+        draw.rectangle([i, i, img.width - 1 - i, img.height - 1 - i], outline="lime")
+
+    # The old encoder took RGB arrays; pad to BGRX so today's encoder can run it
+    rgb = np.asarray(img)
+    frame = np.empty(rgb.shape[:2] + (4,), dtype=np.uint8)
+    frame[..., 2::-1] = rgb
+    return encoder.encode(frame)
+
+
+def new_path(shot, encoder):
+    return encoder.encode(bgrx_frame(shot.raw, shot.width, shot.height))
+
+
+def old_full_jpeg(shot, quality):
+    """The original single full-frame JPEG + LZ4 path"""
+    img = Image.frombytes("RGB", shot.size, shot.rgb)
+    draw = ImageDraw.Draw(img)
+    for i in range(5):
+        draw.rectangle([i, i, img.width - 1 - i, img.height - 1 - i], outline="lime")
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=quality)
+    return lz4.frame.compress(buf.getvalue())
+
+
+def measure(path, shots, keyframe_interval):
+    encoder = DeltaEncoder(70, keyframe_interval=keyframe_interval, workers=1)
+    path(shots[0], encoder)  # Reference frame for deltas
+    timings = []
+    for shot in shots[1:]:
+        start = time.perf_counter()
+        path(shot, encoder)
+        timings.append((time.perf_counter() - start) * 1000)
+    return np.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Capture-to-encoded latency')
+    parser.add_argument('--width', type=int, default=3840)
+    parser.add_argument('--height', type=int, default=2160)
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args()
+
+    base = synthetic_frame(args.width, args.height)
+    shots = [grab(base, tick, args.width, args.height) for tick in range(args.runs + 1)]
+
+    print(f"{args.width}x{args.height}, median ms from ScreenShot to encoded tiles")
+    print(f"{'':<10} {'before':>8} {'after':>8}")
+    for name, interval in (('keyframe', 0), ('delta', 10 ** 6)):
+        before = measure(old_path, shots, interval)
+        after = measure(new_path, shots, interval)
+        print(f"{name:<10} {before:>8.1f} {after:>8.1f}")
+
+    start = time.perf_counter()
+    for shot in shots[1:]:
+        old_full_jpeg(shot, 70)
+    print(f"original full-frame JPEG path: {(time.perf_counter() - start) * 1000 / args.runs:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""Latency of small control messages while large frames saturate a slow link.
+
+A host-side NetworkManager streams 500 KB frames as fast as the link takes
+them while another thread sends a small control message every few
+milliseconds, the way input acks and requests share the connection with
+frames. The receiving end reads through a rate-limited socket to stand in for
+a slow network. Reports the control messages' delivery delay and the frame
+throughput achieved.
+
+Usage: python benchmarks/bench_channels.py [--link-mbps 20] [--seconds 5] [--frame-kb 500]
+"""
+import sys
+import os
+import time
+import socket
+import threading
+import argparse
+
+import numpy as np
+
+# Add parent dir for common modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.network import NetworkManager, MSG_FRAME_DELTA, MSG_FRAME_ACK
+from common.imaging import TILE_JPEG
+
+
+class ThrottledSocket:
+    """Socket wrapper whose recv_into delivers at most rate bytes per second"""
+
+    def __init__(self, sock, rate, piece=4096):
+        self.sock = sock
+        self.rate = rate
+        self.piece = piece
+        self.next_time = time.perf_counter()
+
+    def recv_into(self, view):
+        delay = self.next_time - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        n = self.sock.recv_into(view[:self.piece])
+        self.next_time = max(self.next_time, time.perf_counter() - 0.01) + n / self.rate
+        return n
+
+    def __getattr__(self, name):
+        return getattr(self.sock, name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Control message latency under frame load')
+    parser.add_argument('--link-mbps', type=float, default=20)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--frame-kb', type=int, default=500)
+    parser.add_argument('--interval-ms', type=float, default=10, help='Between control messages')
+    parser.add_argument('--port', type=int, default=19990)
+    args = parser.parse_args()
+
+    server = NetworkManager(is_server=True)
+    server.listen('127.0.0.1', args.port)
+    accepted = []
+    acceptor = threading.Thread(target=lambda: accepted.append(server.accept()))
+    acceptor.start()
+    client = NetworkManager(is_server=False)
+    if not client.connect('127.0.0.1', args.port):
+        return 1
+    acceptor.join()
+    host = accepted[0]
+    # A small receive window, as a slow link would have, so data backs up in the sender
+    client.socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 64 * 1024)
+    client.socket = ThrottledSocket(client.socket, args.link_mbps * 1e6 / 8)
+
+    frame = {'type': MSG_FRAME_DELTA, 'seq': 0, 'width': 2560, 'height': 1440, 'keyframe': True,
+             'cache_reset': False, 'captured': 0.0, 'copies': [],
+             'tiles': [(0, 0, 2560, 64, TILE_JPEG, os.urandom(args.frame_kb * 1024))]}
+    sent_at = {}
+    running = True
+
+    def send_frames():
+        while running and host.send_data(frame):
+            pass
+
+    def send_control():
+        seq = 0
+        while running:
+            seq += 1
+            sent_at[seq] = time.perf_counter()
+            if not host.send_data({'type': MSG_FRAME_ACK, 'seq': seq}):
+                break
+            time.sleep(args.interval_ms / 1000)
+
+    senders = [threading.Thread(target=send_frames, daemon=True), threading.Thread(target=send_control, daemon=True)]
+    for sender in senders:
+        sender.start()
+
+    latencies = []
+    frames = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < args.seconds:
+        data = client.receive_data()
+        if data is None:
+            break
+        if data['type'] == MSG_FRAME_ACK:
+            latencies.append(time.perf_counter() - sent_at[data['seq']])
+        else:
+            frames += 1
+    elapsed = time.perf_counter() - start
+    running = False
+    host.close()
+    client.close()
+    server.close()
+
+    latencies = np.array(latencies) * 1000
+    print(f"link {args.link_mbps:g} Mbit/s, {args.frame_kb} KB frames: {frames / elapsed:.1f} frames/s, "
+          f"{frames * args.frame_kb * 8 / 1024 / elapsed:.1f} Mbit/s of frames")
+    if len(latencies):
+        print(f"control messages: {len(latencies)}, latency p50 {np.percentile(latencies, 50):.1f} ms "
+              f"p95 {np.percentile(latencies, 95):.1f} ms max {latencies.max():.1f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
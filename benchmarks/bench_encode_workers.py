@@ -0,0 +1,67 @@
+"""Keyframe encode throughput versus encoder worker count.
+
+Usage: python benchmarks/bench_encode_workers.py [--width 3840] [--height 2160] [--frames 20]
+"""
+import sys
+import os
+import time
+import argparse
+
+import numpy as np
+
+# Add parent dir for common modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.imaging import DeltaEncoder, DEFAULT_TILE_SIZE
+
+
+def synthetic_frame(width, height, seed=0):
+    """BGRX gradient with noise, roughly as hard to encode as a busy desktop"""
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    frame = np.empty((height, width, 4), dtype=np.uint8)
+    frame[..., 0] = y
+    frame[..., 1] = x
+    frame[..., 2] = (x + y) / 2
+    frame[..., 3] = 255
+    frame[..., :3] += rng.integers(0, 32, size=(height, width, 3), dtype=np.uint8)
+    return frame
+
+
+def measure(frame, workers, frames, quality, tile_size):
+    # Interval 0 makes every frame a keyframe, i.e. a full-frame encode
+    encoder = DeltaEncoder(quality, tile_size, keyframe_interval=0, workers=workers)
+    encoder.encode(frame)  # Warm up the pool
+
+    start = time.perf_counter()
+    for _ in range(frames):
+        encoder.encode(frame)
+    elapsed = time.perf_counter() - start
+
+    encoder.close()
+    return frames / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Encode fps versus worker count')
+    parser.add_argument('--width', type=int, default=3840)
+    parser.add_argument('--height', type=int, default=2160)
+    parser.add_argument('--frames', type=int, default=20)
+    parser.add_argument('--quality', type=int, default=70)
+    parser.add_argument('--tile-size', type=int, default=DEFAULT_TILE_SIZE)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    frame = synthetic_frame(args.width, args.height)
+    print(f"{args.width}x{args.height} keyframes, quality {args.quality}, {os.cpu_count()} CPUs")
+    print(f"{'workers':>8} {'fps':>8} {'speedup':>8}")
+
+    baseline = None
+    for workers in args.workers:
+        fps = measure(frame, workers, args.frames, args.quality, args.tile_size)
+        baseline = baseline or fps
+        print(f"{workers:>8} {fps:>8.1f} {fps / baseline:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""End-to-end benchmark: synthetic screens streamed to a headless client over loopback.
+
+For each scene the host runs in-process on a synthetic capture source and a
+HeadlessClient connects to it, so no display, input devices or Qt are needed.
+Reports client fps, glass-to-glass latency percentiles (host capture to client
+canvas updated), bytes per frame and the CPU used by each pipeline stage as a
+percentage of one core. --output writes the results as JSON; pass such a file
+with --compare to see what changed.
+
+Usage: python benchmarks/bench_end_to_end.py [--scenes static typing] [--seconds 10]
+                                             [--output results.json] [--compare baseline.json]
+"""
+import sys
+import os
+import json
+import time
+import platform
+import argparse
+
+import numpy as np
+
+# Add parent dir for common modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from client.headless import HeadlessClient
+from host.host import RemoteHost, InputSink
+from host.synthetic import SCENES
+
+# Metrics compared against a baseline, and whether lower is better
+COMPARED = {
+    'fps': False,
+    'latency_ms.p50': True,
+    'latency_ms.p95': True,
+    'bytes_per_frame': True,
+    'cpu_percent.encode': True,
+    'cpu_percent.decode': True,
+}
+
+
+def run_scene(scene, args, port):
+    host = RemoteHost(host='127.0.0.1', port=port, quality=args.quality, frame_rate=args.fps,
+                      adaptive=args.adaptive, encode_workers=args.encode_workers, video=not args.no_video,
+                      source=SCENES[scene](args.width, args.height), input_sink=InputSink())
+    if not host.start():
+        return None
+
+    client = HeadlessClient(tile_cache_mb=args.tile_cache_mb)
+    try:
+        if not client.connect('127.0.0.1', port):
+            return None
+        if args.viewport:
+            client.send_viewport(*args.viewport)
+        # Let the first keyframe through before measuring
+        client.run(args.warmup)
+        warm_frames, warm_cpu = client.frames, dict(host.stage_cpu)
+        warm_decode, warm_hits = client.decode_cpu, client.cache_hits
+
+        start = time.time()
+        client.run(args.seconds)
+        elapsed = time.time() - start
+    finally:
+        client.close()
+        host.stop()
+
+    stage_cpu = {stage: seconds - warm_cpu[stage] for stage, seconds in host.stage_cpu.items()}
+    stage_cpu['decode'] = client.decode_cpu - warm_decode
+    result = {
+        'frames': client.frames - warm_frames,
+        'fps': round((client.frames - warm_frames) / elapsed, 2),
+        'latency_ms': None,
+        'bytes_per_frame': 0,
+        'keyframes': client.keyframes,
+        'cursor_updates': client.cursor_updates,
+        'tile_cache_hits': client.cache_hits - warm_hits,
+        'tile_cache_misses': client.cache_misses,
+        'cpu_percent': {stage: round(seconds * 100 / elapsed, 2) for stage, seconds in stage_cpu.items()},
+        'captures_dropped': sum(stream.capture_queue.dropped for stream in host.streams),
+    }
+
+    # A static screen sends nothing after the first keyframe
+    if result['frames']:
+        latencies = np.array(client.latencies[warm_frames:]) * 1000
+        result['latency_ms'] = {
+            'p50': round(float(np.percentile(latencies, 50)), 2),
+            'p95': round(float(np.percentile(latencies, 95)), 2),
+            'p99': round(float(np.percentile(latencies, 99)), 2),
+            'max': round(float(latencies.max()), 2),
+        }
+        result['bytes_per_frame'] = int(np.mean(client.frame_bytes[warm_frames:]))
+    return result
+
+
+def lookup(result, metric):
+    for key in metric.split('.'):
+        result = result.get(key) if isinstance(result, dict) else None
+    return result
+
+
+def compare(results, baseline):
+    print(f"\n{'scene':<10} {'metric':<26} {'baseline':>10} {'now':>10} {'change':>8}")
+    for scene, result in results['scenes'].items():
+        before = baseline.get('scenes', {}).get(scene)
+        if not before or not result:
+            continue
+        for metric, lower_is_better in COMPARED.items():
+            old, new = lookup(before, metric), lookup(result, metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old * 100
+            worse = change > 0 if lower_is_better else change < 0
+            flag = " !" if worse and abs(change) >= 10 else ""
+            print(f"{scene:<10} {metric:<26} {old:>10} {new:>10} {change:>+7.1f}%{flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Headless end-to-end benchmark')
+    parser.add_argument('--scenes', nargs='+', choices=sorted(SCENES), default=list(SCENES))
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--warmup', type=float, default=1)
+    parser.add_argument('--width', type=int, default=1280)
+    parser.add_argument('--height', type=int, default=720)
+    parser.add_argument('--viewport', type=lambda text: tuple(map(int, text.split('x'))), metavar='WxH',
+                        help='Client window size reported to the host')
+    parser.add_argument('--fps', type=int, default=30)
+    parser.add_argument('--quality', type=int, default=70)
+    parser.add_argument('--encode-workers', type=int, default=4)
+    parser.add_argument('--adaptive', action='store_true', help='Let the bitrate controller adjust settings')
+    parser.add_argument('--tile-cache-mb', type=int, default=64, help="Client's tile cache budget; 0 disables it")
+    parser.add_argument('--no-video', action='store_true', help='Keep full-motion areas on the tile codecs')
+    parser.add_argument('--port', type=int, default=19998, help='First port; each scene uses the next one')
+    parser.add_argument('--output', help='Write the results to this JSON file')
+    parser.add_argument('--compare', help='Earlier results file to compare against')
+    args = parser.parse_args()
+
+    results = {
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'platform': {'python': platform.python_version(), 'machine': platform.machine(),
+                     'cpus': os.cpu_count()},
+        'config': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+        'scenes': {},
+    }
+    for index, scene in enumerate(args.scenes):
+        results['scenes'][scene] = result = run_scene(scene, args, args.port + index)
+        if result is None:
+            print(f"{scene}: could not connect")
+            continue
+        cpu = ' '.join(f"{stage} {percent:.1f}%" for stage, percent in result['cpu_percent'].items())
+        latency = result['latency_ms']
+        latency = f"p50 {latency['p50']:.1f} ms p95 {latency['p95']:.1f} ms" if latency else "n/a"
+        print(f"{scene}: {result['fps']:.1f} fps, latency {latency}, "
+              f"{result['bytes_per_frame'] / 1024:.1f} KB/frame, CPU {cpu}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
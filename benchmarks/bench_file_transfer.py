@@ -0,0 +1,120 @@
+"""File transfer throughput over loopback, alongside a live screen stream.
+
+An in-process host streams a synthetic scene to a HeadlessClient, which
+uploads a file of random data into a temporary receive directory while it
+keeps applying frames. Reports upload throughput, the frame rate the client
+kept up meanwhile, and checks that the received file is identical. With
+--resume the connection is dropped halfway through and a second connection
+sends the same file again, which should only transfer the remainder. With
+--drop the connection is reset halfway instead: the client resumes the
+session on a new connection and the upload should carry on by itself.
+
+Usage: python benchmarks/bench_file_transfer.py [--size-mb 256] [--scene typing] [--resume | --drop]
+"""
+import sys
+import os
+import time
+import hashlib
+import tempfile
+import argparse
+
+# Add parent dir for common modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from client.headless import HeadlessClient
+from host.host import RemoteHost, InputSink
+from host.synthetic import SCENES
+from common.logging_utils import metrics
+from benchmarks.bench_reconnect import drop
+
+WRITTEN = metrics.counter('file_bytes_written_total')
+SENT = metrics.counter('file_bytes_sent_total')
+
+
+def digest(path):
+    h = hashlib.blake2b()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def upload(port, path, rate=None, stop_at=None, drop_at=None):
+    """Connect, send path while applying frames; returns (seconds, frames, finished)
+
+    Once drop_at bytes are written the connection is reset, once, and the
+    client carries on over a new one.
+    """
+    client = HeadlessClient()
+    if not client.connect('127.0.0.1', port):
+        raise RuntimeError("could not connect")
+    client.run(0.5)
+    frames = client.frames
+    start = time.perf_counter()
+    sender = client.send_file(path, rate)
+    while not sender.done.is_set():
+        if not client.run(0.05):
+            break
+        if stop_at is not None and WRITTEN.value >= stop_at:
+            break
+        if drop_at is not None and WRITTEN.value >= drop_at:
+            print(f"dropping the connection after {WRITTEN.value / 2**20:.0f} MB")
+            drop(client)
+            drop_at = None
+    elapsed = time.perf_counter() - start
+    frames = client.frames - frames
+    client.close()
+    sender.done.wait(5)
+    return elapsed, frames, sender.succeeded
+
+
+def main():
+    parser = argparse.ArgumentParser(description='File transfer throughput over loopback')
+    parser.add_argument('--size-mb', type=int, default=256)
+    parser.add_argument('--scene', default='typing', choices=sorted(SCENES))
+    parser.add_argument('--width', type=int, default=1280)
+    parser.add_argument('--height', type=int, default=720)
+    parser.add_argument('--rate-mbps', type=float, help='Cap the upload rate')
+    parser.add_argument('--resume', action='store_true', help='Disconnect halfway and send again on a new session')
+    parser.add_argument('--drop', action='store_true', help='Reset the connection halfway; the session resumes')
+    parser.add_argument('--port', type=int, default=19995)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'payload.bin')
+        with open(path, 'wb') as f:
+            for _ in range(args.size_mb):
+                f.write(os.urandom(1 << 20))
+        size = os.path.getsize(path)
+        receive_dir = os.path.join(tmp, 'received')
+
+        host = RemoteHost(host='127.0.0.1', port=args.port, frame_rate=30, adaptive=False,
+                          source=SCENES[args.scene](args.width, args.height), input_sink=InputSink(),
+                          receive_dir=receive_dir)
+        if not host.start():
+            return 1
+        rate = args.rate_mbps * 1e6 / 8 if args.rate_mbps else None
+        try:
+            if args.resume:
+                elapsed, frames, _ = upload(args.port, path, rate, stop_at=size // 2)
+                written = WRITTEN.value
+                print(f"interrupted after {written / 2**20:.0f} MB in {elapsed:.2f}s")
+                # Let the host notice the disconnect before the next viewer takes control
+                time.sleep(0.5)
+            before, sent_before = WRITTEN.value, SENT.value
+            elapsed, frames, ok = upload(args.port, path, rate, drop_at=size // 2 if args.drop else None)
+            sent = WRITTEN.value - before
+            if args.drop:
+                print(f"resent {(SENT.value - sent_before - sent) / 2**20:.1f} MB after the drop")
+        finally:
+            host.stop()
+
+        received = os.path.join(receive_dir, 'payload.bin')
+        ok = ok and os.path.exists(received) and digest(received) == digest(path)
+        print(f"{args.size_mb} MB file, {args.scene} scene streaming: {sent / 2**20:.0f} MB in {elapsed:.2f}s = "
+              f"{sent / 2**20 / elapsed:.0f} MB/s, {frames / elapsed:.1f} frames/s meanwhile")
+        print("received file matches" if ok else "received file DIFFERS or is missing")
+        return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,92 @@
+"""Load test: one host broadcasting to N loopback viewers, reporting per-viewer fps.
+
+The host runs in-process on a synthetic screen with delta encoding off, so
+every captured frame is sent in full even when the scene is static. Use --slow
+to add viewers that sleep after every frame; the other viewers' fps should be
+unaffected.
+
+Usage: python benchmarks/bench_multi_viewer.py [--viewers 4] [--slow 1] [--seconds 10] [--scene static]
+"""
+import sys
+import os
+import time
+import threading
+import argparse
+
+# Add parent dir for common modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.network import NetworkManager, MSG_FRAME_DELTA, MSG_FRAME_ACK
+from host.host import RemoteHost, InputSink
+from host.synthetic import SCENES
+
+
+def viewer(port, seconds, delay, results, index):
+    network = NetworkManager(is_server=False)
+    if not (network.connect('127.0.0.1', port) and network.authenticate()):
+        results[index] = None
+        return
+
+    frames = 0
+    received = 0
+    start = time.time()
+    deadline = start + seconds
+    while time.time() < deadline:
+        data = network.receive_data()
+        if data is None:
+            break
+        if data['type'] != MSG_FRAME_DELTA:
+            continue
+        frames += 1
+        received += sum(len(tile[5]) for tile in data['tiles'])
+        network.send_data({'type': MSG_FRAME_ACK, 'seq': data['seq']})
+        if delay:
+            time.sleep(delay)
+
+    elapsed = time.time() - start
+    network.close()
+    results[index] = (frames / elapsed, received / elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Multi-viewer broadcast load test')
+    parser.add_argument('--viewers', type=int, default=4)
+    parser.add_argument('--slow', type=int, default=0, help='How many of the viewers are slow')
+    parser.add_argument('--slow-delay', type=float, default=0.25, help='Seconds a slow viewer spends per frame')
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--fps', type=int, default=15)
+    parser.add_argument('--port', type=int, default=19999)
+    parser.add_argument('--scene', choices=sorted(SCENES), default='static')
+    args = parser.parse_args()
+
+    host = RemoteHost(host='127.0.0.1', port=args.port, frame_rate=args.fps,
+                      delta=False, adaptive=False, max_viewers=args.viewers,
+                      source=SCENES[args.scene](), input_sink=InputSink())
+    if not host.start():
+        return 1
+
+    results = {}
+    threads = []
+    for index in range(args.viewers):
+        delay = args.slow_delay if index >= args.viewers - args.slow else 0
+        thread = threading.Thread(target=viewer, args=(args.port, args.seconds, delay, results, index))
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+    host.stop()
+
+    print(f"{args.viewers} viewers ({args.slow} slow), target {args.fps} fps")
+    print(f"{'viewer':>6} {'fps':>7} {'KB/s':>9}")
+    for index in range(args.viewers):
+        result = results.get(index)
+        slow = " (slow)" if index >= args.viewers - args.slow else ""
+        if result is None:
+            print(f"{index:>6} {'failed':>7}{slow}")
+        else:
+            fps, rate = result
+            print(f"{index:>6} {fps:>7.1f} {rate / 1024:>9.0f}{slow}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+"""Reconnect time after a dropped connection: resuming the session against joining afresh.
+
+An in-process host streams a synthetic scene to a HeadlessClient. Each trial
+stops reading for --backlog seconds, so frames are left in flight, then
+resets the client's connection the way a failing network would. The client
+resumes on a new connection and is timed until it has applied every frame
+the host had encoded before the drop. For comparison, a new client joining
+from scratch is timed until its first keyframe is applied. Reports medians
+in milliseconds and the bytes each way took to bring the screen up to date.
+
+Usage: python benchmarks/bench_reconnect.py [--scene typing] [--trials 10] [--backlog 0.2]
+"""
+import sys
+import os
+import time
+import socket
+import struct
+import argparse
+
+import numpy as np
+
+# Add parent dir for common modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from client.headless import HeadlessClient
+from host.host import RemoteHost, InputSink
+from host.synthetic import SCENES
+from common.logging_utils import metrics
+
+RECEIVED = metrics.counter('client_bytes_received_total')
+LINGER_RESET = struct.pack('ii', 1, 0)  # Closing with a zero linger sends a reset
+
+
+def drop(client):
+    """Reset the client's connection; its next receive fails as on a network error"""
+    sock = client.network.socket
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, LINGER_RESET)
+    os.close(sock.detach())
+    # An unconnected socket stands in, so the next receive errors instead of seeing the host hang up
+    stand_in = client.network.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    return stand_in
+
+
+def resume_trial(client, host, backlog):
+    """Drop and resume; returns (ms until caught up, bytes received meanwhile, keyframes sent)"""
+    client.run(0.3)
+    time.sleep(backlog)
+    target = host.frame_seq
+    keyframes = client.keyframes
+    stand_in = drop(client)
+    start = time.perf_counter()
+    received = RECEIVED.value
+    while client.network.socket is stand_in or client.last_seq < target:
+        if not client.run(0.002):
+            raise RuntimeError("could not resume")
+    return (time.perf_counter() - start) * 1000, RECEIVED.value - received, client.keyframes - keyframes
+
+
+def join_trial(port):
+    """Connect a new client; returns (ms until its first frame is applied, bytes received meanwhile)"""
+    start = time.perf_counter()
+    received = RECEIVED.value
+    client = HeadlessClient()
+    if not client.connect('127.0.0.1', port):
+        raise RuntimeError("could not connect")
+    while not client.frames:
+        client.run(0.002)
+    elapsed = (time.perf_counter() - start) * 1000
+    client.close()
+    return elapsed, RECEIVED.value - received
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Session resumption against a fresh connection')
+    parser.add_argument('--scene', default='typing', choices=sorted(SCENES))
+    parser.add_argument('--width', type=int, default=1920)
+    parser.add_argument('--height', type=int, default=1080)
+    parser.add_argument('--fps', type=int, default=30)
+    parser.add_argument('--trials', type=int, default=10)
+    parser.add_argument('--backlog', type=float, default=0.2, help='Seconds of frames left unread before a drop')
+    parser.add_argument('--port', type=int, default=19996)
+    args = parser.parse_args()
+
+    host = RemoteHost(host='127.0.0.1', port=args.port, frame_rate=args.fps, adaptive=False,
+                      source=SCENES[args.scene](args.width, args.height), input_sink=InputSink())
+    if not host.start():
+        return 1
+    try:
+        client = HeadlessClient()
+        if not client.connect('127.0.0.1', args.port):
+            return 1
+        resumes = [resume_trial(client, host, args.backlog) for _ in range(args.trials)]
+        client.close()
+        # Let the host see the clean close, so the new clients are not queued behind it
+        time.sleep(0.2)
+        joins = [join_trial(args.port) for _ in range(args.trials)]
+    finally:
+        host.stop()
+
+    resume_ms, resume_bytes = (np.median([trial[i] for trial in resumes]) for i in range(2))
+    join_ms, join_bytes = (np.median([trial[i] for trial in joins]) for i in range(2))
+    print(f"{args.scene} {args.width}x{args.height} @ {args.fps} fps, {args.backlog:g}s of frames in flight, "
+          f"median of {args.trials}:")
+    print(f"  resume: {resume_ms:7.1f} ms to caught up, {resume_bytes / 1024:7.0f} KB, "
+          f"{sum(trial[2] for trial in resumes)} keyframes in all trials")
+    print(f"  join:   {join_ms:7.1f} ms to first frame, {join_bytes / 1024:7.0f} KB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
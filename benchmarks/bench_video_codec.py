@@ -0,0 +1,125 @@
+"""Full-motion content: the tile codecs against H.264 video regions.
+
+The synthetic video scene changes every pixel of every frame, the worst case
+for intra-only tiles. First the same frames go through a DeltaEncoder with
+video off and with it on, past the frames it takes to switch, reporting
+bytes, encode and decode time per frame and PSNR against the source. Then an
+in-process host streams the scene to a HeadlessClient both ways, reporting
+what the client got and the CPU it took.
+
+Usage: python benchmarks/bench_video_codec.py [--width 1920] [--height 1080] [--fps 30] [--seconds 5]
+"""
+import sys
+import os
+import time
+import argparse
+
+import numpy as np
+
+# Add parent dir for common modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from client.headless import HeadlessClient, decode_tile
+from host.host import RemoteHost, InputSink
+from host.synthetic import VideoSource
+from common.imaging import DeltaEncoder, TILE_VIDEO, VIDEO_AFTER
+from common.video import VideoDecoder, video_available
+
+
+def psnr(decoded, frame):
+    """PSNR in dB of an RGB canvas against the BGRX frame it shows"""
+    error = np.mean((decoded.astype(np.float32) - frame[..., 2::-1]) ** 2)
+    return 10 * np.log10(255 ** 2 / max(error, 1e-10))
+
+
+def codec_trial(frames, video, args):
+    """Encode and decode frames; returns per-frame medians of (bytes, encode ms, decode ms) and mean PSNR"""
+    encoder = DeltaEncoder(args.quality, workers=args.encode_workers, video=video)
+    decoder = VideoDecoder() if video else None
+    canvas = np.zeros(frames[0].shape[:2] + (3,), dtype=np.uint8)
+    sizes, encode_ms, decode_ms, quality = [], [], [], []
+    for index, frame in enumerate(frames):
+        start = time.perf_counter()
+        _, _, tiles = encoder.encode(frame, video=video)
+        encoded = time.perf_counter()
+        for x, y, w, h, codec, data in tiles:
+            if codec == TILE_VIDEO:
+                pixels = decoder.decode(data, w, h)
+            else:
+                _, _, pixels, _ = decode_tile((x, y, w, h, codec, data))
+            canvas[y:y + h, x:x + w] = pixels
+        decoded = time.perf_counter()
+        # Leave out the first keyframe and, with video, the frames before it switches
+        if index > VIDEO_AFTER + 1:
+            sizes.append(sum(len(tile[5]) for tile in tiles))
+            encode_ms.append((encoded - start) * 1000)
+            decode_ms.append((decoded - encoded) * 1000)
+            quality.append(psnr(canvas, frame))
+    if video and not encoder.video_active:
+        raise RuntimeError("the encoder never switched to video")
+    encoder.close()
+    return np.median(sizes), np.median(encode_ms), np.median(decode_ms), np.mean(quality)
+
+
+def stream_trial(video, args, port):
+    """Stream the scene to a headless client; returns (fps, KB/frame, Mbit/s, p50 latency ms, encode %, decode %)"""
+    host = RemoteHost(host='127.0.0.1', port=port, quality=args.quality, frame_rate=args.fps, adaptive=False,
+                      encode_workers=args.encode_workers, video=video,
+                      source=VideoSource(args.width, args.height), input_sink=InputSink())
+    if not host.start():
+        raise RuntimeError("could not start the host")
+    client = HeadlessClient(tile_cache_mb=0, video=video)
+    try:
+        if not client.connect('127.0.0.1', port):
+            raise RuntimeError("could not connect")
+        # Past the keyframe and the switch to video
+        client.run(args.warmup)
+        warm_frames, warm_encode, warm_decode = client.frames, host.stage_cpu['encode'], client.decode_cpu
+        start = time.time()
+        client.run(args.seconds)
+        elapsed = time.time() - start
+    finally:
+        client.close()
+        host.stop()
+
+    frames = client.frames - warm_frames
+    sent = sum(client.frame_bytes[warm_frames:])
+    return (frames / elapsed, sent / max(frames, 1) / 1024, sent * 8 / elapsed / 1e6,
+            np.percentile(client.latencies[warm_frames:], 50) * 1000,
+            (host.stage_cpu['encode'] - warm_encode) * 100 / elapsed,
+            (client.decode_cpu - warm_decode) * 100 / elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Tile codecs against video regions on full-motion content')
+    parser.add_argument('--width', type=int, default=1920)
+    parser.add_argument('--height', type=int, default=1080)
+    parser.add_argument('--fps', type=int, default=30)
+    parser.add_argument('--quality', type=int, default=70)
+    parser.add_argument('--encode-workers', type=int, default=4)
+    parser.add_argument('--frames', type=int, default=60, help='Frames encoded in the codec comparison')
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--warmup', type=float, default=1.5)
+    parser.add_argument('--port', type=int, default=19995)
+    args = parser.parse_args()
+    if not video_available():
+        print("PyAV is not installed; there is no video codec to compare")
+        return 1
+
+    source = VideoSource(args.width, args.height)
+    frames = [source.render(index) for index in range(args.frames)]
+    print(f"video scene {args.width}x{args.height}, quality {args.quality}")
+    print(f"{'codec':<8} {'KB/frame':>9} {'encode ms':>10} {'decode ms':>10} {'PSNR dB':>8}")
+    for name, video in (('tiles', False), ('h264', True)):
+        size, encode_ms, decode_ms, quality = codec_trial(frames, video, args)
+        print(f"{name:<8} {size / 1024:>9.1f} {encode_ms:>10.1f} {decode_ms:>10.1f} {quality:>8.2f}")
+
+    print(f"\nstreamed at up to {args.fps} fps for {args.seconds:g}s:")
+    print(f"{'codec':<8} {'fps':>6} {'KB/frame':>9} {'Mbit/s':>7} {'p50 ms':>7} {'encode %':>9} {'decode %':>9}")
+    for index, (name, video) in enumerate((('tiles', False), ('h264', True))):
+        fps, size, rate, latency, encode_cpu, decode_cpu = stream_trial(video, args, args.port + index)
+        print(f"{name:<8} {fps:>6.1f} {size:>9.1f} {rate:>7.2f} {latency:>7.1f} {encode_cpu:>9.1f} {decode_cpu:>9.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
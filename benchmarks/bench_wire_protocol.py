@@ -0,0 +1,96 @@
+"""Messages/sec and bytes-on-wire: binary framing + ChaCha20-Poly1305 versus pickle + Fernet.
+
+Each round trip serializes, encrypts, decrypts and deserializes one message,
+which is everything NetworkManager does apart from the socket calls.
+
+Usage: python benchmarks/bench_wire_protocol.py [--seconds 1.0]
+"""
+import sys
+import os
+import time
+import pickle
+import struct
+import argparse
+
+from cryptography.fernet import Fernet
+
+# Add parent dir for common modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.encryption import SessionCipher, generate_key
+from common.network import (
+    HEADER, MESSAGE_CHANNELS, CHANNEL_CONTROL, ChunkAssembler, encode_message, split_payload, seal_message,
+    parse_header, MSG_MOUSE_MOVE, MSG_KEY_PRESS, MSG_FRAME_DELTA
+)
+from common.imaging import TILE_JPEG
+
+SAMPLES = {
+    'mouse move': {'type': MSG_MOUSE_MOVE, 'x': 0.25, 'y': 0.75},
+    'key press': {'type': MSG_KEY_PRESS, 'key': 'a'},
+    '4 KB delta': {'type': MSG_FRAME_DELTA, 'seq': 1, 'width': 2560, 'height': 1440, 'keyframe': False, 'captured': 0.0,
+                   'cache_reset': False, 'copies': [], 'tiles': [(64, 128, 64, 64, TILE_JPEG, os.urandom(4096))]},
+    '500 KB keyframe': {'type': MSG_FRAME_DELTA, 'seq': 1, 'width': 2560, 'height': 1440, 'keyframe': True, 'captured': 0.0,
+                        'cache_reset': False, 'copies': [],
+                        'tiles': [(0, y * 64, 2560, 64, TILE_JPEG, os.urandom(500 * 1024 // 23)) for y in range(23)]},
+}
+
+
+class LegacyCodec:
+    """The previous pickle + Fernet path"""
+
+    def __init__(self):
+        self.cipher = Fernet(Fernet.generate_key())
+
+    def round_trip(self, data):
+        encrypted = self.cipher.encrypt(pickle.dumps(data))
+        wire = struct.pack("!I", len(encrypted)) + encrypted
+        return pickle.loads(self.cipher.decrypt(wire[4:])), len(wire)
+
+
+class BinaryCodec:
+    """Current NetworkManager path"""
+
+    def __init__(self):
+        key = generate_key()
+        self.sender = SessionCipher(key, is_server=True)
+        self.receiver = SessionCipher(key, is_server=False)
+        self.assembler = ChunkAssembler()
+
+    def round_trip(self, data):
+        msg_type, payload = encode_message(data)
+        channel = MESSAGE_CHANNELS.get(msg_type, CHANNEL_CONTROL)
+        chunks = split_payload(payload)
+        message, wire_size = None, 0
+        for index, chunk in enumerate(chunks):
+            wire = seal_message(self.sender, msg_type, chunk, channel, index < len(chunks) - 1)
+            header = wire[:HEADER.size]
+            msg_type, channel, more, _ = parse_header(header)
+            message = self.assembler.add(msg_type, channel, more, self.receiver.decrypt(wire[HEADER.size:], header))
+            wire_size += len(wire)
+        return message, wire_size
+
+
+def measure(codec, data, seconds):
+    count = 0
+    wire_size = 0
+    deadline = time.perf_counter() + seconds
+    start = time.perf_counter()
+    while time.perf_counter() < deadline:
+        _, wire_size = codec.round_trip(data)
+        count += 1
+    return count / (time.perf_counter() - start), wire_size
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Wire protocol microbenchmark')
+    parser.add_argument('--seconds', type=float, default=1.0, help='Time spent per sample and codec')
+    args = parser.parse_args()
+
+    print(f"{'message':<16} {'legacy msg/s':>13} {'binary msg/s':>13} {'legacy bytes':>13} {'binary bytes':>13}")
+    for name, data in SAMPLES.items():
+        legacy_rate, legacy_size = measure(LegacyCodec(), data, args.seconds)
+        binary_rate, binary_size = measure(BinaryCodec(), data, args.seconds)
+        print(f"{name:<16} {legacy_rate:>13.0f} {binary_rate:>13.0f} {legacy_size:>13} {binary_size:>13}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,59 +1,421 @@
 import sys
 import os
+import math
+import select
 import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 import lz4.frame
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
-    QPushButton, QLabel, QLineEdit, QMessageBox, QFrame
+    QPushButton, QLabel, QLineEdit, QMessageBox, QFrame, QOpenGLWidget, QFileDialog, QComboBox
 )
-from PyQt5.QtGui import QPixmap, QImage, QPainter
-from PyQt5.QtCore import Qt, QThread, pyqtSignal
+from PyQt5.QtGui import QPixmap, QImage, QPainter, QPen, QColor, QOpenGLContext
+from PyQt5.QtCore import Qt, QThread, QTimer, QObject, QPoint, QRect, QRectF, pyqtSignal
 
 # Add parent dir for common modules
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from common.network import (
     NetworkManager,
-    MSG_FRAME, MSG_MOUSE_MOVE, MSG_MOUSE_CLICK,
-    MSG_KEY_PRESS, MSG_KEY_RELEASE
+    MSG_FRAME, MSG_FRAME_DELTA, MSG_KEYFRAME_REQUEST, MSG_FRAME_ACK,
+    MSG_MOUSE_MOVE, MSG_MOUSE_CLICK, MSG_KEY_PRESS, MSG_KEY_RELEASE, MSG_INPUT_BATCH,
+    MSG_CURSOR, MSG_CURSOR_SHAPE, MSG_VIEWPORT, MSG_TILE_CACHE, MSG_FILE_ACK, MSG_MONITORS, MSG_MONITOR_SELECT,
+    MSG_VIDEO
 )
+from common.logging_utils import metrics, Timer, StatsLogger, start_metrics_server, DEFAULT_STATS_INTERVAL
+from common.imaging import TILE_JPEG, TILE_CACHED, TILE_STORE, TILE_VIDEO, SEQUENTIAL_CODECS, decode_lossless
+from common.tile_cache import TileCache, DEFAULT_TILE_CACHE_MB
+from common.file_transfer import FileSender
+from common.video import VideoDecoder, VIDEO_CODEC, video_available
 
 LOGO_PATH = os.path.join(os.path.dirname(__file__), "logo.png")
+MOVE_COALESCE_MS = 8  # Mouse moves within this window collapse into the latest one
+SHARE_BORDER_WIDTH = 5  # Lime frame marking the remote screen, drawn here instead of by the host
+DECODE_WORKERS = min(4, os.cpu_count() or 1)
+OVERLAY_REFRESH_MS = 1000
+CURSOR_PREDICT_MS = 250  # After a local move, the pointer follows the local mouse for this long
+RECEIVE_POLL_SECONDS = 0.1  # How soon an idle receiver notices a resize or stop()
+VIEWPORT_DEBOUNCE_MS = 100  # A window being dragged to size reports it once it settles
+ZOOM_STEP = 1.25  # Per Ctrl+wheel notch
+MAX_ZOOM = 16
+
+TILE_DECODE_TIME = metrics.histogram('client_tile_decode_seconds', 'Decompressing and decoding one tile run')
+VIDEO_DECODE_TIME = metrics.histogram('client_video_decode_seconds', 'Decoding one frame of a video region')
+APPLY_TIME = metrics.histogram('client_apply_seconds', 'Decoding and compositing one frame')
+LATENCY = metrics.histogram('client_frame_latency_seconds',
+                            'Host capture to frame composited; only meaningful with synchronized clocks')
+PRESENT_TIME = metrics.histogram('client_present_seconds', 'Scaling changed areas into the display buffer')
+PAINT_TIME = metrics.histogram('client_paint_seconds', 'RemoteView.paintEvent')
+FRAMES_APPLIED = metrics.counter('client_frames_total', 'Frames applied to the canvas')
+FRAMES_SKIPPED = metrics.counter('client_frames_skipped_total',
+                                 'Frames replaced by a newer one before the view painted them')
+CACHE_HITS = metrics.counter('client_tile_cache_hits_total', 'Tiles drawn from the tile cache')
+CACHE_MISSES = metrics.counter('client_tile_cache_misses_total',
+                               'Cached tiles the host referred to that were not there; each costs a keyframe')
+
+
+def decode_tile(tile):
+    x, y, w, h, codec, data = tile
+    with Timer(TILE_DECODE_TIME):
+        if codec == TILE_JPEG:
+            return x, y, QImage.fromData(data)
+        pixels = decode_lossless(codec, data, w, h)
+        # copy() detaches the image from the array it was built on
+        return x, y, QImage(pixels.tobytes(), w, h, w * 4, QImage.Format_RGB32).copy()
+
+
+def decode_cursor_shape(data):
+    """MSG_CURSOR_SHAPE -> (shape id, QImage, hot_x, hot_y)"""
+    pixels = lz4.frame.decompress(data['pixels'])
+    image = QImage(pixels, data['width'], data['height'], data['width'] * 4, QImage.Format_ARGB32)
+    # copy() detaches the image from the buffer it was built on
+    return data['shape'], image.copy(), data['hot_x'], data['hot_y']
+
+
+def delta_rect(data):
+    """Bounding QRect of everything a delta frame changes"""
+    rect = QRect()
+    for src_x, src_y, x, y, w, h in data['copies']:
+        rect = rect.united(QRect(x, y, w, h))
+    for x, y, w, h, _, _ in data['tiles']:
+        rect = rect.united(QRect(x, y, w, h))
+    return rect
+
+
+def scale_rect(rect, sx, sy):
+    """Smallest integer QRect covering rect scaled by (sx, sy)"""
+    left, top = math.floor(rect.x() * sx), math.floor(rect.y() * sy)
+    right = math.ceil((rect.x() + rect.width()) * sx)
+    bottom = math.ceil((rect.y() + rect.height()) * sy)
+    return QRect(left, top, right - left, bottom - top)
+
+
+class FrameBuffer:
+    """Double-buffered display image shared by the receiver thread and the view
+
+    The receiver scales what changed in its canvas into the back image and
+    swaps it to the front; the view paints from the front. Frames swapped in
+    before the view got round to painting are never drawn on their own, but
+    their dirty areas add up so the next paint covers them. The lock is only
+    held to swap and to paint, never while decoding or scaling.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.front = None
+        self.back = None
+        self.back_stale = QRect()  # Area of back that lags behind front
+        self.dirty = QRect()  # Area of front the view has not been told about
+        self.target_size = None  # Size the view wants; None keeps the remote resolution
+
+    def set_target_size(self, size):
+        with self.lock:
+            self.target_size = size
+
+    def needs_rescale(self, canvas):
+        target = self.target_size or canvas.size()
+        return self.front is not None and self.front.size() != target
+
+    def present(self, canvas, rect):
+        """Bring the display up to date with rect of canvas; receiver thread only
+
+        Returns True if the view has to be told, False if it still has an
+        earlier frame to paint and will pick this one up with it.
+        """
+        with Timer(PRESENT_TIME):
+            size = self.target_size or canvas.size()
+            if self.back is None or self.back.size() != size or self.front.size() != size:
+                self.back = QImage(size, QImage.Format_RGB32)
+                self.back_stale = QRect()
+                rect = canvas.rect()
+            target = rect if size == canvas.size() else \
+                scale_rect(rect, size.width() / canvas.width(), size.height() / canvas.height())
+            target = target.intersected(self.back.rect())
+
+            painter = QPainter(self.back)
+            try:
+                painter.setCompositionMode(QPainter.CompositionMode_Source)
+                if not self.back_stale.isEmpty():
+                    # Catch up with the previous frame; the view only ever reads front
+                    painter.drawImage(self.back_stale.topLeft(), self.front, self.back_stale)
+                if size == canvas.size():
+                    painter.drawImage(target.topLeft(), canvas, target)
+                else:
+                    # Map the whole-pixel target back to the exact source area so
+                    # neighbouring updates sample the canvas the same way
+                    sx, sy = canvas.width() / size.width(), canvas.height() / size.height()
+                    source = QRectF(target.x() * sx, target.y() * sy, target.width() * sx, target.height() * sy)
+                    painter.setRenderHint(QPainter.SmoothPixmapTransform)
+                    painter.drawImage(QRectF(target), canvas, source)
+            finally:
+                painter.end()
+
+            with self.lock:
+                self.front, self.back = self.back, self.front
+                self.back_stale = target
+                notify = self.dirty.isEmpty()
+                self.dirty = self.dirty.united(target)
+        if not notify:
+            FRAMES_SKIPPED.inc()
+        return notify
+
+    def take_dirty(self):
+        with self.lock:
+            dirty, self.dirty = self.dirty, QRect()
+            return dirty
 
 
 class FrameReceiver(QThread):
-    frame_received = pyqtSignal(QImage)
+    frame_ready = pyqtSignal()
+    cursor_shape_received = pyqtSignal(object)
+    cursor_moved = pyqtSignal(object)
+    monitors_received = pyqtSignal(object)
     error_occurred = pyqtSignal(str)
 
-    def __init__(self, network):
+    def __init__(self, network, frame_buffer=None, tile_cache_mb=DEFAULT_TILE_CACHE_MB):
         super().__init__()
         self.network = network
         self.running = False
+        # Persistent canvas patched by delta frames, presented through frame_buffer
+        self.canvas = None
+        self.awaiting_keyframe = False
+        self.last_seq = 0  # Last frame applied, for resuming the session where it broke off
+        self.frame_buffer = frame_buffer or FrameBuffer()
+        # Tiles are decoded in parallel; QImage decoding is reentrant
+        self.decode_pool = ThreadPoolExecutor(DECODE_WORKERS, thread_name_prefix="decode")
+        # Tiles seen before, so the host can send a hash instead of the pixels
+        self.tile_cache = TileCache(tile_cache_mb * 1024 * 1024) if tile_cache_mb else None
+        # Areas in full motion arrive as H.264 when PyAV is installed
+        self.video = VideoDecoder() if video_available() else None
+        # Uploads in progress, by transfer id
+        self.file_senders = {}
+
+    def send_file(self, path):
+        """Upload path to the host in the background; progress arrives as MSG_FILE_ACK"""
+        sender = FileSender(self.network, path, on_done=self.file_sent)
+        self.file_senders[sender.id] = sender
+        sender.start()
+
+    def file_sent(self, sender):
+        """Forget a sender that stopped, unless the same file is being sent again"""
+        if self.file_senders.get(sender.id) is sender:
+            del self.file_senders[sender.id]
 
     def run(self):
         self.running = True
+        if self.tile_cache is not None:
+            self.network.send_data({'type': MSG_TILE_CACHE, 'budget': self.tile_cache.budget})
+        if self.video is not None:
+            self.network.send_data({'type': MSG_VIDEO, 'codec': VIDEO_CODEC})
         while self.running:
             try:
-                data = self.network.receive_data()
-                if not data or data.get('type') != MSG_FRAME:
+                if not self.wait_readable(RECEIVE_POLL_SECONDS):
+                    # Nothing new from the host; the view may still have been resized
+                    if self.canvas is not None and self.frame_buffer.needs_rescale(self.canvas):
+                        self.present(self.canvas.rect())
                     continue
-
-                compressed = data.get('data')
-                jpeg_bytes = lz4.frame.decompress(compressed)
-                q_img = QImage.fromData(jpeg_bytes)
-                if q_img.isNull():
-                    self.error_occurred.emit("Invalid image data")
+                data = self.network.receive_data()
+                if data is None:
+                    # Carry on over a new connection, keeping the canvas
+                    seq = 0 if self.awaiting_keyframe or self.canvas is None else self.last_seq
+                    resumed = self.network.resume(seq)
+                    for sender in list(self.file_senders.values()):
+                        if resumed:
+                            sender.on_resume()
+                        else:
+                            sender.cancel()
+                    if not resumed:
+                        self.error_occurred.emit("Connection to the host lost")
+                        break
                     continue
-
-                self.frame_received.emit(q_img)
+                self.handle(data)
             except Exception as e:
                 self.error_occurred.emit(f"Receive error: {e}")
                 time.sleep(1)
 
+    def handle(self, data):
+        """Apply one message from the host"""
+        t = data.get('type')
+        if t == MSG_FRAME:
+            rect = self.decode_full(data)
+        elif t == MSG_FRAME_DELTA:
+            rect = self.apply_delta(data)
+        elif t == MSG_CURSOR_SHAPE:
+            self.cursor_shape_received.emit(decode_cursor_shape(data))
+            return
+        elif t == MSG_CURSOR:
+            self.cursor_moved.emit((data['x'], data['y'], data['shape']))
+            return
+        elif t == MSG_FILE_ACK:
+            sender = self.file_senders.get(data['transfer'])
+            if sender is not None:
+                sender.on_ack(data)
+            return
+        elif t == MSG_MONITORS:
+            self.monitors_received.emit((data['monitors'], data['monitor']))
+            return
+        else:
+            return
+
+        if rect is not None:
+            self.present(rect)
+
+    def wait_readable(self, timeout):
+        sock = self.network.socket
+        # TLS may already hold decrypted bytes that select() cannot see
+        if hasattr(sock, 'pending') and sock.pending():
+            return True
+        return bool(select.select([sock], [], [], timeout)[0])
+
+    def present(self, rect):
+        if self.frame_buffer.present(self.canvas, rect):
+            self.frame_ready.emit()
+
+    def decode_full(self, data):
+        compressed = data.get('data')
+        jpeg_bytes = lz4.frame.decompress(compressed)
+        q_img = QImage.fromData(jpeg_bytes)
+        if q_img.isNull():
+            self.error_occurred.emit("Invalid image data")
+            return None
+        self.canvas = q_img.convertToFormat(QImage.Format_RGB32)
+        return self.canvas.rect()
+
+    def apply_delta(self, data):
+        """Patch the canvas with a delta frame; returns the changed QRect or None"""
+        with Timer(APPLY_TIME):
+            rect = self.compose_delta(data)
+        if rect is not None:
+            FRAMES_APPLIED.inc()
+            LATENCY.observe(time.time() - data['captured'])
+        return rect
+
+    def request_keyframe(self):
+        # Once per wait; everything up to the keyframe is ignored anyway
+        if not self.awaiting_keyframe:
+            self.awaiting_keyframe = True
+            self.network.send_data({'type': MSG_KEYFRAME_REQUEST})
+
+    def compose_delta(self, data):
+        width, height = data['width'], data['height']
+        if data['cache_reset'] and self.tile_cache is not None:
+            self.tile_cache.clear()
+        if data['keyframe']:
+            self.canvas = QImage(width, height, QImage.Format_RGB32)
+            self.awaiting_keyframe = False
+        elif self.awaiting_keyframe or self.canvas is None or \
+                (self.canvas.width(), self.canvas.height()) != (width, height):
+            # Tiles are useless without a base image; ask for a full refresh
+            self.request_keyframe()
+            return None
+
+        # Tiles decode in the pool while the copies are applied; cache
+        # operations run in order with them, on the canvas as it is then
+        decoded = self.decode_pool.map(decode_tile,
+                                       [tile for tile in data['tiles'] if tile[4] not in SEQUENTIAL_CODECS])
+        painter = QPainter(self.canvas)
+        try:
+            for src_x, src_y, x, y, w, h in data['copies']:
+                # copy() takes the source out first, so overlapping moves are safe
+                painter.drawImage(x, y, self.canvas.copy(src_x, src_y, w, h))
+            for x, y, w, h, codec, key in data['tiles']:
+                if codec == TILE_STORE:
+                    if self.tile_cache is not None:
+                        self.tile_cache.put(bytes(key), self.canvas.copy(x, y, w, h), w * h * 4)
+                    continue
+                if codec == TILE_CACHED:
+                    tile = self.tile_cache.get(bytes(key)) if self.tile_cache is not None else None
+                    if tile is None:
+                        CACHE_MISSES.inc()
+                        self.request_keyframe()
+                        return None
+                    CACHE_HITS.inc()
+                elif codec == TILE_VIDEO:
+                    # Each access unit builds on the last, so they are decoded here, in order
+                    tile = self.decode_video(key, w, h)
+                    if tile is None:
+                        self.request_keyframe()
+                        return None
+                else:
+                    _, _, tile = next(decoded)
+                if tile.isNull():
+                    self.error_occurred.emit("Invalid tile data")
+                    continue
+                painter.drawImage(x, y, tile)
+        finally:
+            painter.end()
+
+        # Acknowledge so the host can measure round trips and adapt its bitrate
+        self.network.send_data({'type': MSG_FRAME_ACK, 'seq': data['seq']})
+        self.last_seq = data['seq']
+        return self.canvas.rect() if data['keyframe'] else delta_rect(data)
+
+    def decode_video(self, data, w, h):
+        """QImage of a video region's next frame, or None if it cannot be decoded"""
+        if self.video is None:
+            return None
+        with Timer(VIDEO_DECODE_TIME):
+            pixels = self.video.decode(data, w, h)
+            if pixels is None:
+                return None
+            return QImage(pixels.tobytes(), w, h, w * 3, QImage.Format_RGB888).copy()
+
     def stop(self):
         self.running = False
         self.wait()
+        for sender in list(self.file_senders.values()):
+            sender.cancel()
+        self.decode_pool.shutdown(wait=False)
+
+
+class InputBatcher(QObject):
+    """Collects input events on the UI thread and sends them in batches
+
+    Mouse moves are held for a short window and only the latest position is
+    sent. Clicks and keys go out on the next event loop turn, together with
+    anything else queued by then, so a burst becomes a single message.
+    """
+
+    def __init__(self, network):
+        super().__init__()
+        self.network = network
+        self.pending = []
+        self.pending_move = None
+
+        self.move_timer = QTimer(self)
+        self.move_timer.setSingleShot(True)
+        self.move_timer.timeout.connect(self.flush)
+        self.flush_timer = QTimer(self)
+        self.flush_timer.setSingleShot(True)
+        self.flush_timer.setInterval(0)
+        self.flush_timer.timeout.connect(self.flush)
+
+    def move(self, x, y):
+        self.pending_move = {'type': MSG_MOUSE_MOVE, 'x': x, 'y': y}
+        if not self.move_timer.isActive():
+            self.move_timer.start(MOVE_COALESCE_MS)
+
+    def send(self, event):
+        # The pointer must reach its latest position before a click or key lands
+        if self.pending_move is not None:
+            self.pending.append(self.pending_move)
+            self.pending_move = None
+        self.pending.append(event)
+        self.flush_timer.start()
+
+    def flush(self):
+        events = self.pending
+        if self.pending_move is not None:
+            events.append(self.pending_move)
+        self.pending, self.pending_move = [], None
+        self.move_timer.stop()
+        self.flush_timer.stop()
+
+        if len(events) == 1:
+            self.network.send_data(events[0])
+        elif events:
+            self.network.send_data({'type': MSG_INPUT_BATCH, 'events': events})
 
 
 class ConnectionWindow(QWidget):
@@ -90,35 +452,199 @@ class ConnectionWindow(QWidget):
         self.connected.emit(self.host_input.text(), port)
 
 
-class RemoteView(QFrame):
+class StatsOverlay(QLabel):
+    """Per-stage timings and counters for the last second, drawn over the remote screen"""
+
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.setStyleSheet("QLabel { background-color: rgba(0, 0, 0, 170); color: white; "
+                           "font-family: monospace; padding: 6px; border: none; }")
+        self.setAttribute(Qt.WA_TransparentForMouseEvents)
+        self.move(SHARE_BORDER_WIDTH * 2, SHARE_BORDER_WIDTH * 2)
+        self.last = None
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.refresh)
+        self.hide()
+
+    def set_enabled(self, enabled):
+        if enabled:
+            self.last = metrics.snapshot()
+            self.setText("Collecting...")
+            self.adjustSize()
+            self.timer.start(OVERLAY_REFRESH_MS)
+            self.show()
+            self.raise_()
+        else:
+            self.timer.stop()
+            self.hide()
+
+    def refresh(self):
+        lines, self.last = metrics.summary(self.last)
+        self.setText('\n'.join(lines) or "No activity")
+        self.adjustSize()
+
+
+def opengl_available():
+    """True if an OpenGL context can be created; it cannot on the offscreen platform"""
+    return QOpenGLContext().create()
+
+
+class RemoteViewMixin:
+    """The remote screen with the host's pointer, forwarding input to the host
+
+    Mixed into a QFrame, where frames are pre-scaled by the receiver and
+    only changed areas are repainted, or into a QOpenGLWidget, where frames
+    stay at the remote resolution and the GPU scales them.
+    """
+
+    prescale = True
+
     def __init__(self, network):
         super().__init__()
         self.network = network
-        self.setStyleSheet("QFrame { border: 2px solid green; }")
-        self.remote_pixmap = None
+        self.frame_buffer = FrameBuffer()
+        self.has_frame = False
+        self.input = InputBatcher(network)
+        self.stats_overlay = StatsOverlay(self)
         self.setFocusPolicy(Qt.StrongFocus)
         self.setMouseTracking(True)
 
-    def update_frame(self, q_img):
-        self.remote_pixmap = QPixmap.fromImage(q_img)
-        self.update()
+        # The host's pointer is drawn here rather than baked into frames
+        self.cursor_shapes = {}  # shape id -> (QPixmap, hot_x, hot_y)
+        self.remote_cursor = None  # (x, y, shape id) as last reported by the host
+        self.local_pointer = None
+        self.local_moved_at = 0.0
+        self.cursor_rect = QRect()
+        self.pointer_hidden = False
+        self.predict_timer = QTimer(self)
+        self.predict_timer.setSingleShot(True)
+        self.predict_timer.timeout.connect(self.update_cursor)
+
+        # The host captures just the zoomed region, scaled to our size
+        self.zoom = QRectF(0, 0, 1, 1)  # As fractions of the remote screen
+        self.viewport_timer = QTimer(self)
+        self.viewport_timer.setSingleShot(True)
+        self.viewport_timer.setInterval(VIEWPORT_DEBOUNCE_MS)
+        self.viewport_timer.timeout.connect(self.send_viewport)
+
+    def resizeEvent(self, ev):
+        super().resizeEvent(ev)
+        self.viewport_timer.start()
+        if self.prescale:
+            # The receiver rescales on its thread; until then paint stretches the old front
+            self.frame_buffer.set_target_size(self.size())
+
+    def send_viewport(self):
+        zoom = self.zoom
+        self.network.send_data({
+            'type': MSG_VIEWPORT, 'width': self.width(), 'height': self.height(),
+            'x': zoom.x(), 'y': zoom.y(), 'w': zoom.width(), 'h': zoom.height()
+        })
+
+    def wheelEvent(self, e):
+        # Ctrl+wheel zooms in and out around the pointer
+        if not e.modifiers() & Qt.ControlModifier:
+            return super().wheelEvent(e)
+        factor = ZOOM_STEP if e.angleDelta().y() > 0 else 1 / ZOOM_STEP
+        size = min(max(self.zoom.width() / factor, 1 / MAX_ZOOM), 1.0)
+        px, py = e.x() / self.width(), e.y() / self.height()
+        # Keep the remote point under the pointer where it is
+        x = self.zoom.x() + px * self.zoom.width() - px * size
+        y = self.zoom.y() + py * self.zoom.height() - py * size
+        self.zoom = QRectF(min(max(x, 0.0), 1 - size), min(max(y, 0.0), 1 - size), size, size)
+        self.viewport_timer.start()
+
+    def update_frame(self):
+        """Repaint what the receiver changed since the last call"""
+        dirty = self.frame_buffer.take_dirty()
+        self.has_frame = True
+        front = self.frame_buffer.front
+        if front is None or dirty.isEmpty():
+            return
+        if front.size() == self.size():
+            self.update(dirty)
+        else:
+            self.update(scale_rect(dirty, self.width() / front.width(), self.height() / front.height()))
 
     def paintEvent(self, ev):
-        super().paintEvent(ev)
-        if self.remote_pixmap:
-            painter = QPainter(self)
-            painter.drawPixmap(self.rect(), self.remote_pixmap)
+        with Timer(PAINT_TIME):
+            super().paintEvent(ev)
+            if self.has_frame:
+                painter = QPainter(self)
+                with self.frame_buffer.lock:
+                    front = self.frame_buffer.front
+                    if front.size() == self.size():
+                        painter.drawImage(ev.rect().topLeft(), front, ev.rect())
+                    else:
+                        painter.setRenderHint(QPainter.SmoothPixmapTransform)
+                        painter.drawImage(QRectF(self.rect()), front, QRectF(front.rect()))
+
+                # Draw 5px green border
+                half = SHARE_BORDER_WIDTH // 2
+                painter.setPen(QPen(QColor("lime"), SHARE_BORDER_WIDTH))
+                painter.drawRect(self.rect().adjusted(half, half, -half - 1, -half - 1))
+
+                cursor = self.cursor_geometry()
+                if cursor:
+                    painter.drawPixmap(cursor[1], cursor[0])
+
+    def add_cursor_shape(self, shape):
+        shape_id, image, hot_x, hot_y = shape
+        self.cursor_shapes[shape_id] = (QPixmap.fromImage(image), hot_x, hot_y)
+        self.update_cursor()
+
+    def move_cursor(self, cursor):
+        self.remote_cursor = cursor
+        self.update_cursor()
+
+    def cursor_geometry(self):
+        """(pixmap, top-left QPoint) of the pointer to draw, or None"""
+        if self.remote_cursor is None:
+            return None
+        x, y, shape = self.remote_cursor
+        if shape not in self.cursor_shapes:
+            # Hidden, or the shape has not arrived yet
+            return None
+        pixmap, hot_x, hot_y = self.cursor_shapes[shape]
+
+        # Our own moves show up immediately instead of after a round trip
+        if self.local_pointer is not None and time.time() - self.local_moved_at < CURSOR_PREDICT_MS / 1000:
+            position = self.local_pointer
+        else:
+            position = QPoint(int(x * self.width()), int(y * self.height()))
+        return pixmap, position - QPoint(hot_x, hot_y)
+
+    def update_cursor(self):
+        # The host draws the pointer now, so ours would show up twice
+        hidden = self.remote_cursor is not None
+        if hidden != self.pointer_hidden:
+            self.setCursor(Qt.BlankCursor if hidden else Qt.ArrowCursor)
+            self.pointer_hidden = hidden
+
+        # Repaint only where the pointer was and where it is now
+        cursor = self.cursor_geometry()
+        rect = QRect(cursor[1], cursor[0].size()) if cursor else QRect()
+        self.update(self.cursor_rect.united(rect))
+        self.cursor_rect = rect
 
     def mouseMoveEvent(self, e):
-        if not self.remote_pixmap: return
+        self.local_pointer = e.pos()
+        self.local_moved_at = time.time()
+        self.predict_timer.start(CURSOR_PREDICT_MS)
+        self.update_cursor()
+        if not self.has_frame: return
         x, y = e.x() / self.width(), e.y() / self.height()
-        self.network.send_data({'type': MSG_MOUSE_MOVE, 'x': x, 'y': y})
+        self.input.move(x, y)
+
+    def leaveEvent(self, e):
+        self.local_pointer = None
+        self.update_cursor()
 
     def mousePressEvent(self, e):
-        if not self.remote_pixmap: return
+        if not self.has_frame: return
         x, y = e.x() / self.width(), e.y() / self.height()
         btn = 'left' if e.button() == Qt.LeftButton else 'right'
-        self.network.send_data({
+        self.input.send({
             'type': MSG_MOUSE_CLICK, 'x': x, 'y': y,
             'button': btn, 'clicks': 1
         })
@@ -126,18 +652,32 @@ class RemoteView(QFrame):
     def keyPressEvent(self, e):
         k = e.text().lower()
         if k:
-            self.network.send_data({'type': MSG_KEY_PRESS, 'key': k})
+            self.input.send({'type': MSG_KEY_PRESS, 'key': k})
 
     def keyReleaseEvent(self, e):
         k = e.text().lower()
         if k:
-            self.network.send_data({'type': MSG_KEY_RELEASE, 'key': k})
+            self.input.send({'type': MSG_KEY_RELEASE, 'key': k})
 
 
-class ScreenWindow(QMainWindow):
+class RemoteView(RemoteViewMixin, QFrame):
     def __init__(self, network):
+        super().__init__(network)
+        self.setStyleSheet("QFrame { border: 2px solid green; }")
+
+
+class GLRemoteView(RemoteViewMixin, QOpenGLWidget):
+    # Textures are scaled when drawn, so there is nothing to gain from pre-scaling
+    prescale = False
+
+
+class ScreenWindow(QMainWindow):
+    file_chosen = pyqtSignal(str)
+
+    def __init__(self, network, gpu=False):
         super().__init__()
         self.network = network
+        self.gpu = gpu
         self.setWindowTitle("Remote Control Session")
         self._build_ui()
 
@@ -158,6 +698,19 @@ class ScreenWindow(QMainWindow):
         h.addWidget(logo)
         h.addStretch()
 
+        # Monitor switcher, shown once the host reports more than one monitor
+        self.monitor_box = QComboBox()
+        self.monitor_box.setVisible(False)
+        self.monitor_box.activated.connect(self.select_monitor)
+        h.addWidget(self.monitor_box)
+
+        # Stats overlay toggle
+        self.stats_btn = QPushButton("Stats")
+        self.stats_btn.setCheckable(True)
+        self.stats_btn.setStyleSheet("padding:5px;")
+        self.stats_btn.toggled.connect(lambda on: self.remote_view.stats_overlay.set_enabled(on))
+        h.addWidget(self.stats_btn)
+
         # Focus Mode button
         self.fullscreen_btn = QPushButton("Focus Mode")
         self.fullscreen_btn.setCheckable(True)
@@ -165,6 +718,12 @@ class ScreenWindow(QMainWindow):
         self.fullscreen_btn.clicked.connect(self.toggle_fullscreen)
         h.addWidget(self.fullscreen_btn)
 
+        # Send a file to the host
+        send_btn = QPushButton("Send File")
+        send_btn.setStyleSheet("padding:5px;")
+        send_btn.clicked.connect(self.choose_file)
+        h.addWidget(send_btn)
+
         # Disconnect button
         disc = QPushButton("Disconnect")
         disc.setStyleSheet("background-color:red;color:white;padding:5px;")
@@ -173,13 +732,34 @@ class ScreenWindow(QMainWindow):
 
         v.addWidget(bar)
 
-        self.remote_view = RemoteView(self.network)
+        # Fall back to the CPU view where there is no OpenGL, e.g. headless test runs
+        use_gl = self.gpu and opengl_available()
+        if self.gpu and not use_gl:
+            print("OpenGL is not available; scaling frames on the CPU")
+        self.remote_view = (GLRemoteView if use_gl else RemoteView)(self.network)
         v.addWidget(self.remote_view)
         self.setCentralWidget(c)
 
     def show_fullscreen(self):
         self.showMaximized()
 
+    def set_monitors(self, monitors):
+        """Fill the switcher from MSG_MONITORS: ([(left, top, width, height)], current index)"""
+        monitors, current = monitors
+        self.monitor_box.clear()
+        for index, (left, top, width, height) in enumerate(monitors):
+            self.monitor_box.addItem(f"Monitor {index + 1} ({width}x{height})")
+        self.monitor_box.setCurrentIndex(current)
+        self.monitor_box.setVisible(len(monitors) > 1)
+
+    def select_monitor(self, index):
+        self.network.send_data({'type': MSG_MONITOR_SELECT, 'monitor': index})
+
+    def choose_file(self):
+        path, _ = QFileDialog.getOpenFileName(self, "Send File")
+        if path:
+            self.file_chosen.emit(path)
+
     def toggle_fullscreen(self):
         if self.fullscreen_btn.isChecked():
             self.fullscreen_btn.setText("Exit Focus Mode")
@@ -192,7 +772,14 @@ class ScreenWindow(QMainWindow):
 
 
 class RemoteClientApp:
-    def __init__(self):
+    def __init__(self, stats_interval=DEFAULT_STATS_INTERVAL, metrics_address=None, gpu=False,
+                 tile_cache_mb=DEFAULT_TILE_CACHE_MB):
+        self.gpu = gpu
+        self.tile_cache_mb = tile_cache_mb
+        if stats_interval > 0:
+            StatsLogger(interval=stats_interval, prefix="client").start()
+        if metrics_address:
+            start_metrics_server(metrics_address)
         self.app = QApplication(sys.argv)
         self.network = NetworkManager(is_server=False)
         self.conn = ConnectionWindow()
@@ -206,20 +793,24 @@ class RemoteClientApp:
             self.app.quit()
             return
 
-        self.win = ScreenWindow(self.network)
+        self.win = ScreenWindow(self.network, self.gpu)
         self.win.show_fullscreen()
 
-        self.receiver = FrameReceiver(self.network)
-        self.receiver.frame_received.connect(self.win.remote_view.update_frame)
+        self.receiver = FrameReceiver(self.network, self.win.remote_view.frame_buffer, self.tile_cache_mb)
+        self.receiver.frame_ready.connect(self.win.remote_view.update_frame)
+        self.receiver.cursor_shape_received.connect(self.win.remote_view.add_cursor_shape)
+        self.receiver.cursor_moved.connect(self.win.remote_view.move_cursor)
+        self.receiver.monitors_received.connect(self.win.set_monitors)
         self.receiver.error_occurred.connect(lambda m: QMessageBox.warning(self.win, "Error", m))
+        self.win.file_chosen.connect(self.receiver.send_file)
         self.receiver.start()
 
     def run(self):
         sys.exit(self.app.exec_())
 
 
-def main():
-    RemoteClientApp().run()
+def main(stats_interval=DEFAULT_STATS_INTERVAL, metrics_address=None, gpu=False, tile_cache_mb=DEFAULT_TILE_CACHE_MB):
+    RemoteClientApp(stats_interval, metrics_address, gpu, tile_cache_mb).run()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,217 @@
+import sys
+import os
+import io
+import time
+import select
+from concurrent.futures import ThreadPoolExecutor
+
+import lz4.frame
+import numpy as np
+from PIL import Image
+
+# Add parent dir for common modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.network import (
+    NetworkManager, MSG_FRAME_DELTA, MSG_KEYFRAME_REQUEST, MSG_FRAME_ACK, MSG_CURSOR, MSG_CURSOR_SHAPE,
+    MSG_VIEWPORT, MSG_TILE_CACHE, MSG_FILE_ACK, MSG_MONITORS, MSG_MONITOR_SELECT, MSG_VIDEO
+)
+from common.imaging import (
+    TILE_JPEG, TILE_CACHED, TILE_STORE, TILE_VIDEO, SEQUENTIAL_CODECS, apply_copy, decode_lossless
+)
+from common.tile_cache import TileCache, DEFAULT_TILE_CACHE_MB
+from common.file_transfer import FileSender
+from common.video import VideoDecoder, VIDEO_CODEC, video_available
+
+DECODE_WORKERS = min(4, os.cpu_count() or 1)
+
+
+def decode_tile(tile):
+    """Decode one tile to an RGB array; returns (x, y, pixels, CPU seconds spent)"""
+    cpu_start = time.thread_time()
+    x, y, w, h, codec, data = tile
+    if codec == TILE_JPEG:
+        with Image.open(io.BytesIO(data)) as img:
+            pixels = np.asarray(img.convert("RGB"))
+    else:
+        # BGRX words to RGB bytes
+        pixels = decode_lossless(codec, data, w, h).view(np.uint8).reshape(h, w, 4)[..., 2::-1]
+    return x, y, pixels, time.thread_time() - cpu_start
+
+
+class HeadlessClient:
+    """A viewer without a UI, for benchmarks and automated checks
+
+    Speaks the same protocol as FrameReceiver and patches delta frames into a
+    numpy canvas the same way: copies are applied, tiles are decoded in
+    parallel, a keyframe is requested when there is no base image or a cached
+    tile is missing, and every applied frame is acknowledged. When the
+    connection fails, the session is resumed on a new one. Each frame's
+    size, decode CPU and glass-to-glass latency (host capture to canvas
+    updated) are recorded.
+    """
+
+    def __init__(self, network=None, decode_workers=DECODE_WORKERS, tile_cache_mb=DEFAULT_TILE_CACHE_MB, video=True):
+        self.network = network or NetworkManager(is_server=False)
+        self.canvas = None
+        self.awaiting_keyframe = False
+        self.last_seq = 0  # Last frame applied, for resuming the session where it broke off
+        self.decode_pool = ThreadPoolExecutor(decode_workers, thread_name_prefix="decode")
+        self.tile_cache = TileCache(tile_cache_mb * 1024 * 1024) if tile_cache_mb else None
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.video = VideoDecoder() if video and video_available() else None
+
+        # Per-frame measurements
+        self.frames = 0
+        self.keyframes = 0
+        self.frame_bytes = []
+        self.latencies = []
+        self.decode_cpu = 0.0
+
+        # Pointer state from the cursor messages
+        self.cursor = None
+        self.cursor_shapes = {}
+        self.cursor_updates = 0
+
+        # Uploads in progress, by transfer id; acknowledgements arrive through run()
+        self.file_senders = {}
+
+        # Host's monitors as (left, top, width, height), and the one being watched
+        self.monitors = []
+        self.monitor = 0
+
+    def connect(self, host, port):
+        if not (self.network.connect(host, port) and self.network.authenticate()):
+            return False
+        if self.tile_cache is not None:
+            self.network.send_data({'type': MSG_TILE_CACHE, 'budget': self.tile_cache.budget})
+        if self.video is not None:
+            self.network.send_data({'type': MSG_VIDEO, 'codec': VIDEO_CODEC})
+        return True
+
+    def send_viewport(self, width, height, region=(0.0, 0.0, 1.0, 1.0)):
+        """Ask for frames no bigger than width x height showing region, as fractions of the screen"""
+        x, y, w, h = region
+        return self.network.send_data({'type': MSG_VIEWPORT, 'width': width, 'height': height,
+                                       'x': x, 'y': y, 'w': w, 'h': h})
+
+    def select_monitor(self, index):
+        """Watch another of the host's monitors; its first frame is a keyframe"""
+        self.monitor = index
+        return self.network.send_data({'type': MSG_MONITOR_SELECT, 'monitor': index})
+
+    def send_file(self, path, rate=None):
+        """Start uploading path to the host; returns the FileSender to wait on"""
+        sender = FileSender(self.network, path, rate=rate, on_done=self.file_sent)
+        self.file_senders[sender.id] = sender
+        return sender.start()
+
+    def file_sent(self, sender):
+        """Forget a sender that stopped, unless the same file is being sent again"""
+        if self.file_senders.get(sender.id) is sender:
+            del self.file_senders[sender.id]
+
+    def run(self, duration):
+        """Receive and apply frames for duration seconds; False if the connection dropped"""
+        deadline = time.time() + duration
+        while True:
+            # An idle host sends nothing, so wait for data with a timeout
+            remaining = deadline - time.time()
+            if remaining <= 0 or not select.select([self.network.socket], [], [], remaining)[0]:
+                return True
+            data = self.network.receive_data()
+            if data is None:
+                if not self.resume():
+                    return False
+                continue
+            t = data.get('type')
+            if t == MSG_FRAME_DELTA:
+                self.apply_delta(data)
+            elif t == MSG_CURSOR_SHAPE:
+                # Received fields are views into the receive buffer
+                self.cursor_shapes[data['shape']] = lz4.frame.decompress(data['pixels'])
+            elif t == MSG_CURSOR:
+                self.cursor = (data['x'], data['y'], data['shape'])
+                self.cursor_updates += 1
+            elif t == MSG_FILE_ACK:
+                sender = self.file_senders.get(data['transfer'])
+                if sender is not None:
+                    sender.on_ack(data)
+            elif t == MSG_MONITORS:
+                self.monitors, self.monitor = data['monitors'], data['monitor']
+
+    def resume(self):
+        """Carry on the session over a new connection, keeping the canvas; False if it is over"""
+        # Waiting for a keyframe, there is nothing worth resending
+        resumed = self.network.resume(0 if self.awaiting_keyframe or self.canvas is None else self.last_seq)
+        for sender in list(self.file_senders.values()):
+            if resumed:
+                sender.on_resume()
+            else:
+                sender.cancel()
+        return resumed
+
+    def request_keyframe(self):
+        if not self.awaiting_keyframe:
+            self.awaiting_keyframe = True
+            self.network.send_data({'type': MSG_KEYFRAME_REQUEST})
+
+    def apply_delta(self, data):
+        width, height = data['width'], data['height']
+        if data['cache_reset'] and self.tile_cache is not None:
+            self.tile_cache.clear()
+        if data['keyframe']:
+            self.canvas = np.zeros((height, width, 3), dtype=np.uint8)
+            self.awaiting_keyframe = False
+        elif self.awaiting_keyframe or self.canvas is None or self.canvas.shape[:2] != (height, width):
+            # Tiles are useless without a base image; ask for a full refresh
+            self.request_keyframe()
+            return False
+
+        # Cache operations run in order with the tiles, on the canvas as it is at that point
+        decoded = self.decode_pool.map(decode_tile,
+                                       [tile for tile in data['tiles'] if tile[4] not in SEQUENTIAL_CODECS])
+        for copy in data['copies']:
+            apply_copy(self.canvas, copy)
+        for tile in data['tiles']:
+            x, y, w, h, codec, key = tile
+            if codec == TILE_STORE:
+                if self.tile_cache is not None:
+                    self.tile_cache.put(bytes(key), self.canvas[y:y + h, x:x + w].copy(), w * h * 4)
+                continue
+            if codec == TILE_CACHED:
+                pixels = self.tile_cache.get(bytes(key)) if self.tile_cache is not None else None
+                if pixels is None:
+                    self.cache_misses += 1
+                    self.request_keyframe()
+                    return False
+                self.cache_hits += 1
+            elif codec == TILE_VIDEO:
+                # Each access unit builds on the last, so they are decoded here, in order
+                cpu_start = time.thread_time()
+                pixels = self.video.decode(tile[5], w, h) if self.video is not None else None
+                self.decode_cpu += time.thread_time() - cpu_start
+                if pixels is None:
+                    self.request_keyframe()
+                    return False
+            else:
+                _, _, pixels, cpu = next(decoded)
+                self.decode_cpu += cpu
+            self.canvas[y:y + h, x:x + w] = pixels
+        size = sum(len(tile[5]) for tile in data['tiles'])
+
+        # Acknowledge so the host can measure round trips and adapt its bitrate
+        self.network.send_data({'type': MSG_FRAME_ACK, 'seq': data['seq']})
+        self.last_seq = data['seq']
+
+        self.frames += 1
+        self.keyframes += data['keyframe']
+        self.frame_bytes.append(size)
+        self.latencies.append(time.time() - data['captured'])
+        return True
+
+    def close(self):
+        for sender in list(self.file_senders.values()):
+            sender.cancel()
+        self.network.close()
+        self.decode_pool.shutdown(wait=False)
@@ -0,0 +1,223 @@
+import sys
+import os
+import time
+import threading
+
+from PyQt5.QtWidgets import (
+    QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QLabel, QSlider, QComboBox,
+    QMessageBox
+)
+from PyQt5.QtCore import Qt, pyqtSignal
+
+# Add parent dir for common modules, ahead of the script's own so its package is found
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.recording import RecordingReader
+from client.client import FrameReceiver, RemoteView, GLRemoteView, opengl_available, RECEIVE_POLL_SECONDS
+
+SPEEDS = (0.25, 0.5, 1, 2, 4, 8)
+
+
+class PlaybackLink:
+    """Stands in for the connection during playback: acks, keyframe requests and input go nowhere"""
+
+    address = None
+
+    def send_data(self, data):
+        return True
+
+    def close(self):
+        pass
+
+
+class Playback(FrameReceiver):
+    """Feeds a recording through the same decoding and presenting path as a live session
+
+    Messages are replayed at their recorded pace times speed. Seeking
+    restarts from the keyframe at or before the chosen time, found in the
+    recording's index, so it costs one keyframe whatever the position; the
+    messages between that keyframe and the chosen time are applied at once.
+    """
+
+    position_changed = pyqtSignal(float)
+    ended = pyqtSignal()
+
+    def __init__(self, reader, frame_buffer=None):
+        # Recordings carry whole tiles, never tile cache references
+        super().__init__(PlaybackLink(), frame_buffer, tile_cache_mb=0)
+        self.reader = reader
+        self.cond = threading.Condition()
+        self.speed = 1.0
+        self.paused = False
+        self.seek_to = 0.0  # Where to play from next, or None to carry on
+        self.clock = None  # (wall time, recording time) the pace is measured from
+        self.position = 0.0
+
+    def seek(self, at):
+        with self.cond:
+            self.seek_to = at
+            self.cond.notify()
+
+    def set_speed(self, speed):
+        with self.cond:
+            self.speed = speed
+            self.clock = None
+            self.cond.notify()
+
+    def set_paused(self, paused):
+        with self.cond:
+            self.paused = paused
+            self.clock = None
+            self.cond.notify()
+
+    def run(self):
+        self.running = True
+        messages = iter(())
+        pending = None  # Next (time, message), waiting for its turn
+        catch_up = None  # Time sought to, until the messages before it are applied
+        while self.running:
+            try:
+                with self.cond:
+                    if self.seek_to is not None:
+                        messages = self.reader.messages(self.reader.keyframe_offset(self.seek_to))
+                        catch_up, self.seek_to, self.clock, pending = self.seek_to, None, None, None
+                    paused, speed = self.paused, self.speed
+
+                # Keyframes can be far apart in time, so the way from one to the time sought is not replayed
+                if catch_up is not None:
+                    if pending is None:
+                        pending = next(messages, None)
+                    if pending is not None and pending[0] < catch_up:
+                        self.handle(pending[1])
+                        pending = None
+                        continue
+                    with self.cond:
+                        self.clock = (time.perf_counter(), catch_up)
+                    self.position = catch_up
+                    self.position_changed.emit(catch_up)
+                    catch_up = None
+
+                if not paused and pending is None:
+                    pending = next(messages, None)
+                    if pending is None:
+                        self.set_paused(True)
+                        self.ended.emit()
+                        continue
+                if paused:
+                    self.idle(RECEIVE_POLL_SECONDS)
+                    continue
+
+                at, data = pending
+                now = time.perf_counter()
+                with self.cond:
+                    if self.clock is None:
+                        self.clock = (now, at)
+                    due = self.clock[0] + (at - self.clock[1]) / speed
+                if due > now:
+                    self.idle(min(due - now, RECEIVE_POLL_SECONDS))
+                    continue
+
+                pending = None
+                self.handle(data)
+                self.position = at
+                self.position_changed.emit(at)
+            except Exception as e:
+                self.error_occurred.emit(f"Playback error: {e}")
+                self.set_paused(True)
+
+    def idle(self, timeout):
+        """Wait for the next message's turn or a control change; keep up with resizes meanwhile"""
+        with self.cond:
+            self.cond.wait(timeout)
+        if self.canvas is not None and self.frame_buffer.needs_rescale(self.canvas):
+            self.present(self.canvas.rect())
+
+
+def format_time(seconds):
+    return f"{int(seconds) // 60}:{int(seconds) % 60:02d}"
+
+
+class PlayerWindow(QMainWindow):
+    def __init__(self, reader, gpu=False):
+        super().__init__()
+        self.reader = reader
+        self.setWindowTitle("Session Recording")
+
+        c = QWidget()
+        v = QVBoxLayout(c)
+        v.setContentsMargins(0, 0, 0, 0)
+
+        use_gl = gpu and opengl_available()
+        self.remote_view = (GLRemoteView if use_gl else RemoteView)(PlaybackLink())
+        v.addWidget(self.remote_view)
+
+        bar = QWidget()
+        bar.setFixedHeight(40)
+        h = QHBoxLayout(bar)
+        h.setContentsMargins(10, 0, 10, 0)
+
+        self.play_btn = QPushButton("Pause")
+        self.play_btn.clicked.connect(self.toggle_paused)
+        h.addWidget(self.play_btn)
+
+        # Position in milliseconds; dragging seeks on release
+        self.slider = QSlider(Qt.Horizontal)
+        self.slider.setRange(0, int(reader.duration * 1000))
+        self.slider.sliderReleased.connect(lambda: self.playback.seek(self.slider.value() / 1000))
+        h.addWidget(self.slider)
+
+        self.time_label = QLabel()
+        h.addWidget(self.time_label)
+
+        self.speed_box = QComboBox()
+        for speed in SPEEDS:
+            self.speed_box.addItem(f"{speed:g}x")
+        self.speed_box.setCurrentIndex(SPEEDS.index(1))
+        self.speed_box.activated.connect(lambda index: self.playback.set_speed(SPEEDS[index]))
+        h.addWidget(self.speed_box)
+
+        v.addWidget(bar)
+        self.setCentralWidget(c)
+
+        self.playback = Playback(reader, self.remote_view.frame_buffer)
+        self.playback.frame_ready.connect(self.remote_view.update_frame)
+        self.playback.cursor_shape_received.connect(self.remote_view.add_cursor_shape)
+        self.playback.cursor_moved.connect(self.remote_view.move_cursor)
+        self.playback.position_changed.connect(self.show_position)
+        self.playback.ended.connect(lambda: self.play_btn.setText("Play"))
+        self.playback.error_occurred.connect(lambda m: QMessageBox.warning(self, "Error", m))
+        self.show_position(0.0)
+
+    def toggle_paused(self):
+        paused = not self.playback.paused
+        if not paused and self.playback.position >= self.reader.duration:
+            # Play again from the start
+            self.playback.seek(0.0)
+        self.playback.set_paused(paused)
+        self.play_btn.setText("Play" if paused else "Pause")
+
+    def show_position(self, at):
+        if not self.slider.isSliderDown():
+            self.slider.setValue(int(at * 1000))
+        self.time_label.setText(f"{format_time(at)} / {format_time(self.reader.duration)}")
+
+    def closeEvent(self, ev):
+        self.playback.running = False
+        self.playback.set_paused(True)
+        self.playback.wait()
+        super().closeEvent(ev)
+
+
+def main(path, gpu=False):
+    app = QApplication(sys.argv)
+    reader = RecordingReader(path)
+    win = PlayerWindow(reader, gpu)
+    win.resize(1280, 800)
+    win.show()
+    win.playback.start()
+    code = app.exec_()
+    reader.close()
+    sys.exit(code)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1])
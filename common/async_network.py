@@ -0,0 +1,231 @@
+import asyncio
+import ssl
+import struct
+import time
+import heapq
+import itertools
+
+from common.encryption import SessionCipher, generate_key
+from common.logging_utils import metrics
+from common.network import (
+    DEFAULT_PORT, AUTH_KEY, HEADER, MSG_AUTH, MSG_SESSION, MSG_RESUME, MESSAGE_CHANNELS, CHANNEL_CONTROL, CHANNEL_BULK, CHUNK_SIZE,
+    SEND_LOW_WATER, ChunkAssembler, encode_message, split_payload, seal_message, parse_header, limit_unsent
+)
+
+
+class AsyncPriorityLock:
+    """asyncio counterpart of PriorityLock"""
+
+    def __init__(self):
+        self.cond = asyncio.Condition()
+        self.waiting = []  # Heap of (priority, ticket)
+        self.tickets = itertools.count()
+        self.held = False
+
+    async def acquire(self, priority):
+        async with self.cond:
+            entry = (priority, next(self.tickets))
+            heapq.heappush(self.waiting, entry)
+            try:
+                await self.cond.wait_for(lambda: not self.held and self.waiting[0] == entry)
+            except BaseException:
+                # Cancelled while waiting; let the next in line through
+                self.waiting.remove(entry)
+                heapq.heapify(self.waiting)
+                self.cond.notify_all()
+                raise
+            heapq.heappop(self.waiting)
+            self.held = True
+
+    async def release(self):
+        async with self.cond:
+            self.held = False
+            self.cond.notify_all()
+
+
+class AsyncNetworkManager:
+    """asyncio counterpart of NetworkManager, speaking the same wire protocol
+
+    Each instance wraps one stream connection. send_data waits on drain(), so
+    a slow peer applies backpressure to the sender instead of letting data
+    pile up in memory.
+    """
+
+    def __init__(self, reader=None, writer=None, is_server=False, use_ssl=False):
+        self.is_server = is_server
+        self.use_ssl = use_ssl
+        self.reader = reader
+        self.writer = writer
+        self.address = writer.get_extra_info('peername') if writer else None
+        self.encryption_key = generate_key()
+        self.cipher = SessionCipher(self.encryption_key, is_server)
+        # Nonces are implicit counters, so seal + write must not interleave;
+        # the lock goes to the most urgent channel waiting for it
+        self.send_lock = AsyncPriorityLock()
+        self.channel_locks = [asyncio.Lock() for _ in range(CHANNEL_BULK + 1)]
+        self.assembler = ChunkAssembler()
+        self.session_token = None
+        self.session_secret = None
+        self.closed = False
+        self.peer_closed = False
+        if writer is not None:
+            self._limit_buffering()
+
+        # Same timings as NetworkManager; socket time is spent in the event loop
+        role = 'host' if is_server else 'client'
+        self.serialize_time = metrics.histogram(f'{role}_serialize_seconds', 'Encoding a message to bytes')
+        self.encrypt_time = metrics.histogram(f'{role}_encrypt_seconds', 'Sealing a message')
+        self.decrypt_time = metrics.histogram(f'{role}_decrypt_seconds', 'Opening and decoding a message')
+        self.bytes_sent = metrics.counter(f'{role}_bytes_sent_total', 'Bytes written to sockets')
+        self.bytes_received = metrics.counter(f'{role}_bytes_received_total', 'Bytes read from sockets')
+
+    @classmethod
+    async def start_server(cls, on_connect, host='0.0.0.0', port=DEFAULT_PORT, use_ssl=False):
+        """Serve connections, calling await on_connect(manager) for each after the key exchange"""
+        context = None
+        if use_ssl:
+            context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+            context.load_cert_chain(certfile="cert.pem", keyfile="key.pem")
+
+        async def handle(reader, writer):
+            conn = cls(reader, writer, is_server=True, use_ssl=use_ssl)
+            print(f"Connection from {conn.address}")
+            try:
+                # Send encryption key
+                await conn._send_raw(conn.encryption_key)
+                await on_connect(conn)
+            finally:
+                await conn.close()
+
+        server = await asyncio.start_server(handle, host, port, ssl=context)
+        print(f"Server started on {host}:{port}")
+        return server
+
+    async def connect(self, host, port=DEFAULT_PORT):
+        """Connect to a remote host"""
+        try:
+            context = None
+            if self.use_ssl:
+                context = ssl.create_default_context(ssl.Purpose.SERVER_AUTH)
+                context.check_hostname = False
+                context.verify_mode = ssl.CERT_NONE
+
+            self.reader, self.writer = await asyncio.open_connection(host, port, ssl=context)
+            self.address = self.writer.get_extra_info('peername')
+            self._limit_buffering()
+            print(f"Connected to {host}:{port}")
+
+            # Receive encryption key
+            self.encryption_key = await self._recv_raw()
+            self.cipher = SessionCipher(self.encryption_key, self.is_server)
+            return True
+        except Exception as e:
+            print(f"Connection failed: {e}")
+            return False
+
+    async def authenticate(self, key=AUTH_KEY):
+        """Send authentication to the server and wait for its session, or check the client's
+
+        As in NetworkManager, the server gets the client's MSG_AUTH or MSG_RESUME, or None.
+        """
+        if self.is_server:
+            data = await self.receive_data()
+            if data and (data['type'] == MSG_RESUME or (data['type'] == MSG_AUTH and data['key'] == AUTH_KEY)):
+                return data
+            return None
+
+        if not await self.send_data({'type': MSG_AUTH, 'key': key}):
+            return False
+        data = await self.receive_data()
+        if not data or data['type'] != MSG_SESSION:
+            return False
+        self.session_token = bytes(data['token'])
+        self.session_secret = self.encryption_key
+        return True
+
+    def _limit_buffering(self):
+        # As in NetworkManager: queue in the sender, where urgent channels can overtake
+        sock = self.writer.get_extra_info('socket')
+        if sock is not None:
+            limit_unsent(sock)
+        self.writer.transport.set_write_buffer_limits(high=SEND_LOW_WATER)
+
+    async def send_data(self, data):
+        """Send a message in chunks, waiting until the transport has room for each"""
+        try:
+            start = time.perf_counter()
+            msg_type, payload = encode_message(data)
+            self.serialize_time.observe(time.perf_counter() - start)
+            channel = MESSAGE_CHANNELS.get(msg_type, CHANNEL_CONTROL)
+            chunks = split_payload(payload, CHUNK_SIZE)
+            sent = 0
+            async with self.channel_locks[channel]:
+                for index, chunk in enumerate(chunks):
+                    await self.send_lock.acquire(channel)
+                    try:
+                        start = time.perf_counter()
+                        message = seal_message(self.cipher, msg_type, chunk, channel, index < len(chunks) - 1)
+                        self.encrypt_time.observe(time.perf_counter() - start)
+                        self.writer.write(message)
+                        await self.writer.drain()
+                    finally:
+                        await self.send_lock.release()
+                    sent += len(message)
+            self.bytes_sent.inc(sent)
+            return True
+        except Exception as e:
+            print(f"Error sending data: {e}")
+            return False
+
+    async def receive_data(self):
+        """Receive a message and return it as a dict, or None once the connection is gone"""
+        try:
+            # Read chunks, of whichever channels, until one completes a message
+            data = None
+            while data is None:
+                header = await self.reader.readexactly(HEADER.size)
+                msg_type, channel, more, data_size = parse_header(header)
+                payload = await self.reader.readexactly(data_size)
+                self.bytes_received.inc(HEADER.size + data_size)
+                start = time.perf_counter()
+                data = self.assembler.add(msg_type, channel, more, self.cipher.decrypt(payload, header))
+                self.decrypt_time.observe(time.perf_counter() - start)
+            return data
+        except asyncio.IncompleteReadError as e:
+            if e.partial:
+                print("Error receiving data: connection closed mid-message")
+            else:
+                # Closed between messages: by the peer, unless it was us
+                self.peer_closed = not self.closed
+            return None
+        except Exception as e:
+            print(f"Error receiving data: {e}")
+            return None
+
+    async def _send_raw(self, data):
+        """Send raw data without encryption (used for key exchange)"""
+        self.writer.write(struct.pack("!I", len(data)) + data)
+        await self.writer.drain()
+
+    async def _recv_raw(self):
+        """Receive raw data without decryption (used for key exchange)"""
+        header = await self.reader.readexactly(4)
+        return await self.reader.readexactly(struct.unpack("!I", header)[0])
+
+    def send_backlog(self):
+        """Bytes buffered by the transport and not yet handed to the kernel"""
+        if self.writer is None:
+            return None
+        return self.writer.transport.get_write_buffer_size()
+
+    async def close(self):
+        """Close the connection"""
+        self.closed = True
+        if self.writer is None:
+            return
+        try:
+            self.writer.close()
+            await self.writer.wait_closed()
+        except Exception:
+            # Peer already gone; nothing left to flush
+            pass
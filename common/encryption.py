@@ -0,0 +1,70 @@
+import hashlib
+
+from cryptography.hazmat.primitives.ciphers.aead import ChaCha20Poly1305
+
+KEY_SIZE = 32
+TAG_SIZE = 16  # Poly1305 authentication tag appended to every payload
+
+# Personalizations keeping keys derived for different purposes apart
+RESUME_KEY_PURPOSE = b'pydesk-resume'
+RESUME_PROOF_PURPOSE = b'pydesk-proof'
+
+# Nonce prefixes keep the two directions of a connection from ever reusing a nonce
+SERVER_NONCE_PREFIX = b'SRV\x00'
+CLIENT_NONCE_PREFIX = b'CLI\x00'
+
+
+def generate_key():
+    """Generate a random session key"""
+    return ChaCha20Poly1305.generate_key()
+
+
+def derive_key(secret, salt, purpose):
+    """KEY_SIZE bytes bound to secret, salt and purpose; none of them can be recovered from it"""
+    return hashlib.blake2b(salt, key=secret, digest_size=KEY_SIZE, person=purpose).digest()
+
+
+def resume_proof(secret, key):
+    """Proof that the client resuming a session holds its secret, for a connection whose fresh key is key"""
+    return derive_key(secret, key, RESUME_PROOF_PURPOSE)
+
+
+def resumed_cipher(secret, key, is_server):
+    """Cipher for a connection resuming a session, keyed from the session's secret and the connection's key
+
+    The connection's fresh key crosses the wire in the clear; the secret was
+    exchanged once, when the session began, so someone who only saw the
+    resumed connection cannot read it.
+    """
+    return SessionCipher(derive_key(secret, key, RESUME_KEY_PURPOSE), is_server)
+
+
+class SessionCipher:
+    """ChaCha20-Poly1305 AEAD with implicit per-direction counter nonces
+
+    Both ends count the messages they send and receive, so nonces never travel
+    on the wire. This relies on the transport delivering messages in order and
+    on every encrypt being followed by a send before the next encrypt.
+    """
+
+    def __init__(self, key, is_server):
+        self.key = key
+        self.aead = ChaCha20Poly1305(key)
+        if is_server:
+            self.send_prefix, self.recv_prefix = SERVER_NONCE_PREFIX, CLIENT_NONCE_PREFIX
+        else:
+            self.send_prefix, self.recv_prefix = CLIENT_NONCE_PREFIX, SERVER_NONCE_PREFIX
+        self.send_counter = 0
+        self.recv_counter = 0
+
+    def encrypt(self, payload, associated_data=None):
+        """Encrypt and authenticate payload; associated_data is authenticated only"""
+        nonce = self.send_prefix + self.send_counter.to_bytes(8, 'big')
+        self.send_counter += 1
+        return self.aead.encrypt(nonce, payload, associated_data)
+
+    def decrypt(self, ciphertext, associated_data=None):
+        """Verify and decrypt; raises cryptography's InvalidTag on tampering"""
+        nonce = self.recv_prefix + self.recv_counter.to_bytes(8, 'big')
+        self.recv_counter += 1
+        return self.aead.decrypt(nonce, ciphertext, associated_data)
@@ -0,0 +1,273 @@
+import os
+import mmap
+import zlib
+import time
+import hashlib
+import threading
+
+from common.network import MSG_FILE_OFFER, MSG_FILE_TRANSFER, MSG_FILE_ACK, RESUME_TIMEOUT
+from common.logging_utils import metrics
+
+FILE_CHUNK_SIZE = 256 * 1024
+FILE_WINDOW = 8  # Chunks sent ahead of the receiver's last acknowledgement
+FILE_ACK_TIMEOUT = 30.0  # Seconds without an acknowledgement before giving up
+
+# MSG_FILE_ACK status
+FILE_OK = 0  # Everything before offset is written
+FILE_BAD_CHUNK = 1  # The chunk at offset failed its checksum; send again from there
+FILE_REFUSED = 2
+FILE_REWIND = 3  # A chunk arrived for another offset than this one; send again from here
+
+BYTES_SENT = metrics.counter('file_bytes_sent_total', 'File data sent, including resent chunks')
+BYTES_WRITTEN = metrics.counter('file_bytes_written_total', 'File data verified and written')
+CHUNKS_REJECTED = metrics.counter('file_chunks_rejected_total', 'File chunks that failed their checksum')
+
+
+def transfer_id(path):
+    """Names a file version: the same path, size and modification time give the same id"""
+    st = os.stat(path)
+    digest = hashlib.blake2b(f"{os.path.abspath(path)}|{st.st_size}|{st.st_mtime_ns}".encode(), digest_size=8)
+    return int.from_bytes(digest.digest(), 'big')
+
+
+def free_path(path):
+    """path if nothing is there, else the first free one of 'name (1).ext', 'name (2).ext', ..."""
+    base, ext = os.path.splitext(path)
+    number = 1
+    while os.path.exists(path):
+        path = f"{base} ({number}){ext}"
+        number += 1
+    return path
+
+
+def file_ack(transfer, offset, status=FILE_OK):
+    return {'type': MSG_FILE_ACK, 'transfer': transfer, 'offset': offset, 'status': status}
+
+
+class FileSender:
+    """Streams one file in checksummed chunks, several of them in flight
+
+    The file is memory-mapped and sent a slice at a time, so its size does
+    not matter. The receiver acknowledges what it has written: a chunk that
+    fails its checksum rewinds the stream to it, and offering the same file
+    again, e.g. after a reconnect, resumes where the receiver got to. When
+    the session is resumed on a new connection, on_resume offers it again
+    there; until then a failed send just waits. Chunks travel on the bulk
+    channel, which only gets the connection when no input, pointer or frame
+    is waiting; rate additionally caps it in bytes per second. on_done is
+    called with the sender once it stops, whether or not it succeeded.
+    """
+
+    def __init__(self, network, path, window=FILE_WINDOW, chunk_size=FILE_CHUNK_SIZE, rate=None, on_done=None):
+        self.network = network
+        self.path = path
+        self.name = os.path.basename(path)
+        self.size = os.path.getsize(path)
+        self.id = transfer_id(path)
+        self.window = window
+        self.chunk_size = chunk_size
+        self.rate = rate
+        self.cond = threading.Condition()
+        self.acked = None  # Receiver's offset; None until it answers the offer
+        self.rewind = False
+        self.refused = False
+        self.cancelled = False
+        self.offering = True  # Offer before sending: at the start, and again after a resume
+        self.done = threading.Event()
+        self.succeeded = False
+        self.on_done = on_done
+
+    def start(self):
+        """Send from a background thread; wait on done, then check succeeded"""
+        threading.Thread(target=self.run, daemon=True).start()
+        return self
+
+    def on_ack(self, data):
+        """Handle a MSG_FILE_ACK for this transfer; called from the receiving thread"""
+        with self.cond:
+            if data['status'] == FILE_REFUSED:
+                self.refused = True
+            else:
+                self.acked = data['offset']
+                self.rewind = self.rewind or data['status'] in (FILE_BAD_CHUNK, FILE_REWIND)
+            self.cond.notify_all()
+
+    def on_resume(self):
+        """The session carried on over a new connection; what was in flight may be lost with the old one"""
+        with self.cond:
+            self.offering = True
+            self.cond.notify_all()
+
+    def cancel(self):
+        """Stop sending, e.g. because the session is over; done is set once the sending thread sees it"""
+        with self.cond:
+            self.cancelled = True
+            self.cond.notify_all()
+
+    def run(self):
+        """Send the file; True once the receiver has all of it"""
+        try:
+            self.succeeded = self.send()
+        except OSError as e:
+            print(f"File transfer of {self.name} failed: {e}")
+        finally:
+            self.done.set()
+            if self.on_done is not None:
+                self.on_done(self)
+        return self.succeeded
+
+    def send(self):
+        with open(self.path, 'rb') as f:
+            # An empty file cannot be mapped, and has nothing to send anyway
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if self.size else b''
+            try:
+                return self.stream(data)
+            finally:
+                if self.size:
+                    data.close()
+
+    def stream(self, data):
+        in_flight = self.window * self.chunk_size
+        offset = None
+        stalled = False  # A send failed; nothing more goes until the session is resumed
+        next_time = time.perf_counter()
+
+        def ready():
+            # An offer to make, else the answer to it, then room in the window
+            if self.offering or self.refused or self.cancelled:
+                return True
+            if stalled or self.acked is None:
+                return False
+            return (self.acked >= self.size or self.rewind or offset is None
+                    or offset < self.size and offset - self.acked < in_flight)
+
+        while True:
+            with self.cond:
+                # Resuming can take up to RESUME_TIMEOUT on top of the wait for an answer
+                if not self.cond.wait_for(ready, FILE_ACK_TIMEOUT + (RESUME_TIMEOUT if stalled else 0)):
+                    print(f"File transfer of {self.name} timed out")
+                    return False
+                if self.refused:
+                    print(f"File transfer of {self.name} was refused")
+                    return False
+                if self.cancelled:
+                    print(f"File transfer of {self.name} was cancelled")
+                    return False
+                offering = self.offering
+                if offering:
+                    # The receiver's answer says where to carry on from
+                    self.offering, self.acked, self.rewind, offset = False, None, False, None
+                elif self.acked >= self.size:
+                    print(f"Sent {self.name} ({self.size} bytes)")
+                    return True
+                elif offset is None or self.rewind:
+                    offset, self.rewind = self.acked, False
+
+            if offering:
+                offer = {'type': MSG_FILE_OFFER, 'transfer': self.id, 'size': self.size, 'name': self.name}
+                stalled = not self.network.send_data(offer)
+                continue
+
+            if self.rate:
+                next_time = max(next_time, time.perf_counter())
+                time.sleep(max(next_time - time.perf_counter(), 0))
+                next_time += self.chunk_size / self.rate
+
+            # Slicing the map reads just this chunk from the file
+            chunk = data[offset:offset + self.chunk_size]
+            message = {'type': MSG_FILE_TRANSFER, 'transfer': self.id, 'offset': offset,
+                       'checksum': zlib.crc32(chunk), 'data': chunk}
+            if not self.network.send_data(message):
+                stalled = True
+                continue
+            BYTES_SENT.inc(len(chunk))
+            offset += len(chunk)
+
+
+class FileReceiver:
+    """Writes files offered by the peer into a directory
+
+    Data goes to a hidden .part file named after the transfer id, which is
+    renamed into place once complete, as "name (1).ext" and so on if a file
+    of that name is already there. Only verified chunks are written, in
+    order, so a .part file's length is always the offset to resume from.
+    Without a directory every offer is refused.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory
+        # transfer id -> [open .part file, its path, final path, size, offset, offset last asked to send from]
+        self.transfers = {}
+
+    def handle(self, data, allowed=True):
+        """Process a MSG_FILE_OFFER or MSG_FILE_TRANSFER; returns the MSG_FILE_ACK to send back, or None"""
+        if not allowed or self.directory is None:
+            return file_ack(data['transfer'], 0, FILE_REFUSED)
+        if data['type'] == MSG_FILE_OFFER:
+            return self.offer(data)
+        return self.chunk(data)
+
+    def offer(self, data):
+        transfer, size = data['transfer'], data['size']
+        # Only ever a name; the sender does not get to pick the directory
+        name = os.path.basename(data['name'])
+        if name in ('', '.', '..'):
+            return file_ack(transfer, 0, FILE_REFUSED)
+
+        self.discard(transfer)
+        part_path = os.path.join(self.directory, f".{name}.{transfer:016x}.part")
+        f = open(part_path, 'ab')
+        offset = f.tell()
+        if offset > size:
+            f.truncate(0)
+            offset = 0
+        self.transfers[transfer] = [f, part_path, os.path.join(self.directory, name), size, offset, None]
+        if offset:
+            print(f"Resuming {name} at {offset} of {size} bytes")
+        if offset == size:
+            self.finish(transfer)
+        return file_ack(transfer, offset)
+
+    def chunk(self, data):
+        transfer = data['transfer']
+        state = self.transfers.get(transfer)
+        if state is None:
+            return file_ack(transfer, 0, FILE_REFUSED)
+        f, part_path, path, size, offset, asked = state
+        if data['offset'] != offset:
+            # The sender lost track, e.g. of chunks lost with a connection, or
+            # sent this before it rewound. It is told where to send from once;
+            # the chunks it had in flight meanwhile are ignored.
+            if asked == offset:
+                return None
+            state[5] = offset
+            return file_ack(transfer, offset, FILE_REWIND)
+        chunk = data['data']
+        if zlib.crc32(chunk) != data['checksum'] or offset + len(chunk) > size:
+            CHUNKS_REJECTED.inc()
+            state[5] = offset
+            return file_ack(transfer, offset, FILE_BAD_CHUNK)
+
+        f.write(chunk)
+        BYTES_WRITTEN.inc(len(chunk))
+        state[4] = offset = offset + len(chunk)
+        if offset == size:
+            self.finish(transfer)
+        return file_ack(transfer, offset)
+
+    def finish(self, transfer):
+        f, part_path, path, size, _, _ = self.transfers.pop(transfer)
+        f.close()
+        path = free_path(path)
+        os.replace(part_path, path)
+        print(f"Received {os.path.basename(path)} ({size} bytes)")
+
+    def discard(self, transfer):
+        state = self.transfers.pop(transfer, None)
+        if state is not None:
+            state[0].close()
+
+    def close(self):
+        """Close open files; their .part files stay behind for resuming"""
+        for transfer in list(self.transfers):
+            self.discard(transfer)
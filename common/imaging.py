@@ -0,0 +1,651 @@
+import io
+import os
+import time
+import zlib
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import lz4.frame
+import numpy as np
+from PIL import Image
+
+from common.logging_utils import metrics, Timer
+from common.video import VideoEncoder, video_available, video_crf
+
+# Tiling defaults
+DEFAULT_TILE_SIZE = 64
+DEFAULT_KEYFRAME_INTERVAL = 150  # Frames between forced full refreshes
+DEFAULT_ENCODE_WORKERS = min(4, os.cpu_count() or 1)
+
+# Move detection: only tried when at least this many tiles changed, and a
+# moved region must be at least this many lines long to be worth a copy
+MIN_MOVE_TILES = 8
+MIN_MOVE_LINES = 32
+# After a failed search, skip up to this many frames before looking again,
+# so full-motion video does not pay for detection on every frame
+MAX_MOVE_BACKOFF = 8
+
+# Full-motion video: a tile changed in this many encoded frames in a row is
+# in motion. Once at least VIDEO_MIN_TILES such tiles fill VIDEO_MIN_FILL of
+# their bounding box, that box is streamed as video until less than
+# VIDEO_MIN_ACTIVE of it has changed for VIDEO_LINGER seconds.
+VIDEO_AFTER = 10
+VIDEO_MIN_TILES = 32
+VIDEO_MIN_FILL = 0.5
+VIDEO_MIN_ACTIVE = 0.25
+VIDEO_LINGER = 1.0
+
+# Per-tile codecs. Text and UI are sent losslessly, which is both sharper and
+# smaller than JPEG for them; photos and video go out as JPEG.
+TILE_JPEG = 0  # Baseline JPEG with optimized Huffman tables
+TILE_SOLID = 1  # One colour: its BGRX pixel value, little-endian
+TILE_PALETTE = 2  # Colour count - 1, BGRX palette, zlib-compressed 8-bit indices
+TILE_RAW = 3  # LZ4-compressed BGRX, for flat areas with too many colours for a palette
+# Tile cache operations, carrying a content hash instead of pixels; see common.tile_cache
+TILE_CACHED = 4  # Draw the tile cached under this hash
+TILE_STORE = 5  # Cache the canvas area just drawn under this hash
+CACHE_CODECS = (TILE_CACHED, TILE_STORE)
+# One H.264 access unit for the region of a video stream, see common.video.
+# Each depends on the previous one, so they are decoded in order.
+TILE_VIDEO = 6
+# Tiles a receiver handles one after another on its own thread rather than decoding them in parallel
+SEQUENTIAL_CODECS = CACHE_CODECS + (TILE_VIDEO,)
+TILE_CODEC_NAMES = {TILE_JPEG: 'jpeg', TILE_SOLID: 'solid', TILE_PALETTE: 'palette', TILE_RAW: 'raw',
+                    TILE_CACHED: 'cached', TILE_STORE: 'store', TILE_VIDEO: 'video'}
+PALETTE_MAX_COLORS = 256
+# Share of pixels equal to their left neighbour: below the first a tile is
+# photo-like and goes to JPEG; above the second LZ4 copes with any colour count
+LOSSLESS_MIN_REPEAT = 0.5
+RAW_MIN_REPEAT = 0.8
+
+# Odd 64-bit multipliers for hashing lines of pixels; arithmetic wraps mod 2**64
+LINE_HASH_WEIGHTS = np.random.default_rng(0x5eed).integers(1, 2**63, size=4096, dtype=np.uint64) | np.uint64(1)
+
+
+def tile_grid(width, height, tile_size):
+    """Return the number of tile rows and columns covering a frame"""
+    return -(-height // tile_size), -(-width // tile_size)
+
+
+def bgrx_frame(raw, width, height):
+    """Wrap a BGRA/BGRX capture buffer (e.g. mss ScreenShot.raw) as an HxWx4 array without copying"""
+    return np.frombuffer(raw, dtype=np.uint8).reshape(height, width, 4)
+
+
+def downscale(frame, factor):
+    """Cheaply shrink a frame by an integer factor by keeping every factor-th pixel"""
+    if factor <= 1:
+        return frame
+    return np.ascontiguousarray(frame[::factor, ::factor])
+
+
+def dirty_tile_mask(previous, current, tile_size):
+    """Return a (rows, cols) boolean grid of tiles that differ between two BGRX frames"""
+    height, width = current.shape[:2]
+    rows, cols = tile_grid(width, height, tile_size)
+
+    # Compare whole pixels as 32-bit words rather than byte by byte
+    changed = previous.view(np.uint32)[..., 0] != current.view(np.uint32)[..., 0]
+
+    # Pad the per-pixel mask up to a whole number of tiles
+    pad_h, pad_w = rows * tile_size - height, cols * tile_size - width
+    if pad_h or pad_w:
+        changed = np.pad(changed, ((0, pad_h), (0, pad_w)))
+
+    return changed.reshape(rows, tile_size, cols, tile_size).any(axis=(1, 3))
+
+
+def line_hashes(frame, band, axis):
+    """Hash every pixel row (axis 0) or column (axis 1) within each band of the other axis
+
+    Returns an (lines, bands) uint64 array. Only whole bands are hashed; a
+    partial band at the right or bottom edge is ignored.
+    """
+    height, width = frame.shape[:2]
+    pixels = frame.view(np.uint32)[..., 0]
+    if axis == 0:
+        bands = width // band
+        lines = pixels[:, :bands * band].reshape(height, bands, band)
+        return (lines * LINE_HASH_WEIGHTS[:band]).sum(axis=2)
+    bands = height // band
+    lines = pixels[:bands * band].reshape(bands, band, width)
+    return (lines * LINE_HASH_WEIGHTS[:band, None]).sum(axis=1).T
+
+
+def longest_run(flags):
+    """(start, end) of the longest run of True in a 1-D boolean array"""
+    padded = np.concatenate(([False], flags, [False])).astype(np.int8)
+    edges = np.flatnonzero(np.diff(padded))
+    if not len(edges):
+        return 0, 0
+    starts, ends = edges[::2], edges[1::2]
+    best = np.argmax(ends - starts)
+    return int(starts[best]), int(ends[best])
+
+
+def find_shift(previous, current, min_lines):
+    """Find the largest block of lines that moved along the line axis
+
+    previous and current are line_hashes() of two frames. Lines whose hash
+    is unique in the previous frame vote for an offset; blank or repeated
+    lines are too ambiguous to count. Returns (offset, (band start, band
+    end), (line start, line end)) in the current frame, or None.
+    """
+    lines, bands = previous.shape
+    # Tag every hash with its band so bands are matched only with themselves
+    band_ids = np.arange(bands, dtype=np.uint64)
+    prev_keys = (previous ^ (band_ids * np.uint64(0x9E3779B97F4A7C15))).ravel()
+    cur_keys = (current ^ (band_ids * np.uint64(0x9E3779B97F4A7C15))).ravel()
+
+    # Lines whose hash occurs once; sorted needles keep the lookup cache-friendly
+    prev_order = np.argsort(prev_keys)
+    sorted_keys = prev_keys[prev_order]
+    unique = np.ones(len(sorted_keys), dtype=bool)
+    repeated = sorted_keys[1:] == sorted_keys[:-1]
+    unique[1:] &= ~repeated
+    unique[:-1] &= ~repeated
+    keys, first = sorted_keys[unique], prev_order[unique]
+    if not len(keys):
+        return None
+    cur_order = np.argsort(cur_keys)
+    needles = cur_keys[cur_order]
+    pos = np.minimum(np.searchsorted(keys, needles), len(keys) - 1)
+    found = keys[pos] == needles
+    offsets = cur_order[found] // bands - first[pos[found]] // bands
+    offsets = offsets[offsets != 0]
+    if len(offsets) < min_lines:
+        return None
+    votes = np.bincount(offsets + lines)
+    offset = int(np.argmax(votes)) - lines
+    if votes[offset + lines] < min_lines:
+        return None
+
+    # Which lines match at that offset, band by band
+    if offset > 0:
+        matches = current[offset:] == previous[:lines - offset]
+    else:
+        matches = current[:lines + offset] == previous[-offset:]
+    band_start, band_end = longest_run(matches.sum(axis=0) >= min_lines)
+    if band_end == band_start:
+        return None
+    line_start, line_end = longest_run(matches[:, band_start:band_end].all(axis=1))
+    if line_end - line_start < min_lines:
+        return None
+    base = max(offset, 0)
+    return offset, (band_start, band_end), (line_start + base, line_end + base)
+
+
+def find_move(previous, current, band, previous_lines=None, current_lines=None):
+    """Find a region scrolled or dragged straight up/down or left/right
+
+    Returns a copy command (src_x, src_y, x, y, w, h) that turns previous
+    into something closer to current, or None. Candidates are checked pixel
+    for pixel, so a hash collision can only cost a missed copy.
+
+    previous_lines and current_lines are optional {axis: line_hashes()}
+    caches; missing entries are computed and stored, so the current frame's
+    hashes can be reused when it becomes the previous one.
+    """
+    previous_lines = {} if previous_lines is None else previous_lines
+    current_lines = {} if current_lines is None else current_lines
+    for axis in (0, 1):
+        if axis not in previous_lines:
+            previous_lines[axis] = line_hashes(previous, band, axis)
+        if axis not in current_lines:
+            current_lines[axis] = line_hashes(current, band, axis)
+        shift = find_shift(previous_lines[axis], current_lines[axis], MIN_MOVE_LINES)
+        if shift is None:
+            continue
+        offset, (band_start, band_end), (line_start, line_end) = shift
+        if axis == 0:
+            x, w = band_start * band, (band_end - band_start) * band
+            y, h = line_start, line_end - line_start
+            src_x, src_y = x, y - offset
+        else:
+            y, h = band_start * band, (band_end - band_start) * band
+            x, w = line_start, line_end - line_start
+            src_x, src_y = x - offset, y
+        copy = src_x, src_y, x, y, w, h
+        if copy_matches(previous, current, copy):
+            return copy
+    return None
+
+
+def copy_matches(previous, current, copy):
+    """True if the copy's source in previous is pixel for pixel its destination in current"""
+    src_x, src_y, x, y, w, h = copy
+    return np.array_equal(previous[src_y:src_y + h, src_x:src_x + w], current[y:y + h, x:x + w])
+
+
+def apply_copy(frame, copy):
+    """Apply a (src_x, src_y, x, y, w, h) copy command to an HxWxC array in place"""
+    src_x, src_y, x, y, w, h = copy
+    # The regions usually overlap, so read the source out first
+    frame[y:y + h, x:x + w] = frame[src_y:src_y + h, src_x:src_x + w].copy()
+
+
+def tile_rects(mask, tile_size, width, height):
+    """Merge horizontal runs of dirty tiles into (x, y, w, h) rectangles"""
+    rects = []
+    for row, cols in enumerate(mask):
+        y = row * tile_size
+        h = min(tile_size, height - y)
+        col = 0
+        while col < len(cols):
+            if not cols[col]:
+                col += 1
+                continue
+            start = col
+            while col < len(cols) and cols[col]:
+                col += 1
+            x = start * tile_size
+            w = min(col * tile_size, width) - x
+            rects.append((x, y, w, h))
+    return rects
+
+
+def motion_region(motion, tile_size, width, height):
+    """(tile rows, tile cols) slices and (x, y, w, h) of the box around the tiles in full motion
+
+    motion counts, per tile, the encoded frames in a row it changed in.
+    Returns None unless the box is big and busy enough to be worth video.
+    """
+    moving = motion >= VIDEO_AFTER
+    count = np.count_nonzero(moving)
+    if count < VIDEO_MIN_TILES:
+        return None
+    rows, cols = np.flatnonzero(moving.any(axis=1)), np.flatnonzero(moving.any(axis=0))
+    top, bottom, left, right = int(rows[0]), int(rows[-1]) + 1, int(cols[0]), int(cols[-1]) + 1
+    if count < VIDEO_MIN_FILL * (bottom - top) * (right - left):
+        return None
+    x, y = left * tile_size, top * tile_size
+    rect = (x, y, min(right * tile_size, width) - x, min(bottom * tile_size, height) - y)
+    return (slice(top, bottom), slice(left, right)), rect
+
+
+def encode_jpeg(frame, rect, quality):
+    """JPEG encode one (x, y, w, h) region of a BGRX frame
+
+    Pillow reads the region straight out of the frame buffer using the row
+    stride, converting BGRX to RGB as it loads; no intermediate copy is made.
+    """
+    x, y, w, h = rect
+    stride = frame.strides[0]
+    start = y * stride + x * 4
+    end = start + (h - 1) * stride + w * 4
+    region = memoryview(frame).cast('B')[start:end]
+
+    img = Image.frombuffer("RGB", (w, h), region, "raw", "BGRX", stride, 1)
+    buf = io.BytesIO()
+    # Optimized Huffman tables save 40-60% on screen content, far more than LZ4 on top did
+    img.save(buf, format="JPEG", quality=quality, optimize=True)
+    return buf.getvalue()
+
+
+def tile_codec(pixels):
+    """Choose a codec for an HxW uint32 array of BGRX pixels
+
+    Returns (codec, sorted distinct colours), or (TILE_JPEG, None) when the
+    colours were never counted.
+    """
+    # Counting colours means sorting the tile, so flat and photo-like tiles are weeded out first
+    first = pixels[0, 0]
+    if (pixels == first).all():
+        return TILE_SOLID, np.array([first], dtype=np.uint32)
+    height, width = pixels.shape
+    repeats = np.count_nonzero(pixels[:, 1:] == pixels[:, :-1]) / max(height * (width - 1), 1)
+    if repeats < LOSSLESS_MIN_REPEAT:
+        return TILE_JPEG, None
+    colors = np.unique(pixels)
+    if len(colors) <= PALETTE_MAX_COLORS:
+        return TILE_PALETTE, colors
+    if repeats >= RAW_MIN_REPEAT:
+        return TILE_RAW, colors
+    return TILE_JPEG, colors
+
+
+def tile_key(pixels):
+    """8-byte content hash of a tile's pixels, its name in the tile cache"""
+    return hashlib.blake2b(np.ascontiguousarray(pixels), digest_size=8).digest()
+
+
+def encode_lossless(pixels, codec, colors):
+    """Encode a tile picked by tile_codec() for one of the lossless codecs"""
+    if codec == TILE_SOLID:
+        return colors.astype('<u4').tobytes()
+    if codec == TILE_PALETTE:
+        indices = np.searchsorted(colors, pixels).astype(np.uint8)
+        return bytes([len(colors) - 1]) + colors.astype('<u4').tobytes() + zlib.compress(indices.tobytes(), 1)
+    return lz4.frame.compress(pixels.astype('<u4').tobytes())
+
+
+def decode_lossless(codec, data, width, height):
+    """Decode a lossless tile to an HxW uint32 array of BGRX pixels with X set to 0xff"""
+    if codec == TILE_SOLID:
+        pixels = np.full((height, width), np.frombuffer(data, dtype='<u4')[0], dtype=np.uint32)
+    elif codec == TILE_PALETTE:
+        count = data[0] + 1
+        palette = np.frombuffer(data, dtype='<u4', count=count, offset=1)
+        indices = np.frombuffer(zlib.decompress(data[1 + count * 4:]), dtype=np.uint8)
+        pixels = palette[indices].reshape(height, width).astype(np.uint32)
+    elif codec == TILE_RAW:
+        pixels = np.frombuffer(lz4.frame.decompress(data), dtype='<u4').reshape(height, width).astype(np.uint32)
+    else:
+        raise ValueError(f"Not a lossless tile codec: {codec}")
+    # Qt's RGB32 format expects an opaque alpha byte
+    pixels |= np.uint32(0xff000000)
+    return pixels
+
+
+class FrameScaler:
+    """Shrinks a stream of frames by whole factors, resampling only what changed
+
+    Each axis is divided by the largest whole factor that keeps it at least
+    as big as requested, averaging factor x factor blocks. Whole factors keep
+    a scroll by a multiple of the factor an exact shift, so move detection
+    still finds it, and they never leave the viewer with fewer pixels than
+    it displays. Changed tiles are found at the source resolution and only
+    their blocks are recomputed, into a copy of the previous output.
+    """
+
+    def __init__(self, tile_size=DEFAULT_TILE_SIZE):
+        self.tile_size = tile_size
+        self.source = None
+        self.output = None
+
+    def scale(self, frame, width, height):
+        """Return frame shrunk towards width x height; frame itself if no whole factor fits"""
+        frame_height, frame_width = frame.shape[:2]
+        fx, fy = max(frame_width // width, 1), max(frame_height // height, 1)
+        if fx == fy == 1:
+            self.source = self.output = None
+            return frame
+
+        out_width, out_height = -(-frame_width // fx), -(-frame_height // fy)
+        if self.source is None or self.source.shape != frame.shape or self.output.shape[:2] != (out_height, out_width):
+            output = np.empty((out_height, out_width, 4), dtype=np.uint8)
+            rects = [(0, 0, frame_width, frame_height)]
+        else:
+            mask = dirty_tile_mask(self.source, frame, self.tile_size)
+            if not mask.any():
+                return self.output
+            output = self.output.copy()
+            rects = tile_rects(mask, self.tile_size, frame_width, frame_height)
+
+        # Pillow does not know BGRX; channel order does not matter for averaging
+        img = Image.frombuffer("RGBX", (frame_width, frame_height), frame, "raw", "RGBX", frame.strides[0], 1)
+        for x, y, w, h in rects:
+            # Widen to whole blocks
+            left, top = x // fx, y // fy
+            right, bottom = -(-(x + w) // fx), -(-(y + h) // fy)
+            box = (left * fx, top * fy, min(right * fx, frame_width), min(bottom * fy, frame_height))
+            output[top:bottom, left:right] = np.asarray(img.reduce((fx, fy), box=box))
+        self.source, self.output = frame, output
+        return output
+
+
+class DeltaEncoder:
+    """Encodes only the tiles of a frame that changed since the previous one
+
+    Keyframes are made of full-width bands, one per tile row. Bands and dirty
+    tile runs are encoded concurrently; Pillow, zlib and LZ4 release the GIL
+    while encoding, so a thread pool scales across cores. Within a run each
+    tile is classified and sent losslessly or as JPEG, see tile_codec().
+
+    With a tile cache, lossless tiles the receivers already hold are sent as
+    TILE_CACHED references and the others are followed by a TILE_STORE.
+    JPEG tiles are left out: they are mostly video, which never repeats, and
+    hashing them would cost CPU on every frame for nothing.
+
+    Where a large area keeps changing frame after frame, e.g. a video
+    playing, it is streamed as H.264 instead, as one TILE_VIDEO tile per
+    frame it changed in, see motion_region(). Video starts with the frame
+    after the one that found the area, whose access unit is an IDR, and so
+    is that of every keyframe. When the area calms down, or a receiver that
+    cannot decode video turns up, video stops and the area is sent again
+    with the tile codecs.
+    """
+
+    def __init__(self, quality=70, tile_size=DEFAULT_TILE_SIZE,
+                 keyframe_interval=DEFAULT_KEYFRAME_INTERVAL, workers=DEFAULT_ENCODE_WORKERS, detect_moves=True,
+                 video=True):
+        self.quality = quality
+        self.tile_size = tile_size
+        self.keyframe_interval = keyframe_interval
+        self.detect_moves = detect_moves
+        self.previous = None
+        self.previous_lines = {}  # Line hashes of previous, by axis, if move detection made them
+        self.last_move = None
+        self.move_misses = 0
+        self.move_backoff = 0
+        self.frames_since_keyframe = 0
+        self.keyframe_requested = True
+
+        # Full-motion video: per tile, encoded frames in a row it changed in;
+        # the stream of the area in motion, its tiles, and when it was last busy
+        self.use_video = video and video_available()
+        self.motion = None
+        self.video = None
+        self.video_tiles = None
+        self.video_active_at = 0.0
+
+        self.pool = ThreadPoolExecutor(workers, thread_name_prefix="encode") if workers > 1 else None
+        # CPU seconds spent in pool threads; inline encodes count towards the caller's thread
+        self.worker_cpu = 0.0
+        self.worker_cpu_lock = threading.Lock()
+        self.jpeg_time = metrics.histogram('host_jpeg_seconds', 'JPEG encoding one tile run')
+        self.lossless_time = metrics.histogram('host_lossless_seconds', 'Classifying and losslessly encoding one tile')
+        self.tile_counts = {codec: metrics.counter(f'host_tiles_{name}_total', f'Tiles sent as {name}')
+                            for codec, name in TILE_CODEC_NAMES.items()}
+        self.move_time = metrics.histogram('host_move_detect_seconds', 'Looking for scrolled or dragged regions')
+        self.video_time = metrics.histogram('host_video_encode_seconds', 'Encoding one frame of a video region')
+
+    def request_keyframe(self):
+        """Make the next encoded frame a full keyframe"""
+        self.keyframe_requested = True
+
+    def encode(self, frame, cached=None, video=False):
+        """Encode a C-contiguous HxWx4 BGRX frame
+
+        Returns (keyframe, copies, tiles). copies is a list of (src_x, src_y,
+        x, y, w, h) moves within the previous frame, applied before the tiles.
+        tiles is a list of (x, y, w, h, codec, data) with codec one of the
+        TILE_* constants. The frame is kept as the reference for the next
+        call, so callers must hand over a fresh buffer each time rather than
+        reusing one. cached is None to leave the tile cache out, or a function
+        telling whether every receiver holds the tile with a given hash.
+        video says whether every receiver decodes TILE_VIDEO.
+        """
+        copies = []
+        lines = {}
+        video = video and self.use_video
+        height, width = frame.shape[:2]
+        keyframe = (
+            self.keyframe_requested
+            or self.previous is None
+            or self.previous.shape != frame.shape
+            or self.frames_since_keyframe >= self.keyframe_interval
+        )
+
+        if self.previous is not None and self.previous.shape != frame.shape:
+            self.motion = None
+            self._stop_video()
+
+        if keyframe:
+            mask = np.ones(tile_grid(width, height, self.tile_size), dtype=bool)
+            self.keyframe_requested = False
+            self.frames_since_keyframe = 0
+        else:
+            mask = dirty_tile_mask(self.previous, frame, self.tile_size)
+            self.frames_since_keyframe += 1
+
+            # Scrolled or dragged content is copied on the client; only what
+            # the move exposed has to be encoded. Not while video is on: a
+            # copy into its region would not reach the decoder's picture.
+            if self.detect_moves and self.video is None and mask.sum() >= MIN_MOVE_TILES:
+                copy = self._find_move(frame, lines)
+                if copy is not None:
+                    reference = self.previous.copy()
+                    apply_copy(reference, copy)
+                    mask = dirty_tile_mask(reference, frame, self.tile_size)
+                    copies.append(copy)
+
+            # Motion is what is left once moves are accounted for: scrolling is not video
+            if self.use_video:
+                self.motion = np.where(mask, (0 if self.motion is None else self.motion) + 1, 0)
+
+        tiles = self._encode_video(frame, mask, keyframe, video)
+        tiles += self._encode_rects(frame, tile_rects(mask, self.tile_size, width, height), cached)
+        if video and not keyframe:
+            self._find_video(frame)
+        self.previous = frame
+        self.previous_lines = lines
+        return keyframe, copies, tiles
+
+    @property
+    def video_active(self):
+        return self.video is not None
+
+    def _encode_video(self, frame, mask, keyframe, video):
+        """The video region's tile, if it changed; its tiles are taken out of mask"""
+        if self.video is None:
+            return []
+        tiles = self.video_tiles
+        if np.count_nonzero(self.motion[tiles]) >= VIDEO_MIN_ACTIVE * self.motion[tiles].size:
+            self.video_active_at = time.monotonic()
+        if not video or time.monotonic() - self.video_active_at > VIDEO_LINGER:
+            # Back to the tile codecs, which redraw the whole area
+            self._stop_video()
+            mask[tiles] = True
+            return []
+
+        changed = keyframe or mask[tiles].any()
+        mask[tiles] = False
+        if not changed:
+            return []
+        rect = self.video.rect
+        with Timer(self.video_time):
+            if video_crf(self.quality) != self.video.crf:
+                # x264 cannot change its rate factor on the fly; the new stream starts with an IDR
+                self.video = VideoEncoder(rect, self.quality)
+            data = self.video.encode(frame, intra=keyframe)
+        self.tile_counts[TILE_VIDEO].inc()
+        return [rect + (TILE_VIDEO, data)]
+
+    def _find_video(self, frame):
+        """Start streaming the area in full motion as video from the next frame, unless it already is"""
+        height, width = frame.shape[:2]
+        region = motion_region(self.motion, self.tile_size, width, height)
+        if region is None:
+            return
+        tiles, rect = region
+        if self.video is not None:
+            if rect == self.video.rect:
+                return
+            old_tiles = self.video_tiles
+            covered = (tiles[0].start <= old_tiles[0].start and old_tiles[0].stop <= tiles[0].stop
+                       and tiles[1].start <= old_tiles[1].start and old_tiles[1].stop <= tiles[1].stop)
+            if not covered:
+                # The motion moved rather than grew; the old region calms down on its own
+                return
+            self.video.close()
+        self.video = VideoEncoder(rect, self.quality)
+        self.video_tiles = tiles
+        self.video_active_at = time.monotonic()
+
+    def _stop_video(self):
+        if self.video is not None:
+            self.video.close()
+            self.video = None
+
+    def _find_move(self, frame, lines):
+        if self.move_backoff:
+            self.move_backoff -= 1
+            return None
+        with Timer(self.move_time):
+            # Scrolling usually keeps going the same way at the same speed
+            if self.last_move is not None and copy_matches(self.previous, frame, self.last_move):
+                return self.last_move
+            copy = find_move(self.previous, frame, self.tile_size, self.previous_lines, lines)
+        self.last_move = copy
+        if copy is None:
+            self.move_misses += 1
+            self.move_backoff = min(self.move_misses, MAX_MOVE_BACKOFF)
+        else:
+            self.move_misses = 0
+        return copy
+
+    def keyframe(self, frame, cached=None):
+        """Encode all of frame without touching the delta state
+
+        Used to resynchronise a single viewer with the frame just passed to
+        encode(), while everyone else keeps receiving deltas. Video frames
+        depend on the ones before them, so while a video region is active a
+        viewer can only be resynced with request_keyframe().
+        """
+        height, width = frame.shape[:2]
+        mask = np.ones(tile_grid(width, height, self.tile_size), dtype=bool)
+        return self._encode_rects(frame, tile_rects(mask, self.tile_size, width, height), cached)
+
+    def _encode_rects(self, frame, rects, cached=None):
+        quality = self.quality
+        tile_size = self.tile_size
+
+        def encode_jpeg_timed(rect):
+            start = time.perf_counter()
+            tile = rect + (TILE_JPEG, encode_jpeg(frame, rect, quality))
+            self.jpeg_time.observe(time.perf_counter() - start)
+            return tile
+
+        def encode_rect(rect):
+            # Each tile of the run gets its own codec; neighbouring JPEG tiles
+            # are encoded together, as one image costs less than several
+            x, y, w, h = rect
+            tiles = []
+            jpeg_start = None
+            for tile_x in range(x, x + w, tile_size):
+                start = time.perf_counter()
+                tile_w = min(tile_size, x + w - tile_x)
+                pixels = frame[y:y + h, tile_x:tile_x + tile_w].view(np.uint32)[..., 0]
+                codec, colors = tile_codec(pixels)
+                if codec == TILE_JPEG:
+                    if jpeg_start is None:
+                        jpeg_start = tile_x
+                    continue
+                if jpeg_start is not None:
+                    tiles.append(encode_jpeg_timed((jpeg_start, y, tile_x - jpeg_start, h)))
+                    jpeg_start = None
+                # A solid tile is smaller than its hash
+                key = tile_key(pixels) if cached is not None and codec != TILE_SOLID else None
+                if key is not None and cached(key):
+                    tiles.append((tile_x, y, tile_w, h, TILE_CACHED, key))
+                else:
+                    tiles.append((tile_x, y, tile_w, h, codec, encode_lossless(pixels, codec, colors)))
+                    if key is not None:
+                        tiles.append((tile_x, y, tile_w, h, TILE_STORE, key))
+                self.lossless_time.observe(time.perf_counter() - start)
+            if jpeg_start is not None:
+                tiles.append(encode_jpeg_timed((jpeg_start, y, x + w - jpeg_start, h)))
+            return tiles
+
+        def encode_rect_timed(rect):
+            cpu_start = time.thread_time()
+            tiles = encode_rect(rect)
+            with self.worker_cpu_lock:
+                self.worker_cpu += time.thread_time() - cpu_start
+            return tiles
+
+        if self.pool is not None and len(rects) > 1:
+            runs = list(self.pool.map(encode_rect_timed, rects))
+        else:
+            runs = [encode_rect(rect) for rect in rects]
+        tiles = [tile for run in runs for tile in run]
+        for tile in tiles:
+            self.tile_counts[tile[4]].inc()
+        return tiles
+
+    def close(self):
+        self._stop_video()
+        if self.pool is not None:
+            self.pool.shutdown(wait=False)
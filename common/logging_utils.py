@@ -0,0 +1,228 @@
+import os
+import time
+import bisect
+import threading
+import socketserver
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Histogram bucket upper bounds in seconds, from 100 us to 1 s
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+DEFAULT_STATS_INTERVAL = 10.0
+
+
+class Counter:
+    """Monotonic count, e.g. bytes or messages"""
+
+    def __init__(self, name, help_text=''):
+        self.name = name
+        self.help = help_text
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+
+class Histogram:
+    """Durations in fixed buckets; recording is a bisect and three additions"""
+
+    def __init__(self, name, help_text='', buckets=BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, seconds):
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self.lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += seconds
+
+    def snapshot(self):
+        with self.lock:
+            return list(self.counts), self.count, self.sum
+
+
+def quantile(buckets, counts, q):
+    """Estimate a quantile from bucket counts by interpolating inside the bucket"""
+    total = sum(counts)
+    if not total:
+        return None
+    rank = q * total
+    seen = 0
+    for index, count in enumerate(counts):
+        if seen + count >= rank and count:
+            lower = buckets[index - 1] if index else 0.0
+            upper = buckets[index] if index < len(buckets) else buckets[-1]
+            return lower + (upper - lower) * (rank - seen) / count
+        seen += count
+    return buckets[-1]
+
+
+class Timer:
+    """Context manager adding the time spent in its block to a histogram"""
+
+    __slots__ = ('histogram', 'start')
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+class Metrics:
+    """Named counters and histograms, created on first use
+
+    Names are Prometheus-style: histograms are stage durations in seconds,
+    counters end in _total.
+    """
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    def counter(self, name, help_text=''):
+        metric = self.counters.get(name)
+        if metric is None:
+            with self.lock:
+                metric = self.counters.setdefault(name, Counter(name, help_text))
+        return metric
+
+    def histogram(self, name, help_text=''):
+        metric = self.histograms.get(name)
+        if metric is None:
+            with self.lock:
+                metric = self.histograms.setdefault(name, Histogram(name, help_text))
+        return metric
+
+    def timer(self, name, help_text=''):
+        return Timer(self.histogram(name, help_text))
+
+    def snapshot(self):
+        """{'counters': {name: value}, 'histograms': {name: (counts, count, sum)}}"""
+        return {
+            'counters': {name: c.value for name, c in list(self.counters.items())},
+            'histograms': {name: h.snapshot() for name, h in list(self.histograms.items())},
+        }
+
+    def summary(self, since=None):
+        """Per-metric lines of counts, mean and p95, for the window since an earlier snapshot"""
+        now = self.snapshot()
+        since = since or {'counters': {}, 'histograms': {}}
+        lines = []
+        for name, (counts, count, total) in sorted(now['histograms'].items()):
+            old_counts, old_count, old_total = since['histograms'].get(name, ([0] * len(counts), 0, 0.0))
+            window = [new - old for new, old in zip(counts, old_counts)]
+            n = count - old_count
+            if not n:
+                continue
+            p95 = quantile(self.histograms[name].buckets, window, 0.95)
+            lines.append(f"{name} n={n} mean={(total - old_total) / n * 1000:.2f}ms p95={p95 * 1000:.2f}ms")
+        for name, value in sorted(now['counters'].items()):
+            delta = value - since['counters'].get(name, 0)
+            if delta:
+                lines.append(f"{name} +{delta}")
+        return lines, now
+
+    def prometheus_text(self):
+        """All metrics in the Prometheus text exposition format"""
+        out = []
+        for name, counter in sorted(list(self.counters.items())):
+            out.append(f"# HELP {name} {counter.help}")
+            out.append(f"# TYPE {name} counter")
+            out.append(f"{name} {counter.value}")
+        for name, histogram in sorted(list(self.histograms.items())):
+            counts, count, total = histogram.snapshot()
+            out.append(f"# HELP {name} {histogram.help}")
+            out.append(f"# TYPE {name} histogram")
+            cumulative = 0
+            for bound, bucket_count in zip(histogram.buckets + ('+Inf',), counts):
+                cumulative += bucket_count
+                out.append(f'{name}_bucket{{le="{bound}"}} {cumulative}')
+            out.append(f"{name}_sum {total}")
+            out.append(f"{name}_count {count}")
+        return '\n'.join(out) + '\n'
+
+
+# Process-wide registry used by the host, client and network code
+metrics = Metrics()
+
+
+class StatsLogger:
+    """Prints one line with every stage's timings and counters each interval"""
+
+    def __init__(self, registry=metrics, interval=DEFAULT_STATS_INTERVAL, prefix="stats"):
+        self.registry = registry
+        self.interval = interval
+        self.prefix = prefix
+        self.stopped = threading.Event()
+
+    def start(self):
+        threading.Thread(target=self.run, daemon=True).start()
+        return self
+
+    def run(self):
+        last = self.registry.snapshot()
+        while not self.stopped.wait(self.interval):
+            lines, last = self.registry.summary(last)
+            if lines:
+                print(f"[{self.prefix}] " + " | ".join(lines))
+
+    def stop(self):
+        self.stopped.set()
+
+
+class _MetricsHTTPHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = self.server.registry.prometheus_text().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes every few seconds would drown the console
+        pass
+
+
+class _MetricsUnixHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        self.request.sendall(self.server.registry.prometheus_text().encode())
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def start_metrics_server(address, registry=metrics):
+    """Serve Prometheus text on 'host:port' (HTTP) or 'unix:/path' (one dump per connection)
+
+    Returns the server; call shutdown() on it to stop. Bind to localhost
+    unless the metrics are meant to be visible on the network.
+    """
+    if address.startswith('unix:'):
+        path = address[len('unix:'):]
+        if os.path.exists(path):
+            os.unlink(path)
+        server = _UnixServer(path, _MetricsUnixHandler)
+    else:
+        host, _, port = address.rpartition(':')
+        server = ThreadingHTTPServer((host or '127.0.0.1', int(port)), _MetricsHTTPHandler)
+        server.daemon_threads = True
+    server.registry = registry
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Metrics available at {address}")
+    return server
@@ -1,13 +1,49 @@
 import socket
 import struct
-import pickle
 import ssl
-from cryptography.fernet import Fernet
+import time
+import heapq
+import itertools
+import threading
+
+try:
+    import fcntl
+    import termios
+    TIOCOUTQ = termios.TIOCOUTQ
+except (ImportError, AttributeError):
+    TIOCOUTQ = None  # Not available on this platform
+
+from common.encryption import SessionCipher, generate_key, resume_proof, resumed_cipher, TAG_SIZE
+from common.logging_utils import metrics
 
 # Constants
 DEFAULT_PORT = 9999
-BUFFER_SIZE = 4096
+RECV_BUFFER_SIZE = 64 * 1024  # Initial size of the per-connection receive buffer
 AUTH_KEY = "remote_control_auth_key_2025"  # Simple authentication key for MVP
+# How long the host holds the session of a viewer whose connection failed,
+# and how long the viewer keeps trying to resume it
+RESUME_TIMEOUT = 30
+RESUME_RETRY_MIN = 0.05
+RESUME_RETRY_MAX = 1.0
+
+# Wire framing: every message is a fixed header followed by an AEAD-sealed payload.
+# The header is authenticated as associated data, so it cannot be altered either.
+PROTOCOL_VERSION = 2
+HEADER = struct.Struct("!BBBBI")  # version, message type, flags, channel, payload length
+FLAG_ENCRYPTED = 0x01
+FLAG_MORE = 0x02  # The payload continues in the next chunk on the same channel
+
+# Logical channels sharing the connection. Payloads over CHUNK_SIZE are sent
+# in pieces, and between pieces the lowest-numbered channel waiting goes first,
+# so input and the pointer never queue behind a whole keyframe.
+CHANNEL_CONTROL = 0  # Auth, input, acks and requests
+CHANNEL_CURSOR = 1
+CHANNEL_FRAMES = 2
+CHANNEL_BULK = 3  # Transfers that can take whatever bandwidth is left
+CHUNK_SIZE = 16 * 1024
+# Unsent bytes the kernel may hold per socket; more waits in the sender, where
+# it can still be overtaken, instead of in a socket buffer, where it cannot
+SEND_LOW_WATER = 32 * 1024
 
 # Message types
 MSG_AUTH = 0
@@ -16,7 +52,332 @@ MSG_MOUSE_MOVE = 2
 MSG_MOUSE_CLICK = 3
 MSG_KEY_PRESS = 4
 MSG_KEY_RELEASE = 5
-MSG_FILE_TRANSFER = 6  # Optional enhancement
+MSG_FILE_TRANSFER = 6
+MSG_FRAME_DELTA = 7
+MSG_KEYFRAME_REQUEST = 8
+MSG_FRAME_ACK = 9
+MSG_INPUT_BATCH = 10
+MSG_CURSOR = 11
+MSG_CURSOR_SHAPE = 12
+MSG_VIEWPORT = 13
+MSG_TILE_CACHE = 14
+MSG_FILE_OFFER = 15
+MSG_FILE_ACK = 16
+MSG_MONITORS = 17
+MSG_MONITOR_SELECT = 18
+MSG_SESSION = 19
+MSG_RESUME = 20
+MSG_LEAVE = 21
+MSG_VIDEO = 22
+
+# Payload layouts: message type -> (fixed fields struct, fixed field names, variable fields).
+# Variable fields follow the fixed part, each prefixed with a 4-byte length.
+MESSAGE_LAYOUTS = {
+    MSG_AUTH: (struct.Struct("!"), (), (('key', 'str'),)),
+    MSG_FRAME: (struct.Struct("!HH"), ('width', 'height'), (('data', 'bytes'),)),
+    MSG_MOUSE_MOVE: (struct.Struct("!ff"), ('x', 'y'), ()),
+    MSG_MOUSE_CLICK: (struct.Struct("!ffB"), ('x', 'y', 'clicks'), (('button', 'str'),)),
+    MSG_KEY_PRESS: (struct.Struct("!"), (), (('key', 'str'),)),
+    MSG_KEY_RELEASE: (struct.Struct("!"), (), (('key', 'str'),)),
+    # captured: host wall-clock time of the capture, for glass-to-glass latency.
+    # copies move regions of the previous image and are applied before the tiles.
+    # cache_reset: empty the tile cache before applying; the host emptied its copy too.
+    MSG_FRAME_DELTA: (struct.Struct("!IHH??d"), ('seq', 'width', 'height', 'keyframe', 'cache_reset', 'captured'),
+                      (('copies', 'copies'), ('tiles', 'tiles'))),
+    MSG_KEYFRAME_REQUEST: (struct.Struct("!"), (), ()),
+    MSG_FRAME_ACK: (struct.Struct("!I"), ('seq',), ()),
+    MSG_INPUT_BATCH: (struct.Struct("!"), (), (('events', 'messages'),)),
+    # Pointer hotspot as a fraction of the screen; shape 0 means hidden
+    MSG_CURSOR: (struct.Struct("!ffQ"), ('x', 'y', 'shape'), ()),
+    # pixels: LZ4-compressed straight-alpha BGRA, sent once per shape hash
+    MSG_CURSOR_SHAPE: (struct.Struct("!QHHHH"), ('shape', 'width', 'height', 'hot_x', 'hot_y'),
+                       (('pixels', 'bytes'),)),
+    # Viewer's display size in pixels and the part of the screen it shows, as fractions
+    MSG_VIEWPORT: (struct.Struct("!HHffff"), ('width', 'height', 'x', 'y', 'w', 'h'), ()),
+    # Viewer keeps decoded tiles by content hash in this many bytes; 0 turns the cache off
+    MSG_TILE_CACHE: (struct.Struct("!Q"), ('budget',), ()),
+    # File transfers, see common.file_transfer. A chunk's checksum is the CRC-32 of its data.
+    MSG_FILE_OFFER: (struct.Struct("!QQ"), ('transfer', 'size'), (('name', 'str'),)),
+    MSG_FILE_TRANSFER: (struct.Struct("!QQI"), ('transfer', 'offset', 'checksum'), (('data', 'bytes'),)),
+    MSG_FILE_ACK: (struct.Struct("!QQB"), ('transfer', 'offset', 'status'), ()),
+    # Host's monitors as (left, top, width, height) on its desktop, and the one being sent to this viewer
+    MSG_MONITORS: (struct.Struct("!B"), ('monitor',), (('monitors', 'monitors'),)),
+    # Viewer wants to watch another monitor, by index into MSG_MONITORS
+    MSG_MONITOR_SELECT: (struct.Struct("!B"), ('monitor',), ()),
+    # Host's answer to MSG_AUTH, or to MSG_RESUME when it resumed the session: the token to resume it with
+    MSG_SESSION: (struct.Struct("!?"), ('resumed',), (('token', 'bytes'),)),
+    # Instead of MSG_AUTH, on a new connection: carry on the session, whose last frame applied was seq.
+    # proof is common.encryption.resume_proof of the session's secret and this connection's key.
+    MSG_RESUME: (struct.Struct("!I"), ('seq',), (('token', 'bytes'), ('proof', 'bytes'))),
+    # Viewer is closing the connection on purpose; the session ends rather than waiting to be resumed
+    MSG_LEAVE: (struct.Struct("!"), (), ()),
+    # Viewer decodes TILE_VIDEO tiles in this codec, see common.video
+    MSG_VIDEO: (struct.Struct("!"), (), (('codec', 'str'),)),
+}
+
+# Channel per message type; anything not listed is control
+MESSAGE_CHANNELS = {
+    MSG_CURSOR: CHANNEL_CURSOR,
+    MSG_CURSOR_SHAPE: CHANNEL_CURSOR,
+    MSG_FRAME: CHANNEL_FRAMES,
+    MSG_FRAME_DELTA: CHANNEL_FRAMES,
+    MSG_FILE_TRANSFER: CHANNEL_BULK,
+}
+
+LENGTH = struct.Struct("!I")
+TILE = struct.Struct("!HHHHBI")  # x, y, width, height, codec, data length
+COPY = struct.Struct("!HHHHHH")  # src_x, src_y, x, y, width, height
+NESTED = struct.Struct("!BI")  # message type, payload length
+MONITOR = struct.Struct("!iiHH")  # left, top, width, height
+
+
+def _pack_tiles(tiles):
+    parts = [LENGTH.pack(len(tiles))]
+    for x, y, w, h, codec, data in tiles:
+        parts.append(TILE.pack(x, y, w, h, codec, len(data)))
+        parts.append(data)
+    return b''.join(parts)
+
+
+def _unpack_tiles(buf):
+    count, = LENGTH.unpack_from(buf, 0)
+    offset = LENGTH.size
+    tiles = []
+    for _ in range(count):
+        x, y, w, h, codec, size = TILE.unpack_from(buf, offset)
+        offset += TILE.size
+        tiles.append((x, y, w, h, codec, buf[offset:offset + size]))
+        offset += size
+    return tiles
+
+
+def _pack_copies(copies):
+    return LENGTH.pack(len(copies)) + b''.join(COPY.pack(*copy) for copy in copies)
+
+
+def _unpack_copies(buf):
+    count, = LENGTH.unpack_from(buf, 0)
+    return [COPY.unpack_from(buf, LENGTH.size + i * COPY.size) for i in range(count)]
+
+
+def _pack_monitors(monitors):
+    return LENGTH.pack(len(monitors)) + b''.join(MONITOR.pack(*monitor) for monitor in monitors)
+
+
+def _unpack_monitors(buf):
+    count, = LENGTH.unpack_from(buf, 0)
+    return [MONITOR.unpack_from(buf, LENGTH.size + i * MONITOR.size) for i in range(count)]
+
+
+def _pack_messages(messages):
+    parts = [LENGTH.pack(len(messages))]
+    for message in messages:
+        msg_type, payload = encode_message(message)
+        parts.append(NESTED.pack(msg_type, len(payload)))
+        parts.append(payload)
+    return b''.join(parts)
+
+
+def _unpack_messages(buf):
+    count, = LENGTH.unpack_from(buf, 0)
+    offset = LENGTH.size
+    messages = []
+    for _ in range(count):
+        msg_type, size = NESTED.unpack_from(buf, offset)
+        offset += NESTED.size
+        messages.append(decode_message(msg_type, buf[offset:offset + size]))
+        offset += size
+    return messages
+
+
+# Variable field kinds: name -> (pack, unpack). Binary fields decode to memoryviews
+# over the decrypted payload, so they are never copied out of it.
+FIELD_CODECS = {
+    'bytes': (bytes, memoryview),
+    'str': (lambda value: value.encode('utf-8'), lambda buf: str(buf, 'utf-8')),
+    'tiles': (_pack_tiles, _unpack_tiles),
+    'copies': (_pack_copies, _unpack_copies),
+    'messages': (_pack_messages, _unpack_messages),
+    'monitors': (_pack_monitors, _unpack_monitors),
+}
+
+
+def encode_message(data):
+    """Serialize a message dict into (message type, payload bytes)"""
+    msg_type = data['type']
+    fixed, names, variable = MESSAGE_LAYOUTS[msg_type]
+
+    parts = [fixed.pack(*(data[name] for name in names))]
+    for name, kind in variable:
+        value = FIELD_CODECS[kind][0](data[name])
+        parts.append(LENGTH.pack(len(value)))
+        parts.append(value)
+    return msg_type, b''.join(parts)
+
+
+def decode_message(msg_type, payload):
+    """Deserialize a payload back into a message dict"""
+    layout = MESSAGE_LAYOUTS.get(msg_type)
+    if layout is None:
+        raise ValueError(f"Unknown message type {msg_type}")
+    fixed, names, variable = layout
+
+    buf = memoryview(payload)
+    data = dict(zip(names, fixed.unpack_from(buf, 0)))
+    data['type'] = msg_type
+
+    offset = fixed.size
+    for name, kind in variable:
+        size, = LENGTH.unpack_from(buf, offset)
+        offset += LENGTH.size
+        data[name] = FIELD_CODECS[kind][1](buf[offset:offset + size])
+        offset += size
+    return data
+
+
+def split_payload(payload, size=CHUNK_SIZE):
+    """Cut a serialized payload into the pieces sent as separate chunks"""
+    if len(payload) <= size:
+        return [payload]
+    view = memoryview(payload)
+    return [view[start:start + size] for start in range(0, len(payload), size)]
+
+
+def seal_message(cipher, msg_type, payload, channel=CHANNEL_CONTROL, more=False):
+    """Frame and encrypt a serialized payload or chunk; must be sent in the order sealed"""
+    # Prepare header; the ciphertext is the payload plus the AEAD tag
+    flags = FLAG_ENCRYPTED | (FLAG_MORE if more else 0)
+    header = HEADER.pack(PROTOCOL_VERSION, msg_type, flags, channel, len(payload) + TAG_SIZE)
+
+    # Encrypt the data, authenticating the header alongside it
+    return header + cipher.encrypt(payload, header)
+
+
+def parse_header(header):
+    """Validate a message header and return (message type, channel, more chunks follow, payload length)"""
+    version, msg_type, flags, channel, data_size = HEADER.unpack(header)
+    if version != PROTOCOL_VERSION:
+        raise ConnectionError(f"Unsupported protocol version {version}")
+    # Plaintext messages are never accepted
+    if not flags & FLAG_ENCRYPTED:
+        raise ConnectionError("Unencrypted message rejected")
+    return msg_type, channel, bool(flags & FLAG_MORE), data_size
+
+
+class ChunkAssembler:
+    """Joins the chunks of messages split by the sender; one message per channel is in progress at a time"""
+
+    def __init__(self):
+        self.partial = {}  # channel -> (message type, decrypted chunks so far)
+
+    def add(self, msg_type, channel, more, plaintext):
+        """Take one decrypted chunk; returns the message once its last chunk is in, else None"""
+        pending = self.partial.get(channel)
+        if pending is None:
+            if not more:
+                return decode_message(msg_type, plaintext)
+            pending = self.partial[channel] = (msg_type, [])
+        elif pending[0] != msg_type:
+            raise ConnectionError(f"Chunk of message type {msg_type} inside a {pending[0]} on channel {channel}")
+        pending[1].append(plaintext)
+        if more:
+            return None
+        del self.partial[channel]
+        return decode_message(msg_type, b''.join(pending[1]))
+
+
+class PriorityLock:
+    """Mutex that is handed to the waiter with the lowest priority number, FIFO among equals"""
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.waiting = []  # Heap of (priority, ticket)
+        self.tickets = itertools.count()
+        self.held = False
+
+    def acquire(self, priority):
+        with self.cond:
+            entry = (priority, next(self.tickets))
+            heapq.heappush(self.waiting, entry)
+            self.cond.wait_for(lambda: not self.held and self.waiting[0] == entry)
+            heapq.heappop(self.waiting)
+            self.held = True
+
+    def release(self):
+        with self.cond:
+            self.held = False
+            self.cond.notify_all()
+
+
+def limit_unsent(sock):
+    """Keep at most SEND_LOW_WATER unsent bytes queued in the kernel for sock, where supported"""
+    option = getattr(socket, 'TCP_NOTSENT_LOWAT', None)
+    if option is not None:
+        try:
+            sock.setsockopt(socket.IPPROTO_TCP, option, SEND_LOW_WATER)
+        except OSError:
+            pass
+
+
+def shutdown(sock):
+    """Stop both directions of sock, waking any thread blocked on it; it may already be gone"""
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+
+
+class ReceiveBuffer:
+    """Reusable, growable buffer that sockets read into with recv_into
+
+    A connection reads every message into the same memory, so steady-state
+    receiving allocates nothing until a message larger than any before it
+    arrives. Views returned by read_exactly are only valid until the next read.
+    """
+
+    def __init__(self, size=RECV_BUFFER_SIZE):
+        self.buffer = bytearray(size)
+        self.view = memoryview(self.buffer)
+        self.allocations = 1
+        self.reuses = 0
+        self.recv_calls = 0
+        self.bytes_received = 0
+
+    def reserve(self, size):
+        """Make sure the buffer can hold size bytes"""
+        if size <= len(self.buffer):
+            self.reuses += 1
+            return
+        # Grow geometrically so a slowly growing frame size reallocates rarely.
+        # A fresh bytearray is needed because the old one is exported to views.
+        self.view.release()
+        self.buffer = bytearray(max(size, 2 * len(self.buffer)))
+        self.view = memoryview(self.buffer)
+        self.allocations += 1
+
+    def read_exactly(self, sock, size, offset=0):
+        """Fill buffer[offset:offset + size] from sock; None if closed before any byte"""
+        end = offset + size
+        pos = offset
+        while pos < end:
+            n = sock.recv_into(self.view[pos:end])
+            self.recv_calls += 1
+            if not n:
+                if pos == offset:
+                    return None
+                raise ConnectionError("Connection closed while receiving data")
+            pos += n
+        self.bytes_received += size
+        return self.view[offset:end]
+
+    def stats(self):
+        return {
+            'capacity': len(self.buffer),
+            'allocations': self.allocations,
+            'reuses': self.reuses,
+            'recv_calls': self.recv_calls,
+            'bytes_received': self.bytes_received,
+        }
 
 
 class NetworkManager:
@@ -27,11 +388,38 @@ class NetworkManager:
         self.use_ssl = use_ssl
         self.socket = None
         self.client_socket = None
-        self.encryption_key = Fernet.generate_key()
-        self.cipher = Fernet(self.encryption_key)
-
-    def start_server(self, host='0.0.0.0', port=DEFAULT_PORT):
-        """Start a server socket to listen for connections"""
+        self.address = None
+        self.encryption_key = generate_key()
+        self.cipher = SessionCipher(self.encryption_key, is_server)
+        # Nonces are implicit counters, so encrypt + send must not interleave;
+        # the lock goes to the most urgent channel waiting for it
+        self.send_lock = PriorityLock()
+        # Each channel sends one message at a time, so its chunks arrive in order
+        self.channel_locks = [threading.Lock() for _ in range(CHANNEL_BULK + 1)]
+        self.recv_buffer = ReceiveBuffer()
+        self.assembler = ChunkAssembler()
+
+        # Where the client connected and the session the host gave it, to resume after a failure
+        self.peer = None
+        self.session_token = None
+        self.session_secret = None
+        # Whether close() was called, and whether the peer closed the connection instead
+        self.closed = False
+        self.peer_closed = False
+
+        # Per-stage timings, shared by every connection on the same side
+        role = 'host' if is_server else 'client'
+        self.serialize_time = metrics.histogram(f'{role}_serialize_seconds', 'Encoding a message to bytes')
+        self.encrypt_time = metrics.histogram(f'{role}_encrypt_seconds', 'Sealing a message')
+        self.socket_send_time = metrics.histogram(f'{role}_socket_send_seconds', 'sendall of one message or chunk')
+        self.socket_recv_time = metrics.histogram(f'{role}_socket_recv_seconds',
+                                                  'Reading a payload once its header arrived')
+        self.decrypt_time = metrics.histogram(f'{role}_decrypt_seconds', 'Opening and decoding a message')
+        self.bytes_sent = metrics.counter(f'{role}_bytes_sent_total', 'Bytes written to sockets')
+        self.bytes_received = metrics.counter(f'{role}_bytes_received_total', 'Bytes read from sockets')
+
+    def listen(self, host='0.0.0.0', port=DEFAULT_PORT, backlog=1):
+        """Bind a server socket and listen for connections"""
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
 
@@ -42,15 +430,35 @@ class NetworkManager:
             self.socket = context.wrap_socket(self.socket, server_side=True)
 
         self.socket.bind((host, port))
-        self.socket.listen(1)
+        self.socket.listen(backlog)
         print(f"Server started on {host}:{port}")
+        return True
 
-        # Accept client connection
-        self.client_socket, addr = self.socket.accept()
-        print(f"Connection from {addr}")
+    def accept(self):
+        """Accept one client and return a NetworkManager for that connection alone
+
+        Each accepted connection gets its own session key, so any number of
+        clients can be served from one listening socket.
+        """
+        conn = NetworkManager(is_server=True, use_ssl=self.use_ssl)
+        conn.client_socket, conn.address = self.socket.accept()
+        # Small messages (pointer, input, acks) must not wait for Nagle
+        conn.client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        limit_unsent(conn.client_socket)
+        print(f"Connection from {conn.address}")
 
         # Send encryption key
-        self._send_raw(self.encryption_key)
+        conn._send_raw(conn.encryption_key)
+        return conn
+
+    def start_server(self, host='0.0.0.0', port=DEFAULT_PORT):
+        """Start a server socket and accept a single client connection"""
+        self.listen(host, port)
+
+        # Accept client connection
+        conn = self.accept()
+        self.client_socket = conn.client_socket
+        self.encryption_key, self.cipher = conn.encryption_key, conn.cipher
 
         return True
 
@@ -58,6 +466,8 @@ class NetworkManager:
         """Connect to a remote host"""
         try:
             self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            limit_unsent(self.socket)
 
             # Apply SSL if needed (optional enhancement)
             if self.use_ssl:
@@ -67,11 +477,12 @@ class NetworkManager:
                 self.socket = context.wrap_socket(self.socket)
 
             self.socket.connect((host, port))
+            self.peer = (host, port)
             print(f"Connected to {host}:{port}")
 
             # Receive encryption key
             self.encryption_key = self._recv_raw()
-            self.cipher = Fernet(self.encryption_key)
+            self.cipher = SessionCipher(self.encryption_key, self.is_server)
 
             return True
         except Exception as e:
@@ -79,20 +490,90 @@ class NetworkManager:
             return False
 
     def authenticate(self, key=AUTH_KEY):
-        """Send authentication to the server"""
+        """Send authentication to the server and wait for its session
+
+        On the server, returns the client's MSG_AUTH if the key is right, or
+        its MSG_RESUME for the host to check against the session; else None.
+        """
         if self.is_server:
             # Server receives authentication
             data = self.receive_data()
-            if data['type'] == MSG_AUTH and data['key'] == AUTH_KEY:
-                return True
-            return False
+            if data and data['type'] == MSG_AUTH and data['key'] == AUTH_KEY:
+                return data
+            if data and data['type'] == MSG_RESUME:
+                return data
+            return None
         else:
-            # Client sends authentication
-            self.send_data({'type': MSG_AUTH, 'key': key})
+            # Client sends authentication; the host answers with the session's token, or hangs up
+            if not self.send_data({'type': MSG_AUTH, 'key': key}):
+                return False
+            data = self.receive_data()
+            if not data or data['type'] != MSG_SESSION:
+                return False
+            self.session_token = bytes(data['token'])
+            self.session_secret = self.encryption_key
             return True
 
+    def resume(self, seq, timeout=RESUME_TIMEOUT):
+        """Reconnect to the host after the connection failed and carry on the same session
+
+        seq is the last frame the client applied; the host resends what it
+        sent after that, or a keyframe. No new authentication is needed: the
+        client proves it holds the session's secret, and the new connection
+        is encrypted with a key derived from it. Retries with growing pauses
+        until timeout; False if the host could not be reached or no longer
+        holds the session.
+        """
+        # Closed by us, or by the host ending the session: nothing to resume
+        if self.session_token is None or self.peer is None or self.closed or self.peer_closed:
+            return False
+        deadline = time.monotonic() + timeout
+        delay = RESUME_RETRY_MIN
+        while True:
+            conn = NetworkManager(is_server=False, use_ssl=self.use_ssl)
+            if conn.connect(*self.peer):
+                if conn.resume_session(self.session_token, self.session_secret, seq):
+                    break
+                # The host is there but the session is not
+                conn.close()
+                return False
+            if time.monotonic() + delay > deadline:
+                return False
+            time.sleep(delay)
+            delay = min(delay * 2, RESUME_RETRY_MAX)
+
+        # Take the new connection over. Shutting the old one down fails any
+        # send still blocked on it; holding every channel lock makes sure no
+        # message is left half sent on one connection and finished on the other.
+        old = self.socket
+        shutdown(old)
+        for lock in self.channel_locks:
+            lock.acquire()
+        try:
+            self.socket, self.cipher, self.encryption_key = conn.socket, conn.cipher, conn.encryption_key
+            self.assembler = ChunkAssembler()
+            self.peer_closed = False
+        finally:
+            for lock in self.channel_locks:
+                lock.release()
+        old.close()
+        return True
+
+    def resume_session(self, token, secret, seq):
+        """Ask the host, over this fresh connection, to carry on the session token; True if it did"""
+        proof = resume_proof(secret, self.encryption_key)
+        if not self.send_data({'type': MSG_RESUME, 'seq': seq, 'token': token, 'proof': proof}):
+            return False
+        self.cipher = resumed_cipher(secret, self.encryption_key, self.is_server)
+        data = self.receive_data()
+        return bool(data and data['type'] == MSG_SESSION and data['resumed'])
+
     def send_data(self, data):
-        """Send data with type and size header"""
+        """Send a message as header + encrypted payload, in chunks if it is large
+
+        Safe to call from several threads at once: their chunks interleave,
+        and whenever the socket frees up the most urgent channel goes next.
+        """
         try:
             if self.is_server:
                 socket_to_use = self.client_socket
@@ -100,16 +581,28 @@ class NetworkManager:
                 socket_to_use = self.socket
 
             # Serialize the data
-            serialized = pickle.dumps(data)
-
-            # Encrypt the data
-            encrypted = self.cipher.encrypt(serialized)
-
-            # Prepare header (content size)
-            header = struct.pack("!I", len(encrypted))
-
-            # Send header followed by content
-            socket_to_use.sendall(header + encrypted)
+            start = time.perf_counter()
+            msg_type, payload = encode_message(data)
+            self.serialize_time.observe(time.perf_counter() - start)
+
+            channel = MESSAGE_CHANNELS.get(msg_type, CHANNEL_CONTROL)
+            chunks = split_payload(payload)
+            sent = 0
+            with self.channel_locks[channel]:
+                for index, chunk in enumerate(chunks):
+                    # Encrypt and send header followed by content
+                    self.send_lock.acquire(channel)
+                    try:
+                        start = time.perf_counter()
+                        message = seal_message(self.cipher, msg_type, chunk, channel, index < len(chunks) - 1)
+                        sealed = time.perf_counter()
+                        socket_to_use.sendall(message)
+                        self.socket_send_time.observe(time.perf_counter() - sealed)
+                    finally:
+                        self.send_lock.release()
+                    self.encrypt_time.observe(sealed - start)
+                    sent += len(message)
+            self.bytes_sent.inc(sent)
             return True
         except Exception as e:
             print(f"Error sending data: {e}")
@@ -128,78 +621,91 @@ class NetworkManager:
         header = struct.pack("!I", len(data))
         socket_to_use.sendall(header + data)
 
-    def _recv_raw(self, buffer_size=BUFFER_SIZE):
+    def _recv_raw(self):
         """Receive raw data without decryption (used for key exchange)"""
         if self.is_server:
             socket_to_use = self.client_socket
         else:
             socket_to_use = self.socket
 
-        header = socket_to_use.recv(4)
-        if not header:
+        header = self.recv_buffer.read_exactly(socket_to_use, 4)
+        if header is None:
             return None
 
         data_size = struct.unpack("!I", header)[0]
-
-        chunks = []
-        bytes_received = 0
-
-        while bytes_received < data_size:
-            chunk_size = min(buffer_size, data_size - bytes_received)
-            chunk = socket_to_use.recv(chunk_size)
-            if not chunk:
-                raise ConnectionError("Connection closed while receiving data")
-            chunks.append(chunk)
-            bytes_received += len(chunk)
-
-        return b''.join(chunks)
-
-    def receive_data(self, buffer_size=BUFFER_SIZE):
-        """Receive data with handling for large payloads"""
+        self.recv_buffer.reserve(data_size)
+        data = self.recv_buffer.read_exactly(socket_to_use, data_size)
+        if data is None:
+            raise ConnectionError("Connection closed while receiving data")
+        return bytes(data)
+
+    def receive_data(self):
+        """Receive a message and return it as a dict"""
         try:
             if self.is_server:
                 socket_to_use = self.client_socket
             else:
                 socket_to_use = self.socket
 
-            # First receive the header containing content size
-            header = socket_to_use.recv(4)
-            if not header:
-                return None
-
-            data_size = struct.unpack("!I", header)[0]
-
-            # Receive the content in chunks if necessary
-            chunks = []
-            bytes_received = 0
-
-            while bytes_received < data_size:
-                chunk_size = min(buffer_size, data_size - bytes_received)
-                chunk = socket_to_use.recv(chunk_size)
-                if not chunk:
+            # Read chunks, of whichever channels, until one completes a message
+            data = None
+            while data is None:
+                # First receive the fixed header
+                header = self.recv_buffer.read_exactly(socket_to_use, HEADER.size)
+                if header is None:
+                    # Closed between messages: by the peer, unless it was us
+                    self.peer_closed = not self.closed
+                    return None
+
+                # Keep a copy of the few header bytes; growing the buffer would lose them
+                header = bytes(header)
+                msg_type, channel, more, data_size = parse_header(header)
+
+                # Receive the payload into the same reused buffer
+                start = time.perf_counter()
+                self.recv_buffer.reserve(data_size)
+                payload = self.recv_buffer.read_exactly(socket_to_use, data_size)
+                if payload is None:
                     raise ConnectionError("Connection closed while receiving data")
-                chunks.append(chunk)
-                bytes_received += len(chunk)
-
-            encrypted_data = b''.join(chunks)
-
-            # Decrypt the data
-            decrypted = self.cipher.decrypt(encrypted_data)
-
-            # Deserialize the data
-            data = pickle.loads(decrypted)
+                received = time.perf_counter()
+                self.socket_recv_time.observe(received - start)
+                self.bytes_received.inc(HEADER.size + data_size)
 
+                # Decrypt and deserialize; an unchunked message's plaintext is the only copy made of it
+                data = self.assembler.add(msg_type, channel, more, self.cipher.decrypt(payload, header))
+                self.decrypt_time.observe(time.perf_counter() - received)
             return data
         except Exception as e:
             print(f"Error receiving data: {e}")
             return None
 
+    def send_backlog(self):
+        """Bytes written but not yet acknowledged by the peer's TCP stack, or None if unknown"""
+        socket_to_use = self.client_socket if self.is_server else self.socket
+        if TIOCOUTQ is None or socket_to_use is None:
+            return None
+        try:
+            buf = fcntl.ioctl(socket_to_use.fileno(), TIOCOUTQ, b'\0\0\0\0')
+            return struct.unpack("i", buf)[0]
+        except OSError:
+            return None
+
+    def buffer_stats(self):
+        """Receive buffer statistics, to confirm steady-state receiving does not allocate"""
+        return self.recv_buffer.stats()
+
     def close(self):
-        """Close the connection"""
+        """Close the connection; a receive or send blocked on it in another thread fails at once"""
+        if not self.is_server and self.session_token is not None and not self.closed:
+            # Otherwise the host could not tell leaving from a dropped connection
+            self.send_data({'type': MSG_LEAVE})
+        self.closed = True
         try:
             if self.is_server and self.client_socket:
+                shutdown(self.client_socket)
                 self.client_socket.close()
             if self.socket:
+                shutdown(self.socket)
                 self.socket.close()
             return True
         except Exception as e:
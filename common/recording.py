@@ -0,0 +1,148 @@
+import mmap
+import time
+import queue
+import bisect
+import struct
+import threading
+
+from common.network import MSG_FRAME_DELTA, MESSAGE_LAYOUTS, encode_message, decode_message
+
+# Container layout: MAGIC, then one record per message, then the keyframe
+# index and a trailer pointing at it. Records are the messages' wire
+# payloads, unencrypted, so frames are stored exactly as they were encoded.
+MAGIC = b'PYDREC01'
+RECORD = struct.Struct("!dBI")  # seconds since the recording started, message type, payload length
+INDEX_ENTRY = struct.Struct("!dQ")  # time, file offset of a keyframe's record
+TRAILER = struct.Struct("!dQI8s")  # duration, index offset, index entries, INDEX_MAGIC
+INDEX_MAGIC = b'PYDRIDX1'
+
+FRAME_FIELDS = MESSAGE_LAYOUTS[MSG_FRAME_DELTA][0]
+KEYFRAME_FIELD = MESSAGE_LAYOUTS[MSG_FRAME_DELTA][1].index('keyframe')
+
+
+def is_keyframe(msg_type, payload):
+    """Whether a serialized message is a keyframe, read from its fixed fields alone"""
+    return msg_type == MSG_FRAME_DELTA and bool(FRAME_FIELDS.unpack_from(payload, 0)[KEYFRAME_FIELD])
+
+
+class RecordingWriter:
+    """Appends messages to a recording file from a background thread
+
+    write() only timestamps the message and queues it; serializing and
+    writing happen on the writer thread, so the caller's cost is one queue
+    put. The keyframe index is written by close(). A file whose writer never
+    closed, e.g. because the host crashed, can still be played: the reader
+    rebuilds the index.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'wb')
+        self.file.write(MAGIC)
+        self.offset = len(MAGIC)
+        self.index = []  # (time, offset) of each keyframe record
+        self.duration = 0.0
+        self.started = time.monotonic()
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def write(self, message):
+        self.queue.put((time.monotonic() - self.started, message))
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            at, message = item
+            msg_type, payload = encode_message(message)
+            if is_keyframe(msg_type, payload):
+                self.index.append((at, self.offset))
+            self.file.write(RECORD.pack(at, msg_type, len(payload)))
+            self.file.write(payload)
+            self.offset += RECORD.size + len(payload)
+            self.duration = at
+            # Keep what is on disk playable should the host die
+            if self.queue.empty():
+                self.file.flush()
+
+    def close(self):
+        """Write out everything queued, then the index"""
+        self.queue.put(None)
+        self.thread.join()
+        for entry in self.index:
+            self.file.write(INDEX_ENTRY.pack(*entry))
+        self.file.write(TRAILER.pack(self.duration, self.offset, len(self.index), INDEX_MAGIC))
+        self.file.close()
+
+
+class RecordingReader:
+    """Memory-mapped view of a recording, read by seeking through its keyframe index
+
+    Messages are decoded straight out of the map, so tile data is never
+    copied until it is decoded, and opening a recording of any length costs
+    the index alone.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[:len(MAGIC)] != MAGIC:
+            self.map.close()
+            raise ValueError(f"{path} is not a recording")
+        if not self.read_index():
+            self.rebuild_index()
+        self.times = [at for at, _ in self.index]
+
+    def read_index(self):
+        """Load the index written on close; False if there is none"""
+        if len(self.map) < len(MAGIC) + TRAILER.size:
+            return False
+        duration, offset, count, magic = TRAILER.unpack_from(self.map, len(self.map) - TRAILER.size)
+        if magic != INDEX_MAGIC or offset + count * INDEX_ENTRY.size != len(self.map) - TRAILER.size:
+            return False
+        self.index = [INDEX_ENTRY.unpack_from(self.map, offset + i * INDEX_ENTRY.size) for i in range(count)]
+        self.end = offset
+        self.duration = duration
+        return True
+
+    def rebuild_index(self):
+        """Scan the record headers of a file that was never closed, up to its last whole record"""
+        self.index = []
+        self.duration = 0.0
+        offset = len(MAGIC)
+        while offset + RECORD.size <= len(self.map):
+            at, msg_type, size = RECORD.unpack_from(self.map, offset)
+            start = offset + RECORD.size
+            if start + size > len(self.map):
+                break
+            if is_keyframe(msg_type, self.map[start:start + FRAME_FIELDS.size]):
+                self.index.append((at, offset))
+            self.duration = at
+            offset = start + size
+        self.end = offset
+
+    def keyframe_offset(self, at):
+        """Offset of the last keyframe at or before at seconds, else of the first one, else of the start"""
+        if not self.index:
+            return len(MAGIC)
+        i = max(bisect.bisect_right(self.times, at) - 1, 0)
+        return self.index[i][1]
+
+    def messages(self, offset=None):
+        """Yield (time, message) from offset, a record boundary, to the end"""
+        view = memoryview(self.map)
+        offset = len(MAGIC) if offset is None else offset
+        while offset < self.end:
+            at, msg_type, size = RECORD.unpack_from(view, offset)
+            start = offset + RECORD.size
+            yield at, decode_message(msg_type, view[start:start + size])
+            offset = start + size
+
+    def close(self):
+        try:
+            self.map.close()
+        except BufferError:
+            # Decoded messages still hold views into the map; it goes with them
+            pass
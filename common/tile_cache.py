@@ -0,0 +1,60 @@
+import threading
+from collections import OrderedDict
+
+DEFAULT_TILE_CACHE_MB = 64
+
+
+class TileCache:
+    """Decoded tiles by content hash, evicting the least recently used past a byte budget
+
+    The client keeps the tiles themselves. The host keeps a mirror per viewer
+    with sizes only, replaying each frame's stores and lookups in the order
+    the viewer applies them, so both sides evict the same entries and the host
+    knows exactly which tiles a viewer can be told to reuse.
+    """
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.entries = OrderedDict()  # key -> (tile, size in bytes)
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        """The tile stored under key, now the most recently used; None if there is none"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            self.entries.move_to_end(key)
+            return entry[0]
+
+    def touch(self, key):
+        """Mark key as just used; False if it is not cached"""
+        with self.lock:
+            if key not in self.entries:
+                return False
+            self.entries.move_to_end(key)
+            return True
+
+    def put(self, key, tile, size):
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= old[1]
+            self.entries[key] = (tile, size)
+            self.size += size
+            while self.size > self.budget:
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.size -= evicted
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
@@ -0,0 +1,88 @@
+import numpy as np
+
+# PyAV is optional: without it the host never switches to video and a
+# viewer never offers to decode it
+try:
+    import av
+except ImportError:
+    av = None
+
+VIDEO_CODEC = 'h264'
+
+
+def video_available():
+    return av is not None
+
+
+def video_crf(quality):
+    """x264 constant rate factor giving roughly the detail of a JPEG at quality (0-100)"""
+    return min(max(round(51 - 0.45 * quality), 0), 51)
+
+
+class VideoEncoder:
+    """Streams one screen region as H.264 with no frame delay
+
+    x264 runs with the ultrafast preset and zerolatency tuning: no B-frames
+    and no lookahead, so every frame comes out as one access unit as soon as
+    it goes in. It runs on the calling thread, whose CPU time is what the
+    host accounts to the encode stage. The first frame, and any frame encoded
+    with intra set, is an IDR that a fresh decoder can start from. Regions
+    with an odd width or height are padded to even ones, as 4:2:0 needs.
+    """
+
+    def __init__(self, rect, quality):
+        self.rect = rect
+        self.crf = video_crf(quality)
+        x, y, w, h = rect
+        self.context = av.CodecContext.create('libx264', 'w')
+        self.context.width, self.context.height = w + w % 2, h + h % 2
+        self.context.pix_fmt = 'yuv420p'
+        self.context.thread_count = 1
+        self.context.options = {'preset': 'ultrafast', 'tune': 'zerolatency', 'bframes': '0', 'crf': str(self.crf)}
+        self.pts = 0
+
+    def encode(self, frame, intra=False):
+        """Encode the region of a BGRX frame; returns the access unit"""
+        x, y, w, h = self.rect
+        pixels = frame[y:y + h, x:x + w]
+        if w % 2 or h % 2:
+            pixels = np.pad(pixels, ((0, h % 2), (0, w % 2), (0, 0)), mode='edge')
+        picture = av.VideoFrame.from_ndarray(pixels, format='bgra')
+        picture.pts = self.pts
+        self.pts += 1
+        if intra:
+            picture.pict_type = av.video.frame.PictureType.I
+        return b''.join(bytes(packet) for packet in self.context.encode(picture))
+
+    def close(self):
+        self.context = None
+
+
+class VideoDecoder:
+    """Decodes the access units of one video region, in the order they were encoded
+
+    A new region starts with an IDR, so the decoder is simply recreated
+    whenever the region's size changes.
+    """
+
+    def __init__(self):
+        self.context = None
+        self.size = None
+
+    def decode(self, data, width, height):
+        """Decode one access unit to an HxWx3 RGB array; None if it yields no picture"""
+        if self.context is None or self.size != (width, height):
+            self.context = av.CodecContext.create(VIDEO_CODEC, 'r')
+            # Frame threading would hold pictures back; slices do not
+            self.context.thread_type = 'SLICE'
+            self.size = (width, height)
+        try:
+            pictures = self.context.decode(av.Packet(bytes(data)))
+        except av.FFmpegError:
+            # Broken reference chain; the keyframe asked for next starts a new one
+            self.context = None
+            return None
+        if not pictures:
+            return None
+        # swscale garbles the last columns of some widths when converting to formats with alpha
+        return pictures[-1].to_ndarray(format='rgb24')[:height, :width]
@@ -0,0 +1,342 @@
+import sys
+import os
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+# Add parent dir for common modules, ahead of the script's own so its package is found
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.async_network import AsyncNetworkManager
+from common.encryption import resumed_cipher
+from common.network import MSG_RESUME, RESUME_TIMEOUT
+from host.host import RemoteHost, ViewerSession, frame_size, CURSOR_INTERVAL
+
+
+class AsyncLatestQueue:
+    """asyncio counterpart of LatestQueue; must only be used from the event loop"""
+
+    def __init__(self, merge=None):
+        self.merge = merge
+        self.dropped = 0
+        self._item = None
+        self._closed = False
+        self._event = asyncio.Event()
+
+    def put(self, item):
+        if self._item is not None:
+            if self.merge is not None:
+                item = self.merge(self._item, item)
+            else:
+                self.dropped += 1
+        self._item = item
+        if item is not None:
+            self._event.set()
+
+    def clear(self):
+        self._item = None
+
+    async def get(self):
+        """Wait for and take the latest item; None once closed"""
+        while self._item is None and not self._closed:
+            self._event.clear()
+            await self._event.wait()
+        item, self._item = self._item, None
+        return item
+
+    def close(self):
+        self._closed = True
+        self._event.set()
+
+
+class AsyncViewerSession(ViewerSession):
+    def __init__(self, host, network, viewer_id):
+        super().__init__(host, network, viewer_id)
+        self.send_queue = AsyncLatestQueue(merge=self.merge)
+        self.cursor_queue = AsyncLatestQueue()
+        self.senders = []  # Send tasks of the current connection
+
+
+class AsyncRemoteHost(RemoteHost):
+    """RemoteHost driven by an asyncio event loop instead of one thread per job
+
+    Connections, frame pacing, fan-out and sending all live on the loop and
+    wait on events rather than polling. Capture, encode and input injection
+    are blocking calls and run in single-thread executors, one capture and
+    one encode executor per monitor, which keeps each mss handle on one
+    thread and input in order. Stopping cancels every task and waits for the
+    executors, so nothing is left running when run() returns.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.capture_executors = [ThreadPoolExecutor(1, thread_name_prefix=f"capture{stream.index}")
+                                  for stream in self.streams]
+        self.encode_executors = [ThreadPoolExecutor(1, thread_name_prefix=f"encode{stream.index}")
+                                 for stream in self.streams]
+        self.input_executor = ThreadPoolExecutor(1, thread_name_prefix="input")
+        self.sources_open = set()  # Indexes of the streams whose source is open
+        self.loop = None
+        self.stopped = None
+        self.async_input = None
+        self.capture_wakes = None  # Per stream; set to capture it now
+        self.replies = set()  # Reply tasks, referenced until they finish
+
+    async def run(self):
+        self.loop = asyncio.get_running_loop()
+        self.stopped = asyncio.Event()
+        self.async_input = asyncio.Queue()
+        self.capture_wakes = [asyncio.Event() for stream in self.streams]
+        for stream in self.streams:
+            stream.capture_queue = AsyncLatestQueue()
+
+        print("Starting remote host...")
+        server = await AsyncNetworkManager.start_server(self.serve_viewer_async, self.host, self.port)
+        self.running = True
+        self.start_recording()
+        tasks = [
+            asyncio.create_task(self.input_task()),
+            asyncio.create_task(self.cursor_task()),
+        ]
+        for stream in self.streams:
+            tasks.append(asyncio.create_task(self.capture_task(stream)))
+            tasks.append(asyncio.create_task(self.encode_task(stream)))
+        print(f"Remote host running on {self.host}:{self.port}")
+
+        try:
+            await self.stopped.wait()
+        finally:
+            self.running = False
+            server.close()
+            for viewer in list(self.viewers):
+                await self.disconnect_async(viewer)
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await server.wait_closed()
+
+            for stream, executor in zip(self.streams, self.capture_executors):
+                executor.submit(self.close_capture, stream)
+            for executor in self.capture_executors + self.encode_executors + [self.input_executor]:
+                executor.shutdown(wait=True)
+            for stream in self.streams:
+                stream.encoder.close()
+            self.stop_recording()
+            print("Remote host stopped")
+
+    def stop(self):
+        """Ask run() to shut down; safe to call from any thread"""
+        if self.loop is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.stopped.set)
+
+    async def serve_viewer_async(self, conn):
+        print(f"Waiting for authentication from {conn.address}...")
+        hello = await conn.authenticate()
+        if hello is None:
+            print("Authentication failed")
+            return
+
+        if hello['type'] == MSG_RESUME:
+            session = await self.resume_viewer_async(conn, hello)
+            if session is None:
+                return
+        else:
+            session = AsyncViewerSession(self, conn, self.next_viewer_id)
+            self.next_viewer_id += 1
+            if not self.add_viewer(session):
+                print(f"Rejecting {conn.address}: {self.max_viewers} viewers already connected")
+                return
+
+            role = "controller" if session is self.controller else "viewer"
+            print(f"Authentication successful; {conn.address} joined as {role} #{session.id}")
+            self.reply(session, self.session_message(session))
+            self.reply(session, self.monitors_message(session))
+
+        senders = session.senders = [asyncio.create_task(self.send_task(session)),
+                                     asyncio.create_task(self.cursor_send_task(session))]
+        try:
+            while self.running and session.connected and session.network is conn:
+                data = await conn.receive_data()
+                if not data:
+                    # Closed or corrupt stream; the viewer may resume on a new connection
+                    break
+                self.handle_message(session, data)
+        finally:
+            for sender in senders:
+                sender.cancel()
+            await self.connection_lost_async(session, conn)
+
+    async def resume_viewer_async(self, conn, hello):
+        """As RemoteHost.resume_viewer; the old connection's senders stop before the resend is worked out"""
+        session = self.session_to_resume(conn, hello)
+        if session is None:
+            print(f"Rejecting {conn.address}: no session to resume")
+            return None
+        conn.cipher = resumed_cipher(session.secret, conn.encryption_key, True)
+        await session.network.close()
+        for sender in session.senders:
+            sender.cancel()
+        await asyncio.gather(*session.senders, return_exceptions=True)
+        if not await conn.send_data(self.session_message(session, resumed=True)) or not session.connected:
+            return None
+
+        session.network = conn
+        missed = self.catch_up(session, hello['seq'])
+        for frame_data in missed or ():
+            if not await conn.send_data(frame_data):
+                break
+        session.online.set()
+
+        self.wake_capture(session.stream)
+        caught_up = f"resending {len(missed)} frames" if missed is not None else "sending a keyframe"
+        print(f"Viewer #{session.id} resumed its session from {conn.address}, {caught_up}")
+        return session
+
+    async def connection_lost_async(self, session, network):
+        """As RemoteHost.connection_lost"""
+        if session.network is not network or not session.connected:
+            return
+        session.online.clear()
+        if network.peer_closed or session.leaving or not self.running:
+            await self.disconnect_async(session)
+            return
+        print(f"Viewer #{session.id} lost its connection; holding its session for {RESUME_TIMEOUT}s")
+        self.loop.call_later(RESUME_TIMEOUT, self.expire, session, network)
+        await network.close()
+
+    def reply(self, session, message):
+        # Called on the loop; chunks of one channel are sent in the order queued
+        task = asyncio.create_task(self.reply_async(session, message))
+        self.replies.add(task)
+        task.add_done_callback(self.replies.discard)
+
+    async def reply_async(self, session, message):
+        network = session.network
+        if not await network.send_data(message):
+            self.send_failed(session, network)
+
+    async def disconnect_async(self, session):
+        if self.remove_viewer(session):
+            await session.network.close()
+
+    def wake_capture(self, stream):
+        # Called on the loop
+        stream.scheduler.wake()
+        self.capture_wakes[stream.index].set()
+
+    async def capture_task(self, stream):
+        wake = self.capture_wakes[stream.index]
+        next_time = self.loop.time()
+        while True:
+            # Sleep until the next capture is due; wake_capture() cuts the wait short
+            try:
+                await asyncio.wait_for(wake.wait(), max(next_time - self.loop.time(), 0))
+            except asyncio.TimeoutError:
+                pass
+            wake.clear()
+            now = self.loop.time()
+
+            # Nobody is watching this monitor; a viewer arriving wakes us
+            viewers = self.recipients(stream)
+            if not viewers:
+                next_time = now + stream.scheduler.idle_interval
+                continue
+
+            capture = await self.loop.run_in_executor(self.capture_executors[stream.index],
+                                                      self.capture_frame, stream, viewers)
+            if capture is not None:
+                stream.capture_queue.put(capture)
+            next_time = self.next_capture_time(stream, next_time, now)
+
+    def capture_frame(self, stream, viewers):
+        # Runs on the stream's capture executor, whose only thread owns the source
+        if stream.index not in self.sources_open:
+            stream.source.open()
+            self.sources_open.add(stream.index)
+        capture = self.grab_frame(stream)
+        return capture if self.worth_encoding(stream, capture[0], viewers) else None
+
+    def close_capture(self, stream):
+        if stream.index in self.sources_open:
+            stream.source.close()
+            self.sources_open.discard(stream.index)
+
+    async def encode_task(self, stream):
+        while True:
+            capture = await stream.capture_queue.get()
+            viewers = self.recipients(stream)
+            if capture is None or not viewers:
+                continue
+
+            frame_data, resync = await self.loop.run_in_executor(
+                self.encode_executors[stream.index], self.encode_for_viewers, stream, *capture, viewers)
+            self.fan_out(stream, viewers, frame_data, resync)
+
+    async def send_task(self, session):
+        network = session.network
+        while session.connected:
+            frame_data = await session.send_queue.get()
+            # A resume may have switched this viewer to a keyframe since the frame was queued
+            if frame_data is None or (session.needs_keyframe and not frame_data['keyframe']):
+                continue
+            frame_data = session.sync_tile_cache(frame_data)
+            if frame_data is None:
+                continue
+
+            # Send frame, keeping it until acknowledged in case it never arrives;
+            # drain() holds us here while the viewer's link is full
+            start = time.time()
+            session.remember(frame_data)
+            if not await network.send_data(frame_data):
+                self.send_failed(session, network)
+                break
+            self.send_time.observe(time.time() - start)
+            self.sent_count.inc()
+            session.frames_sent += 1
+
+            if self.bitrate and session is self.controller:
+                self.bitrate.on_frame_sent(frame_data['seq'], frame_size(frame_data), time.time() - start,
+                                           network.send_backlog())
+                self.bitrate.update()
+
+    async def cursor_task(self):
+        while True:
+            await asyncio.sleep(CURSOR_INTERVAL)
+            for stream in self.streams:
+                viewers = self.recipients(stream)
+                if viewers:
+                    # The source is only touched from its capture thread
+                    cursor = await self.loop.run_in_executor(self.capture_executors[stream.index],
+                                                             stream.source.cursor)
+                    self.fan_out_cursor(stream, viewers, cursor)
+
+    async def cursor_send_task(self, session):
+        network = session.network
+        while session.connected:
+            update = await session.cursor_queue.get()
+            if update is None:
+                continue
+
+            cursor, shape = update
+            if shape is not None and shape['shape'] not in session.cursor_shapes:
+                if not await network.send_data(shape):
+                    self.send_failed(session, network)
+                    break
+                session.cursor_shapes.add(shape['shape'])
+            if not await network.send_data(cursor):
+                self.send_failed(session, network)
+                break
+            self.cursor_count.inc()
+
+    def queue_input(self, event):
+        self.async_input.put_nowait(event)
+
+    async def input_task(self):
+        while True:
+            events = [await self.async_input.get()]
+
+            # Take everything that piled up while the last batch was applied
+            while not self.async_input.empty():
+                events.append(self.async_input.get_nowait())
+
+            await self.loop.run_in_executor(self.input_executor, self.apply_inputs, events)
+            self.wake_capture(self.control_stream())
@@ -0,0 +1,169 @@
+import time
+import threading
+from collections import deque
+
+# How often the controller re-evaluates, and how long the link must stay
+# clear before it starts spending more bandwidth again
+ADJUST_INTERVAL = 0.5
+RECOVER_AFTER = 2.0
+
+# Congestion thresholds
+MAX_QUEUE_DELAY = 0.1  # Seconds of data allowed to sit in the socket send buffer
+MIN_BACKLOG_BYTES = 64 * 1024
+MAX_UNACKED_FRAMES = 4
+RTT_SLACK = 0.05  # Seconds above the best RTT seen before it counts as queueing
+
+# Step sizes: back off quickly, recover gently
+QUALITY_DOWN, QUALITY_UP = 10, 5
+FPS_DOWN_FACTOR, FPS_UP = 0.75, 1
+
+EWMA_WEIGHT = 0.2
+
+
+class BitrateController:
+    """Adjusts JPEG quality, frame rate and capture scale to what the link carries
+
+    The send stage reports every frame it writes and the client acknowledges
+    every frame it has decoded. From those the controller derives throughput,
+    round-trip time and how many frames are in flight, and combines them with
+    the kernel's socket backlog. On congestion it lowers quality first, then
+    frame rate, then resolution; once the link has been clear for a while it
+    restores them in the opposite order.
+    """
+
+    def __init__(self, max_quality=70, min_quality=30, max_fps=15, min_fps=5, max_downscale=2):
+        self.max_quality, self.min_quality = max_quality, min(min_quality, max_quality)
+        self.max_fps, self.min_fps = max_fps, min(min_fps, max_fps)
+        self.max_downscale = max(1, max_downscale)
+
+        # Current decisions
+        self.quality = max_quality
+        self.fps = float(max_fps)
+        self.scale = 1  # Capture is decimated by this integer factor
+
+        # Measurements
+        self.throughput = None  # Bytes per second while sending
+        self.srtt = None
+        self.min_rtt = None
+        self.backlog = None
+        self.in_flight = {}  # seq -> send time
+        self.frames_sent = 0
+        self.bytes_sent = 0
+
+        self.last_adjust = time.time()
+        self.clear_since = time.time()
+        self.decisions = deque(maxlen=50)
+        self.lock = threading.Lock()
+
+    @property
+    def frame_interval(self):
+        return 1.0 / self.fps
+
+    def on_frame_sent(self, seq, size, duration, backlog=None):
+        """Record a frame written to the socket in duration seconds"""
+        with self.lock:
+            now = time.time()
+            self.in_flight[seq] = now
+            self.frames_sent += 1
+            self.bytes_sent += size
+            self.backlog = backlog
+            if duration > 0:
+                self.throughput = self._smooth(self.throughput, size / duration)
+
+            # Frames merged away before sending are never acknowledged
+            while len(self.in_flight) > 4 * MAX_UNACKED_FRAMES:
+                self.in_flight.pop(next(iter(self.in_flight)))
+
+    def on_ack(self, seq):
+        """Record the client having decoded frame seq"""
+        with self.lock:
+            sent = self.in_flight.pop(seq, None)
+            if sent is None:
+                return
+            # Anything older than an acknowledged frame was superseded by it
+            for old in [s for s in self.in_flight if s < seq]:
+                del self.in_flight[old]
+
+            rtt = time.time() - sent
+            self.srtt = self._smooth(self.srtt, rtt)
+            self.min_rtt = rtt if self.min_rtt is None else min(self.min_rtt, rtt)
+
+    def update(self):
+        """Re-evaluate the link and adjust settings; cheap to call after every frame"""
+        with self.lock:
+            now = time.time()
+            if now - self.last_adjust < ADJUST_INTERVAL:
+                return
+            self.last_adjust = now
+
+            reason = self._congestion_reason()
+            if reason:
+                self.clear_since = now
+                self._back_off(reason)
+            elif now - self.clear_since >= RECOVER_AFTER:
+                self.clear_since = now
+                self._recover()
+
+    def _congestion_reason(self):
+        if self.backlog is not None:
+            limit = MIN_BACKLOG_BYTES
+            if self.throughput:
+                limit = max(limit, self.throughput * MAX_QUEUE_DELAY)
+            if self.backlog > limit:
+                return f"send backlog {self.backlog} bytes"
+
+        if len(self.in_flight) > MAX_UNACKED_FRAMES:
+            return f"{len(self.in_flight)} frames unacknowledged"
+
+        if self.srtt is not None and self.srtt > 2 * self.min_rtt + RTT_SLACK:
+            return f"rtt {self.srtt * 1000:.0f} ms (best {self.min_rtt * 1000:.0f} ms)"
+
+        return None
+
+    def _back_off(self, reason):
+        if self.quality > self.min_quality:
+            self.quality = max(self.min_quality, self.quality - QUALITY_DOWN)
+            self._decide(f"quality -> {self.quality}", reason)
+        elif self.fps > self.min_fps:
+            self.fps = max(self.min_fps, self.fps * FPS_DOWN_FACTOR)
+            self._decide(f"fps -> {self.fps:.1f}", reason)
+        elif self.scale < self.max_downscale:
+            self.scale += 1
+            self._decide(f"scale -> 1/{self.scale}", reason)
+
+    def _recover(self):
+        if self.scale > 1:
+            self.scale -= 1
+            self._decide(f"scale -> 1/{self.scale}", "link clear")
+        elif self.fps < self.max_fps:
+            self.fps = min(self.max_fps, self.fps + FPS_UP)
+            self._decide(f"fps -> {self.fps:.1f}", "link clear")
+        elif self.quality < self.max_quality:
+            self.quality = min(self.max_quality, self.quality + QUALITY_UP)
+            self._decide(f"quality -> {self.quality}", "link clear")
+
+    def _decide(self, action, reason):
+        self.decisions.append({'time': time.time(), 'action': action, 'reason': reason})
+
+    @staticmethod
+    def _smooth(current, sample):
+        if current is None:
+            return sample
+        return (1 - EWMA_WEIGHT) * current + EWMA_WEIGHT * sample
+
+    def stats(self):
+        """Current settings, measurements and recent decisions"""
+        with self.lock:
+            return {
+                'quality': self.quality,
+                'fps': round(self.fps, 2),
+                'scale': self.scale,
+                'throughput_bps': None if self.throughput is None else int(self.throughput * 8),
+                'rtt_ms': None if self.srtt is None else round(self.srtt * 1000, 1),
+                'min_rtt_ms': None if self.min_rtt is None else round(self.min_rtt * 1000, 1),
+                'backlog_bytes': self.backlog,
+                'frames_in_flight': len(self.in_flight),
+                'frames_sent': self.frames_sent,
+                'bytes_sent': self.bytes_sent,
+                'decisions': list(self.decisions),
+            }
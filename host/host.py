@@ -2,34 +2,580 @@ import sys
 import os
 import time
 import threading
-import io
+import queue
+import hashlib
+import hmac
+from collections import deque
 
-import mss
-from PIL import Image, ImageDraw
 import lz4.frame
+import numpy as np
 
-from pynput.mouse import Controller as MouseController, Button
-from pynput.keyboard import Controller as KeyboardController, Key
+# Add parent dir for common modules, ahead of the script's own so its package is found
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.network import (
+    NetworkManager, RESUME_TIMEOUT,
+    MSG_FRAME_DELTA, MSG_KEYFRAME_REQUEST, MSG_FRAME_ACK, MSG_INPUT_BATCH,
+    MSG_MOUSE_MOVE, MSG_MOUSE_CLICK, MSG_KEY_PRESS, MSG_KEY_RELEASE, MSG_CURSOR, MSG_CURSOR_SHAPE, MSG_VIEWPORT,
+    MSG_TILE_CACHE, MSG_FILE_OFFER, MSG_FILE_TRANSFER, MSG_MONITORS, MSG_MONITOR_SELECT, MSG_SESSION, MSG_RESUME,
+    MSG_LEAVE, MSG_VIDEO
+)
+from common.encryption import resume_proof, resumed_cipher
+from host.bitrate import BitrateController
+from host.scheduler import CaptureScheduler
+from host.recorder import SessionRecorder
+from common.logging_utils import metrics, Timer, StatsLogger, start_metrics_server, DEFAULT_STATS_INTERVAL
+from common.imaging import (
+    DeltaEncoder, FrameScaler, bgrx_frame, downscale, DEFAULT_TILE_SIZE, DEFAULT_KEYFRAME_INTERVAL,
+    DEFAULT_ENCODE_WORKERS, TILE_CACHED, TILE_STORE
+)
+from common.tile_cache import TileCache
+from common.file_transfer import FileReceiver
+from common.video import VIDEO_CODEC
 
-# Add parent dir for common modules
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from common.network import NetworkManager, MSG_FRAME, MSG_MOUSE_MOVE, MSG_MOUSE_CLICK, MSG_KEY_PRESS, MSG_KEY_RELEASE
-
-# Map string keys to pynput Key constants
+# Map string keys to pynput Key attribute names
 KEY_MAP = {
-    'enter': Key.enter, 'esc': Key.esc, 'tab': Key.tab,
-    'backspace': Key.backspace, 'delete': Key.delete,
-    'shift': Key.shift, 'ctrl': Key.ctrl, 'alt': Key.alt,
-    'space': Key.space, 'left': Key.left, 'right': Key.right,
-    'up': Key.up, 'down': Key.down, 'home': Key.home,
-    'end': Key.end, 'pageup': Key.page_up, 'pagedown': Key.page_down,
-    'f1': Key.f1, 'f2': Key.f2, 'f3': Key.f3, 'f4': Key.f4,
-    'f5': Key.f5, 'f6': Key.f6, 'f7': Key.f7, 'f8': Key.f8,
-    'f9': Key.f9, 'f10': Key.f10, 'f11': Key.f11, 'f12': Key.f12
+    'enter': 'enter', 'esc': 'esc', 'tab': 'tab',
+    'backspace': 'backspace', 'delete': 'delete',
+    'shift': 'shift', 'ctrl': 'ctrl', 'alt': 'alt',
+    'space': 'space', 'left': 'left', 'right': 'right',
+    'up': 'up', 'down': 'down', 'home': 'home',
+    'end': 'end', 'pageup': 'page_up', 'pagedown': 'page_down',
+    'f1': 'f1', 'f2': 'f2', 'f3': 'f3', 'f4': 'f4',
+    'f5': 'f5', 'f6': 'f6', 'f7': 'f7', 'f8': 'f8',
+    'f9': 'f9', 'f10': 'f10', 'f11': 'f11', 'f12': 'f12'
 }
 
+
+class CaptureSource:
+    """Where the host's frames come from
+
+    width and height are known up front. open(), grab() and close() are only
+    called from the capture thread; grab() returns a C-contiguous HxWx4 BGRX
+    array that is never modified afterwards. Frames should not contain the
+    pointer: cursor() reports it separately, from the cursor thread.
+    """
+
+    width = 0
+    height = 0
+    # Where the captured area sits on the desktop, which is where input for it lands
+    left = 0
+    top = 0
+
+    def open(self):
+        pass
+
+    def grab(self):
+        raise NotImplementedError
+
+    def grab_region(self, left, top, width, height):
+        """Capture part of the screen; sources that can capture less than everything override this"""
+        return np.ascontiguousarray(self.grab()[top:top + height, left:left + width])
+
+    def cursor(self):
+        """Return (x, y, shape) for the pointer hotspot in capture pixels, or None if unknown
+
+        shape is (hot_x, hot_y, width, height, straight-alpha BGRA bytes),
+        or None while the pointer is hidden.
+        """
+        return None
+
+    def close(self):
+        pass
+
+
+class MssCaptureSource(CaptureSource):
+    """Captures a real monitor with mss"""
+
+    def __init__(self, monitor_index=1):
+        # Imported here so hosts with other sources run without a display
+        import mss
+        self.mss = mss
+        with mss.mss() as sct:
+            self.monitor = dict(sct.monitors[monitor_index])
+        self.width, self.height = self.monitor['width'], self.monitor['height']
+        self.left, self.top = self.monitor['left'], self.monitor['top']
+        self.sct = None
+
+        # The pointer is read with its own handle on the cursor thread
+        self.cursor_sct = None
+        self.cursor_supported = True
+        self.hotspots = {}  # Cursor image -> hotspot, which mss does not report
+        self.pointer = None
+
+    def open(self):
+        # mss handles are not safe to share across threads, so capture owns its own
+        self.sct = self.mss.mss()
+
+    def grab(self):
+        # Wrap the raw BGRA buffer as-is; no RGB conversion or copy
+        shot = self.sct.grab(self.monitor)
+        return bgrx_frame(shot.raw, shot.width, shot.height)
+
+    def grab_region(self, left, top, width, height):
+        # Only the zoomed-in part is copied out of the screen
+        shot = self.sct.grab({'left': self.monitor['left'] + left, 'top': self.monitor['top'] + top,
+                              'width': width, 'height': height})
+        return bgrx_frame(shot.raw, shot.width, shot.height)
+
+    def cursor(self):
+        if not self.cursor_supported:
+            return None
+        try:
+            if self.cursor_sct is None:
+                self.cursor_sct = self.mss.mss()
+            # Private in mss and renamed in 10.x; XFixes on Linux only
+            read = getattr(self.cursor_sct, '_cursor_impl', None) or self.cursor_sct._impl.cursor
+            shot = read()
+        except Exception as e:
+            print(f"Pointer capture unavailable, viewers will use their own: {e}")
+            self.cursor_supported = False
+            return None
+        if shot is None:
+            return None
+
+        left, top = shot.pos
+        width, height = shot.size
+        pixels = bytes(shot.raw)
+        hot_x, hot_y = self.hotspot(pixels, left, top, width, height)
+        shape = (hot_x, hot_y, width, height, pixels)
+        return left + hot_x - self.monitor['left'], top + hot_y - self.monitor['top'], shape
+
+    def hotspot(self, pixels, left, top, width, height):
+        # Work it out once per image from where the pointer is while it is showing
+        if pixels not in self.hotspots:
+            position = self.pointer_position()
+            if position is None:
+                return 0, 0
+            x, y = position[0] - left, position[1] - top
+            if not (0 <= x < width and 0 <= y < height):
+                return 0, 0
+            if len(self.hotspots) > MAX_CURSOR_SHAPES:
+                self.hotspots.clear()
+            self.hotspots[pixels] = (int(x), int(y))
+        return self.hotspots[pixels]
+
+    def pointer_position(self):
+        try:
+            if self.pointer is None:
+                from pynput.mouse import Controller as MouseController
+                self.pointer = MouseController()
+            return self.pointer.position
+        except Exception:
+            return None
+
+    def close(self):
+        if self.sct is not None:
+            self.sct.close()
+            self.sct = None
+        if self.cursor_sct is not None:
+            try:
+                self.cursor_sct.close()
+            except Exception:
+                # Owned by the cursor thread, which may still be using it
+                pass
+            self.cursor_sct = None
+
+
+def monitor_sources():
+    """An MssCaptureSource for every attached monitor"""
+    import mss
+    with mss.mss() as sct:
+        # monitors[0] is the bounding box of all the others
+        count = len(sct.monitors) - 1
+    return [MssCaptureSource(index) for index in range(1, count + 1)]
+
+
+class InputSink:
+    """Where the controller's input lands; positions are in desktop pixels
+
+    The base class discards everything, which is what benchmarks and
+    view-only hosts want.
+    """
+
+    def __init__(self):
+        self.events = 0
+
+    def move(self, x, y):
+        self.events += 1
+
+    def click(self, x, y, button, clicks):
+        self.events += 1
+
+    def press(self, key):
+        self.events += 1
+
+    def release(self, key):
+        self.events += 1
+
+
+class PynputInputSink(InputSink):
+    """Injects input into the local desktop with pynput"""
+
+    def __init__(self):
+        super().__init__()
+        # Imported here because pynput needs a display as soon as it loads
+        from pynput.mouse import Controller as MouseController, Button
+        from pynput.keyboard import Controller as KeyboardController, Key
+        self.mouse = MouseController()
+        self.keyboard = KeyboardController()
+        self.buttons = {'left': Button.left, 'right': Button.right}
+        self.keys = {name: getattr(Key, attr) for name, attr in KEY_MAP.items()}
+
+    def move(self, x, y):
+        super().move(x, y)
+        self.mouse.position = (x, y)
+
+    def click(self, x, y, button, clicks):
+        super().click(x, y, button, clicks)
+        # move first in case
+        self.mouse.position = (x, y)
+        for _ in range(clicks):
+            self.mouse.click(self.buttons.get(button, self.buttons['right']))
+
+    def press(self, key):
+        super().press(key)
+        self.keyboard.press(self.keys.get(key, key))
+
+    def release(self, key):
+        super().release(key)
+        self.keyboard.release(self.keys.get(key, key))
+
+
+class LatestQueue:
+    """Single-slot queue between pipeline stages where newer items win"""
+
+    def __init__(self, merge=None):
+        self.merge = merge
+        self.dropped = 0
+        self._item = None
+        self._closed = False
+        self._cond = threading.Condition()
+
+    def put(self, item):
+        """Store item, merging with or replacing one the consumer has not taken yet"""
+        with self._cond:
+            if self._item is not None:
+                if self.merge is not None:
+                    item = self.merge(self._item, item)
+                else:
+                    self.dropped += 1
+            self._item = item
+            self._cond.notify()
+
+    def clear(self):
+        """Drop the item the consumer has not taken yet"""
+        with self._cond:
+            self._item = None
+
+    def get(self, timeout=None):
+        """Wait for and take the latest item; None on timeout or close"""
+        with self._cond:
+            self._cond.wait_for(lambda: self._item is not None or self._closed, timeout)
+            item, self._item = self._item, None
+            return item
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+def merge_frames(older, newer):
+    """Combine two unsent frame messages into one that yields the newer image
+
+    Returns None when they cannot be combined: copies always run before
+    tiles, so the newer frame's copies would move the older frame's tiles.
+    """
+    if newer['type'] != MSG_FRAME_DELTA or newer['keyframe'] or older['type'] != MSG_FRAME_DELTA:
+        return newer
+    if newer['copies'] and older['tiles']:
+        return None
+
+    # The newer delta is relative to the older one, so the client needs both tile sets
+    merged = dict(newer)
+    merged['keyframe'] = older['keyframe']
+    merged['copies'] = older['copies'] + newer['copies']
+    merged['tiles'] = older['tiles'] + newer['tiles']
+    return merged
+
+
+def coalesce_input(events):
+    """Drop mouse moves that are immediately superseded by another move
+
+    Clicks and keys keep their order, and the move right before each of them
+    is kept, so the pointer is always where the client saw it.
+    """
+    coalesced = []
+    for event in events:
+        if coalesced and event['type'] == MSG_MOUSE_MOVE and coalesced[-1]['type'] == MSG_MOUSE_MOVE:
+            coalesced[-1] = event
+        else:
+            coalesced.append(event)
+    return coalesced
+
+
+INPUT_TYPES = (MSG_MOUSE_MOVE, MSG_MOUSE_CLICK, MSG_KEY_PRESS, MSG_KEY_RELEASE)
+DEFAULT_MAX_VIEWERS = 8
+CURSOR_INTERVAL = 1 / 60  # How often the pointer is polled
+MAX_CURSOR_SHAPES = 64
+MIN_ZOOM_PIXELS = 64  # Smallest screen region a viewer can zoom into
+
+
+def viewport_region(viewport, screen_width, screen_height):
+    """MSG_VIEWPORT -> ((left, top, width, height) in screen pixels, (width, height) to encode at)"""
+    width = min(max(int(viewport['w'] * screen_width), MIN_ZOOM_PIXELS), screen_width)
+    height = min(max(int(viewport['h'] * screen_height), MIN_ZOOM_PIXELS), screen_height)
+    left = min(max(int(viewport['x'] * screen_width), 0), screen_width - width)
+    top = min(max(int(viewport['y'] * screen_height), 0), screen_height - height)
+    size = max(viewport['width'], 1), max(viewport['height'], 1)
+    return (left, top, width, height), size
+
+
+def cursor_shape_message(hot_x, hot_y, width, height, pixels):
+    """MSG_CURSOR_SHAPE for a pointer image, identified by a hash of its content"""
+    digest = hashlib.blake2b(pixels, digest_size=8)
+    digest.update(f"{hot_x},{hot_y}".encode())
+    return {
+        'type': MSG_CURSOR_SHAPE,
+        'shape': int.from_bytes(digest.digest(), 'big') or 1,  # 0 means hidden
+        'width': width,
+        'height': height,
+        'hot_x': hot_x,
+        'hot_y': hot_y,
+        'pixels': lz4.frame.compress(pixels),
+    }
+
+
+def frame_size(frame_data):
+    """Encoded bytes carried by a frame message"""
+    return sum(len(tile[5]) for tile in frame_data['tiles'])
+
+
+def replay_tile_cache(cache, tiles):
+    """Apply a frame's cache references and stores to a mirror of a viewer's tile cache
+
+    Returns False as soon as a reference is to a tile the viewer no longer holds.
+    """
+    for x, y, w, h, codec, key in tiles:
+        if codec == TILE_CACHED:
+            if not cache.touch(key):
+                return False
+        elif codec == TILE_STORE:
+            cache.put(key, None, w * h * 4)
+    return True
+
+
+class ViewerSession:
+    """One connected viewer with its own send queue, so a slow one never stalls the others
+
+    A session outlives a failed connection for RESUME_TIMEOUT seconds: the
+    viewer can carry it on over a new connection with MSG_RESUME, keeping its
+    canvas, tile cache, monitor and control, and getting the frames it missed.
+    """
+
+    def __init__(self, host, network, viewer_id):
+        self.host = host
+        self.network = network
+        self.id = viewer_id
+        self.connected = True  # Until the viewer leaves or its session expires
+        self.leaving = False  # Viewer said it is closing the connection
+        self.connected_at = time.time()
+
+        # Resuming: the token names the session, and the key of its first
+        # connection stays its secret. online is clear while the session is
+        # held for a viewer whose connection failed.
+        self.token = os.urandom(16)
+        self.secret = network.encryption_key
+        self.online = threading.Event()
+        self.online.set()
+
+        # Frames sent but not acknowledged, to resend after a reconnect, and
+        # the sequence number of the frame sent before the oldest of them.
+        # send_lock keeps a resume from running while a frame is being sent.
+        self.unacked = deque()
+        self.unacked_bytes = 0
+        self.resend_base = None
+        self.unacked_lock = threading.Lock()
+        self.send_lock = threading.Lock()
+
+        # Monitor this viewer is watching; switched with MSG_MONITOR_SELECT
+        self.stream = host.streams[0]
+
+        # Frames waiting for this viewer's socket are merged; when catching up
+        # would cost more than a keyframe, they are dropped and a keyframe follows
+        self.send_queue = LatestQueue(merge=self.merge)
+        self.needs_keyframe = True  # Nothing to apply deltas to yet
+        self.frames_sent = 0
+        self.frames_merged = 0
+        self.resyncs = 0
+
+        # Pointer updates bypass the frame queue; only the latest one matters
+        self.cursor_queue = LatestQueue()
+        self.last_cursor = None
+        self.cursor_shapes = set()  # Shape ids this viewer has been sent
+
+        # Last MSG_VIEWPORT from this viewer; the stream follows the controller's
+        self.viewport = None
+
+        # Mirror of the viewer's tile cache, if it keeps one, updated as frames
+        # are sent. After a reset it is emptied with the next keyframe, which
+        # tells the viewer to do the same.
+        self.tile_cache = None
+        self.cache_reset_pending = False
+
+        # Whether the viewer decodes TILE_VIDEO; its stream only uses video if all its viewers do
+        self.video = False
+
+        # Files this viewer uploads, into the host's receive directory
+        self.file_receiver = FileReceiver(host.receive_dir)
+
+    def offer_cursor(self, cursor, shape):
+        """Queue a pointer update unless this viewer already has it"""
+        if cursor != self.last_cursor:
+            self.last_cursor = cursor
+            self.cursor_queue.put((cursor, shape))
+
+    def offer(self, stream, frame_data):
+        """Queue a frame for sending; deltas are skipped until a keyframe resyncs us"""
+        if frame_data is None or stream is not self.stream:
+            return
+        if frame_data['keyframe']:
+            self.needs_keyframe = False
+        elif self.needs_keyframe:
+            return
+        self.send_queue.put(frame_data)
+
+    def reset_tile_cache(self):
+        """Start both copies of the tile cache afresh at the next keyframe"""
+        self.cache_reset_pending = True
+        self.needs_keyframe = True
+
+    def sync_tile_cache(self, frame_data):
+        """Track what a frame about to be sent does to the viewer's tile cache
+
+        Returns the frame to send, or None when it refers to a tile that
+        frames sent since it was encoded have evicted; a keyframe follows.
+        """
+        if self.tile_cache is None:
+            return frame_data
+        if self.cache_reset_pending and frame_data['keyframe']:
+            self.tile_cache.clear()
+            self.cache_reset_pending = False
+            frame_data = dict(frame_data, cache_reset=True)
+        if not replay_tile_cache(self.tile_cache, frame_data['tiles']):
+            self.reset_tile_cache()
+            self.resyncs += 1
+            return None
+        return frame_data
+
+    def remember(self, frame_data):
+        """Keep a frame about to be sent until the viewer acknowledges it"""
+        with self.unacked_lock:
+            if frame_data['keyframe']:
+                # Nothing sent before a keyframe is needed to rebuild what follows it
+                self.unacked.clear()
+                self.unacked_bytes = 0
+            self.unacked.append(frame_data)
+            self.unacked_bytes += frame_size(frame_data)
+            # Resending more than a keyframe's worth would be slower than a keyframe
+            while len(self.unacked) > 1 and self.unacked_bytes > self.stream.last_keyframe_size:
+                self.forget_oldest()
+
+    def acknowledge(self, seq):
+        with self.unacked_lock:
+            while self.unacked and self.unacked[0]['seq'] <= seq:
+                self.forget_oldest()
+
+    def forget_oldest(self):
+        frame_data = self.unacked.popleft()
+        self.unacked_bytes -= frame_size(frame_data)
+        self.resend_base = frame_data['seq']
+
+    def forget_unacked(self):
+        """Drop every kept frame, as on a switch to another monitor whose frames they cannot build on"""
+        with self.unacked_lock:
+            self.unacked.clear()
+            self.unacked_bytes = 0
+            self.resend_base = None
+
+    def resend_after(self, seq):
+        """Frames sent after seq, the last one the viewer applied, or None if they are not all kept"""
+        with self.unacked_lock:
+            missed = [frame_data for frame_data in self.unacked if frame_data['seq'] > seq]
+            if missed and missed[0]['keyframe']:
+                return missed
+            kept = len(self.unacked) - len(missed)
+            previous = self.unacked[kept - 1]['seq'] if kept else self.resend_base
+            return missed if previous == seq else None
+
+    def merge(self, older, newer):
+        merged = merge_frames(older, newer)
+        if merged is newer:
+            return merged
+
+        self.frames_merged += 1
+        if merged is None or frame_size(merged) > self.stream.last_keyframe_size:
+            self.needs_keyframe = True
+            self.resyncs += 1
+            return None
+        return merged
+
+    def stats(self):
+        elapsed = max(time.time() - self.connected_at, 1e-6)
+        return {
+            'id': self.id,
+            'address': self.network.address,
+            'controller': self is self.host.controller,
+            'online': self.online.is_set(),
+            'monitor': self.stream.index,
+            'frames_sent': self.frames_sent,
+            'frames_merged': self.frames_merged,
+            'resyncs': self.resyncs,
+            'fps': round(self.frames_sent / elapsed, 2),
+        }
+
+
+class MonitorStream:
+    """One monitor's capture and encode pipeline, shared by the viewers watching it
+
+    Every monitor has its own source, change detection and encoder, and its
+    own capture and encode threads, so monitors being watched at the same
+    time are processed in parallel. One nobody watches is not captured.
+    """
+
+    def __init__(self, index, source, encoder, tile_size):
+        self.index = index
+        self.source = source
+        self.encoder = encoder
+        self.width, self.height = source.width, source.height
+
+        # Stale captures are dropped; each frame is encoded once for all its viewers
+        self.capture_queue = LatestQueue()
+        self.frame_seq = 0  # Sequence number of this monitor's latest frame
+        self.last_keyframe_size = float('inf')
+
+        # What the controller displays, if it is watching: the screen region to
+        # capture and the size to scale it down to, or None for native resolution
+        self.full_screen = (0, 0, self.width, self.height)
+        self.view = (self.full_screen, None)
+        self.scaler = FrameScaler(tile_size)
+
+        # Capture pacing: the full frame rate while the screen changes, backing
+        # off while it does not. Setting wake cuts the current wait short.
+        self.scheduler = CaptureScheduler()
+        self.wake = threading.Event()
+
+    def describe(self):
+        """(left, top, width, height) of the monitor on the desktop, for MSG_MONITORS"""
+        return self.source.left, self.source.top, self.width, self.height
+
+
 class RemoteHost:
-    def __init__(self, host='0.0.0.0', port=9999, quality=70, frame_rate=15):
+    def __init__(self, host='0.0.0.0', port=9999, quality=70, frame_rate=15,
+                 delta=True, tile_size=DEFAULT_TILE_SIZE, keyframe_interval=DEFAULT_KEYFRAME_INTERVAL,
+                 encode_workers=DEFAULT_ENCODE_WORKERS, adaptive=True, min_quality=30, min_fps=5,
+                 max_downscale=2, max_viewers=DEFAULT_MAX_VIEWERS, source=None, input_sink=None,
+                 detect_moves=True, receive_dir=None, record=None, video=True):
         self.host = host
         self.port = port
         self.quality = quality
@@ -37,116 +583,744 @@ class RemoteHost:
         self.frame_interval = 1.0 / frame_rate
         self.running = False
 
+        # Delta encoding: only changed tiles are sent between keyframes.
+        # Without it every frame is a keyframe, still encoded as parallel bands.
+        # Scrolled or dragged regions are sent as copies of the previous image,
+        # and areas in full motion as video when PyAV is installed.
+        self.delta = delta
+
+        # Pipeline stages: capture -> encode per monitor -> per-viewer send, each
+        # on its own thread. source is one CaptureSource or a list, one per
+        # monitor; by default every attached monitor is offered.
+        if source is None:
+            source = monitor_sources()
+        sources = source if isinstance(source, (list, tuple)) else [source]
+        self.streams = [
+            MonitorStream(index, source, DeltaEncoder(quality, tile_size, keyframe_interval if delta else 0,
+                                                      encode_workers, detect_moves, video), tile_size)
+            for index, source in enumerate(sources)
+        ]
+        # Frame sequence numbers are shared by all monitors, so they keep rising
+        # when the controller switches monitor and its acknowledgements stay in order
+        self.frame_seq = 0
+        self.frame_seq_lock = threading.Lock()
+
+        # Adaptive bitrate: quality and fps become upper bounds tuned to the
+        # controlling viewer's link; other viewers get merged or dropped frames
+        self.bitrate = None
+        if adaptive:
+            self.bitrate = BitrateController(quality, min_quality, frame_rate, min_fps, max_downscale)
+
         # Network and capture
         self.network = NetworkManager(is_server=True)
-        self.sct = mss.mss()
-        self.screen_width, self.screen_height = self.sct.monitors[1]['width'], self.sct.monitors[1]['height']
+        self.max_viewers = max_viewers
+        self.viewers = []
+        self.controller = None  # The one viewer whose input is applied
+        self.viewers_lock = threading.Lock()
+        self.next_viewer_id = 1
 
-        # Input controllers
-        self.mouse = MouseController()
-        self.keyboard = KeyboardController()
+        # Input injection, fed through a queue so a slow injection never
+        # stalls the receive loop and backed-up moves can be skipped
+        self.input_sink = input_sink if input_sink is not None else PynputInputSink()
+        self.input_queue = queue.Queue()
+        self.input_moves_skipped = 0
+
+        # CPU seconds spent per pipeline stage
+        self.stage_cpu = {'capture': 0.0, 'encode': 0.0, 'send': 0.0}
+        self.stage_cpu_lock = threading.Lock()
+
+        # Wall-clock timings and counters, see common.logging_utils
+        self.capture_time = metrics.histogram('host_capture_seconds', 'Grabbing one frame')
+        self.encode_time = metrics.histogram('host_encode_seconds', 'Encoding one capture for all viewers')
+        self.send_time = metrics.histogram('host_send_seconds', 'Sending one frame to one viewer')
+        self.captured_count = metrics.counter('host_frames_captured_total', 'Frames captured')
+        self.idle_skip_count = metrics.counter('host_captures_skipped_total',
+                                               'Captures of an idle, unchanged screen that were not encoded')
+        self.sent_count = metrics.counter('host_frames_sent_total', 'Frames sent, summed over viewers')
+        self.keyframe_count = metrics.counter('host_keyframes_total', 'Keyframes encoded')
+        self.cursor_count = metrics.counter('host_cursor_updates_total', 'Pointer updates sent')
+
+        # Pointer shapes seen so far -> MSG_CURSOR_SHAPE message
+        self.cursor_shapes = {}
+
+        # Where files sent by the controller are written; None refuses them
+        self.receive_dir = receive_dir
+        if receive_dir is not None:
+            os.makedirs(receive_dir, exist_ok=True)
+
+        # Optional recording of the controller's screen and input, see host.recorder
+        self.record_path = record
+        self.recorder = None
 
     def start(self):
         print("Starting remote host...")
-        if not self.network.start_server(self.host, self.port):
+        if not self.network.listen(self.host, self.port, backlog=self.max_viewers):
             print("Failed to start server")
             return False
 
-        print("Waiting for authentication...")
-        if not self.network.authenticate():
-            print("Authentication failed")
-            self.network.close()
-            return False
-
-        print("Authentication successful")
         self.running = True
-        threading.Thread(target=self.screen_sharing_loop, daemon=True).start()
-        threading.Thread(target=self.handle_client_input, daemon=True).start()
+        self.start_recording()
+        threading.Thread(target=self.accept_loop, daemon=True).start()
+        for stream in self.streams:
+            threading.Thread(target=self.capture_loop, args=(stream,), daemon=True).start()
+            threading.Thread(target=self.encode_loop, args=(stream,), daemon=True).start()
+        threading.Thread(target=self.input_loop, daemon=True).start()
+        threading.Thread(target=self.cursor_loop, daemon=True).start()
         print(f"Remote host running on {self.host}:{self.port}")
         return True
 
-    def screen_sharing_loop(self):
-        last_time = 0
-        monitor = {"top": 0, "left": 0, "width": self.screen_width, "height": self.screen_height}
+    def start_recording(self):
+        if self.record_path:
+            self.recorder = SessionRecorder(self, self.record_path)
+            self.recorder.follow(self.control_stream())
+            print(f"Recording the session to {self.record_path}")
+
+    def stop_recording(self):
+        recorder, self.recorder = self.recorder, None
+        if recorder is not None:
+            recorder.close()
+
+    def accept_loop(self):
+        while self.running:
+            try:
+                conn = self.network.accept()
+            except OSError:
+                # Listening socket closed by stop()
+                break
+            threading.Thread(target=self.serve_viewer, args=(conn,), daemon=True).start()
+
+    def serve_viewer(self, conn):
+        print(f"Waiting for authentication from {conn.address}...")
+        hello = conn.authenticate()
+        if hello is None:
+            print("Authentication failed")
+            conn.close()
+            return
+        if hello['type'] == MSG_RESUME:
+            session = self.resume_viewer(conn, hello)
+            if session is not None:
+                self.handle_client_input(session)
+            return
+
+        # Viewers authenticate on their own threads; ids must stay unique
+        with self.viewers_lock:
+            viewer_id = self.next_viewer_id
+            self.next_viewer_id += 1
+        session = ViewerSession(self, conn, viewer_id)
+        if not self.add_viewer(session):
+            print(f"Rejecting {conn.address}: {self.max_viewers} viewers already connected")
+            conn.close()
+            return
+
+        role = "controller" if session is self.controller else "viewer"
+        print(f"Authentication successful; {conn.address} joined as {role} #{session.id}")
+        self.reply(session, self.session_message(session))
+        self.reply(session, self.monitors_message(session))
+        self.wake_capture(session.stream)
+        threading.Thread(target=self.send_loop, args=(session,), daemon=True).start()
+        threading.Thread(target=self.cursor_send_loop, args=(session,), daemon=True).start()
+        self.handle_client_input(session)
+
+    def add_viewer(self, session):
+        """Register an authenticated viewer; False if the host is full"""
+        with self.viewers_lock:
+            if len(self.viewers) >= self.max_viewers:
+                return False
+            self.viewers.append(session)
+            if self.controller is None:
+                self.controller = session
+        return True
+
+    def remove_viewer(self, session):
+        """Unregister a viewer; False if it was already gone"""
+        with self.viewers_lock:
+            if not session.connected:
+                return False
+            session.connected = False
+            self.viewers.remove(session)
+
+            # Hand control to the longest-connected remaining viewer
+            if session is self.controller:
+                self.controller = self.viewers[0] if self.viewers else None
+                if self.controller:
+                    print(f"Viewer #{self.controller.id} now has control")
+                self.update_stream_views()
+
+        session.send_queue.close()
+        session.cursor_queue.close()
+        session.file_receiver.close()
+        print(f"Viewer #{session.id} disconnected")
+        return True
+
+    def disconnect(self, session):
+        if self.remove_viewer(session):
+            session.network.close()
+
+    def session_message(self, session, resumed=False):
+        return {'type': MSG_SESSION, 'resumed': resumed, 'token': session.token}
+
+    def session_to_resume(self, conn, hello):
+        """The session a MSG_RESUME names, if its proof shows the client holds the session's secret"""
+        with self.viewers_lock:
+            for viewer in self.viewers:
+                if hmac.compare_digest(viewer.token, bytes(hello['token'])):
+                    proof = resume_proof(viewer.secret, conn.encryption_key)
+                    return viewer if hmac.compare_digest(proof, bytes(hello['proof'])) else None
+        return None
+
+    def resume_viewer(self, conn, hello):
+        """Carry a session on over a new connection; returns the session, or None if there is none to resume
+
+        The old connection is closed, in case its failure went unnoticed
+        here. The viewer is sent the frames it missed after hello['seq'], the
+        last one it applied, when they are all still kept, else a keyframe.
+        """
+        session = self.session_to_resume(conn, hello)
+        if session is None:
+            print(f"Rejecting {conn.address}: no session to resume")
+            conn.close()
+            return None
+        conn.cipher = resumed_cipher(session.secret, conn.encryption_key, True)
+        session.network.close()
+        if not conn.send_data(self.session_message(session, resumed=True)):
+            conn.close()
+            return None
+
+        # Sending waits for the resend; what is queued meanwhile goes after it
+        with session.send_lock:
+            with self.viewers_lock:
+                if not session.connected:
+                    conn.close()
+                    return None
+                session.network = conn
+            missed = self.catch_up(session, hello['seq'])
+            for frame_data in missed or ():
+                if not conn.send_data(frame_data):
+                    break
+            session.online.set()
+
+        self.wake_capture(session.stream)
+        caught_up = f"resending {len(missed)} frames" if missed is not None else "sending a keyframe"
+        print(f"Viewer #{session.id} resumed its session from {conn.address}, {caught_up}")
+        return session
+
+    def catch_up(self, session, seq):
+        """Frames to resend to a resuming viewer; None when it needs a keyframe instead"""
+        missed = session.resend_after(seq)
+        if missed is None:
+            # Queued deltas build on frames the viewer does not have
+            session.send_queue.clear()
+            session.reset_tile_cache()
+        # Shapes and the pointer may have been lost with the connection
+        session.last_cursor = None
+        session.cursor_shapes.clear()
+        return missed
+
+    def connection_lost(self, session, network):
+        """Called by the receive loop once a viewer's connection is gone; holds the session RESUME_TIMEOUT seconds
+
+        A viewer that sent MSG_LEAVE or closed the connection itself has left,
+        and once the host stops there is nothing to resume; both end the
+        session at once.
+        """
+        with self.viewers_lock:
+            if session.network is not network or not session.connected:
+                return  # Resumed on another connection, or gone already
+            session.online.clear()
+        if network.peer_closed or session.leaving or not self.running:
+            self.disconnect(session)
+            return
+        print(f"Viewer #{session.id} lost its connection; holding its session for {RESUME_TIMEOUT}s")
+        timer = threading.Timer(RESUME_TIMEOUT, self.expire, (session, network))
+        timer.daemon = True
+        timer.start()
+        network.close()
+
+    def send_failed(self, session, network):
+        """Stop sending to a viewer whose connection failed
+
+        The receive loop decides what becomes of the session: the error
+        reaches it too, after anything the viewer sent before, such as
+        MSG_LEAVE.
+        """
+        with self.viewers_lock:
+            if session.network is network:
+                session.online.clear()
+
+    def expire(self, session, network):
+        """End a held session that was not resumed in time; its connection is closed already"""
+        if session.network is network and not session.online.is_set():
+            self.remove_viewer(session)
 
+    def capture_loop(self, stream):
+        next_time = time.perf_counter()
+
+        stream.source.open()
+        try:
+            while self.running:
+                # Sleep until the next capture is due; wake_capture() cuts the wait short
+                if stream.wake.wait(max(next_time - time.perf_counter(), 0)):
+                    stream.wake.clear()
+                now = time.perf_counter()
+
+                # Nobody is watching this monitor; a viewer arriving wakes us
+                viewers = self.recipients(stream)
+                if not viewers:
+                    next_time = now + stream.scheduler.idle_interval
+                    continue
+
+                capture = self.grab_frame(stream)
+                if self.worth_encoding(stream, capture[0], viewers):
+                    # Replaces any capture the encoder has not picked up yet
+                    stream.capture_queue.put(capture)
+                next_time = self.next_capture_time(stream, next_time, now)
+        finally:
+            stream.source.close()
+
+    def next_capture_time(self, stream, due, now):
+        """When to capture after one due at due was taken at now; late captures are skipped, not bunched up"""
+        interval = stream.scheduler.interval(self.bitrate.frame_interval if self.bitrate else self.frame_interval)
+        return max(min(due, now) + interval, now)
+
+    def worth_encoding(self, stream, frame, viewers):
+        """Whether a capture goes to the encoder: always, unless the screen is idle and it matches"""
+        idle = stream.scheduler.idle
+        if stream.scheduler.changed(frame) or not idle:
+            return True
+        # A video region ends once the encoder has seen its area stay calm
+        if stream.encoder.video_active:
+            return True
+        # Viewers that just joined or lost track still need a keyframe
+        if any(viewer.needs_keyframe for viewer in viewers):
+            return True
+        self.idle_skip_count.inc()
+        return False
+
+    def wake_capture(self, stream):
+        """Capture stream right away and at the full rate from then on, e.g. because input arrived"""
+        stream.scheduler.wake()
+        stream.wake.set()
+
+    def watchers(self, stream):
+        """Viewers currently watching stream"""
+        with self.viewers_lock:
+            return [viewer for viewer in self.viewers if viewer.stream is stream]
+
+    def recipients(self, stream):
+        """Who stream's frames and pointer go to: its viewers, and the recorder while it records them"""
+        viewers = self.watchers(stream)
+        recorder = self.recorder
+        if viewers and recorder is not None and recorder.stream is stream:
+            viewers.append(recorder)
+        return viewers
+
+    def grab_frame(self, stream):
+        """Capture one frame; returns (frame, capture time)"""
+        cpu_start = time.thread_time()
+        captured = time.time()
+        with Timer(self.capture_time):
+            region, size = stream.view
+            frame = stream.source.grab() if region == stream.full_screen else stream.source.grab_region(*region)
+            if size is not None:
+                frame = stream.scaler.scale(frame, *size)
+            if self.bitrate:
+                frame = downscale(frame, self.bitrate.scale)
+        self.add_stage_cpu('capture', time.thread_time() - cpu_start)
+        self.captured_count.inc()
+        return frame, captured
+
+    def encode_loop(self, stream):
         while self.running:
-            now = time.time()
-            if now - last_time < self.frame_interval:
-                time.sleep(0.001)
+            capture = stream.capture_queue.get()
+            if capture is None:
                 continue
 
-            shot = self.sct.grab(monitor)
-            img = Image.frombytes("RGB", shot.size, shot.rgb)
-
-            # Draw 5px green border
-            draw = ImageDraw.Draw(img)
-            for i in range(5):
-                draw.rectangle(
-                    [i, i, img.width - 1 - i, img.height - 1 - i],
-                    outline="lime"
-                )
-
-            # JPEG encode
-            buf = io.BytesIO()
-            img.save(buf, format="JPEG", quality=self.quality)
-            jpeg_bytes = buf.getvalue()
-
-            # LZ4 compress
-            compressed = lz4.frame.compress(jpeg_bytes)
-
-            # Send frame
-            frame_data = {
-                'type': MSG_FRAME,
-                'width': img.width,
-                'height': img.height,
-                'data': compressed
-            }
-            if not self.network.send_data(frame_data):
-                print("Send error; stopping.")
-                self.running = False
-                break
+            viewers = self.recipients(stream)
+            if viewers:
+                self.fan_out(stream, viewers, *self.encode_for_viewers(stream, *capture, viewers))
+
+    def encode_for_viewers(self, stream, frame, captured, viewers):
+        """Encode a capture once; returns (delta or None, keyframe for resyncing viewers or None)"""
+        cpu_start = time.thread_time()
+        pool_cpu_start = stream.encoder.worker_cpu
+        start = time.perf_counter()
+        # The recorder follows whatever the viewers' caches do, so it has no say in them
+        sessions = [viewer for viewer in viewers if viewer is not self.recorder]
+        if any(session.tile_cache is not None for session in sessions):
+            # A tile can only be referenced if every viewer holds it and is not about to start over
+            caches = [None if session.cache_reset_pending else session.tile_cache for session in sessions]
+
+            def cached(key):
+                return all(cache is not None and key in cache for cache in caches)
+        else:
+            cached = None
+        video = all(viewer.video for viewer in viewers)
+        resyncing = any(viewer.needs_keyframe for viewer in viewers)
+        if resyncing and video and stream.encoder.video_active:
+            # Video frames build on each other, so a viewer can only join the video at an IDR, which
+            # every viewer then gets in a keyframe
+            stream.encoder.request_keyframe()
+        frame_data = self.encode_frame(stream, frame, captured, cached, video)
 
-            last_time = now
+        # Viewers that joined or fell behind get one keyframe, encoded once for all of them
+        resync = None
+        if resyncing:
+            if frame_data is not None and frame_data['keyframe']:
+                resync = frame_data
+            else:
+                resync = self.encode_resync(stream, frame, captured, frame_data, cached is not None)
 
-    def handle_client_input(self):
+        self.encode_time.observe(time.perf_counter() - start)
+        cpu = time.thread_time() - cpu_start + stream.encoder.worker_cpu - pool_cpu_start
+        self.add_stage_cpu('encode', cpu)
+        return frame_data, resync
+
+    def fan_out(self, stream, viewers, frame_data, resync):
+        # Each viewer's queue merges what its socket has not taken yet. Viewers
+        # that switched monitor since the encode started are skipped; the lock
+        # keeps them from switching while this frame is being queued.
+        with self.viewers_lock:
+            for viewer in viewers:
+                viewer.offer(stream, resync if viewer.needs_keyframe else frame_data)
+
+    def send_loop(self, session):
+        while self.running and session.connected:
+            # While the session is held, frames wait for it in the queue, merged
+            if not session.online.wait(0.5):
+                continue
+            stream = session.stream
+            frame_data = session.send_queue.get(timeout=0.5)
+            if frame_data is None:
+                continue
+
+            # Send frame, keeping it until acknowledged in case it never arrives
+            start = time.time()
+            cpu_start = time.thread_time()
+            with session.send_lock:
+                if session.stream is not stream:
+                    # Taken around a monitor switch, so it may be of the old monitor; start over at a keyframe
+                    session.needs_keyframe = True
+                    continue
+                # A resume may have switched this viewer to a keyframe since the frame was queued
+                if session.needs_keyframe and not frame_data['keyframe']:
+                    continue
+                frame_data = session.sync_tile_cache(frame_data)
+                if frame_data is None:
+                    continue
+                network = session.network
+                session.remember(frame_data)
+                sent = network.send_data(frame_data)
+            if not sent:
+                self.send_failed(session, network)
+                continue
+            self.add_stage_cpu('send', time.thread_time() - cpu_start)
+            self.send_time.observe(time.time() - start)
+            self.sent_count.inc()
+            session.frames_sent += 1
+
+            if self.bitrate and session is self.controller:
+                self.bitrate.on_frame_sent(frame_data['seq'], frame_size(frame_data), time.time() - start,
+                                           network.send_backlog())
+                self.bitrate.update()
+
+    def cursor_loop(self):
         while self.running:
-            data = self.network.receive_data()
+            time.sleep(CURSOR_INTERVAL)
+            for stream in self.streams:
+                viewers = self.recipients(stream)
+                if viewers:
+                    self.fan_out_cursor(stream, viewers, stream.source.cursor())
+
+    def fan_out_cursor(self, stream, viewers, cursor):
+        if cursor is None:
+            return
+        update = self.cursor_update(stream, *cursor)
+        for viewer in viewers:
+            viewer.offer_cursor(*update)
+
+    def cursor_update(self, stream, x, y, shape):
+        """Returns (MSG_CURSOR message, MSG_CURSOR_SHAPE message or None)"""
+        shape_data = None
+        if shape is not None:
+            shape_data = self.cursor_shapes.get(shape)
+            if shape_data is None:
+                shape_data = cursor_shape_message(*shape)
+                if len(self.cursor_shapes) >= MAX_CURSOR_SHAPES:
+                    self.cursor_shapes.clear()
+                self.cursor_shapes[shape] = shape_data
+
+        # Relative to the region being streamed; outside 0..1 when off the viewer's screen
+        left, top, width, height = stream.view[0]
+        cursor = {
+            'type': MSG_CURSOR,
+            'x': (x - left) / width,
+            'y': (y - top) / height,
+            'shape': shape_data['shape'] if shape_data else 0,
+        }
+        return cursor, shape_data
+
+    def cursor_send_loop(self, session):
+        while self.running and session.connected:
+            if not session.online.wait(0.5):
+                continue
+            update = session.cursor_queue.get(timeout=0.5)
+            if update is None:
+                continue
+
+            # A shape goes out once per viewer; after that the id is enough
+            cursor, shape = update
+            network = session.network
+            if shape is not None and shape['shape'] not in session.cursor_shapes:
+                if not network.send_data(shape):
+                    self.send_failed(session, network)
+                    continue
+                session.cursor_shapes.add(shape['shape'])
+            if not network.send_data(cursor):
+                self.send_failed(session, network)
+                continue
+            self.cursor_count.inc()
+
+    def encode_frame(self, stream, frame, captured, cached=None, video=False):
+        if self.bitrate:
+            stream.encoder.quality = self.bitrate.quality
+        keyframe, copies, tiles = stream.encoder.encode(frame, cached, video)
+        if not tiles and not copies:
+            return None
+
+        stream.frame_seq = self.next_frame_seq()
+        return self.frame_message(stream, frame, keyframe, tiles, captured, copies)
+
+    def encode_resync(self, stream, frame, captured, frame_data, store_tiles=False):
+        # Same sequence number as the delta: both describe this capture
+        if frame_data is None:
+            stream.frame_seq = self.next_frame_seq()
+        # Resyncing viewers' caches may be about to be emptied, so nothing is
+        # referenced, but tiles are stored to fill them up again
+        cached = (lambda key: False) if store_tiles else None
+        return self.frame_message(stream, frame, True, stream.encoder.keyframe(frame, cached), captured)
+
+    def next_frame_seq(self):
+        with self.frame_seq_lock:
+            self.frame_seq += 1
+            return self.frame_seq
+
+    def frame_message(self, stream, frame, keyframe, tiles, captured, copies=()):
+        height, width = frame.shape[:2]
+        frame_data = {
+            'type': MSG_FRAME_DELTA,
+            'seq': stream.frame_seq,
+            'width': width,
+            'height': height,
+            'keyframe': keyframe,
+            'cache_reset': False,
+            'captured': captured,
+            'copies': list(copies),
+            'tiles': tiles
+        }
+        if keyframe:
+            stream.last_keyframe_size = frame_size(frame_data)
+            self.keyframe_count.inc()
+        return frame_data
+
+    def handle_client_input(self, session):
+        network = session.network
+        while self.running and session.connected and session.network is network:
+            data = network.receive_data()
             if not data:
+                # Closed or corrupt stream; the viewer may resume on a new connection
+                self.connection_lost(session, network)
+                break
+
+            self.handle_message(session, data)
+
+    def handle_message(self, session, data):
+        t = data.get('type')
+        # Input is applied in order on the input thread, and only from the controller
+        if t in INPUT_TYPES:
+            if session is self.controller:
+                self.queue_input(data)
+        elif t == MSG_INPUT_BATCH:
+            if session is self.controller:
+                for event in data['events']:
+                    self.queue_input(event)
+
+        # Viewer resized its window or zoomed
+        elif t == MSG_VIEWPORT:
+            session.viewport = data
+            if session is self.controller:
+                self.update_stream_views()
+                self.wake_capture(session.stream)
+
+        # Viewer switched to another monitor
+        elif t == MSG_MONITOR_SELECT:
+            self.select_monitor(session, data['monitor'])
+
+        # Client lost track of the canvas and needs a full refresh; its tile
+        # cache may have missed stores too, so both copies start over
+        elif t == MSG_KEYFRAME_REQUEST:
+            session.reset_tile_cache()
+            self.wake_capture(session.stream)
+
+        # Client keeps decoded tiles; from the next keyframe on, frames may refer to them
+        elif t == MSG_TILE_CACHE:
+            session.tile_cache = TileCache(data['budget']) if data['budget'] else None
+            session.reset_tile_cache()
+            self.wake_capture(session.stream)
+
+        # Client finished decoding a frame
+        elif t == MSG_FRAME_ACK:
+            session.acknowledge(data['seq'])
+            if self.bitrate and session is self.controller:
+                self.bitrate.on_ack(data['seq'])
+
+        # Client decodes video; its stream may switch to video for areas in full motion
+        elif t == MSG_VIDEO:
+            session.video = data['codec'] == VIDEO_CODEC
+
+        # The connection closing next is the viewer leaving, not a failure
+        elif t == MSG_LEAVE:
+            session.leaving = True
+
+        # File upload; only the controller, who could type the file in anyway, may send one
+        elif t in (MSG_FILE_OFFER, MSG_FILE_TRANSFER):
+            reply = session.file_receiver.handle(data, allowed=session is self.controller)
+            if reply is not None:
+                self.reply(session, reply)
+
+    def reply(self, session, message):
+        """Answer a viewer from the thread that received its message"""
+        network = session.network
+        if not network.send_data(message):
+            self.send_failed(session, network)
+
+    def monitors_message(self, session):
+        """MSG_MONITORS listing every monitor and the one session is watching"""
+        return {'type': MSG_MONITORS, 'monitor': session.stream.index,
+                'monitors': [stream.describe() for stream in self.streams]}
+
+    def select_monitor(self, session, index):
+        """Move a viewer to another monitor's stream, starting with a keyframe of it"""
+        if not 0 <= index < len(self.streams):
+            return
+        # send_lock waits out a frame of the old monitor being sent, so none is kept or sent after the switch
+        with session.send_lock:
+            with self.viewers_lock:
+                if session.stream is self.streams[index]:
+                    return
+                session.stream = self.streams[index]
+                session.needs_keyframe = True
+                # Frames of the old monitor waiting to be sent or resent would be drawn on the new one
+                session.send_queue.clear()
+                session.forget_unacked()
+                if session is self.controller:
+                    self.update_stream_views()
+        self.wake_capture(session.stream)
+        print(f"Viewer #{session.id} switched to monitor {index + 1}")
+
+    def update_stream_views(self):
+        """Capture and scale for the controller's viewport; a new frame size starts with a keyframe
+
+        Only the monitor the controller is watching follows its viewport;
+        the others are sent whole at native resolution.
+        """
+        controller = self.controller
+        for stream in self.streams:
+            if controller is None or controller.stream is not stream or controller.viewport is None:
+                stream.view = (stream.full_screen, None)
+            else:
+                stream.view = viewport_region(controller.viewport, stream.width, stream.height)
+        if self.recorder is not None:
+            self.recorder.follow(self.control_stream())
+
+    def control_stream(self):
+        """The monitor the controller is watching, which its input applies to"""
+        controller = self.controller
+        return controller.stream if controller is not None else self.streams[0]
+
+    def screen_position(self, x, y):
+        """Controller coordinates, as fractions of the region it is shown -> desktop pixels"""
+        stream = self.control_stream()
+        left, top, width, height = stream.view[0]
+        return stream.source.left + left + int(x * width), stream.source.top + top + int(y * height)
+
+    def queue_input(self, event):
+        self.input_queue.put(event)
+
+    def input_loop(self):
+        while self.running:
+            try:
+                events = [self.input_queue.get(timeout=0.5)]
+            except queue.Empty:
                 continue
 
-            t = data.get('type')
-            # Mouse move
-            if t == MSG_MOUSE_MOVE:
-                x = int(data['x'] * self.screen_width)
-                y = int(data['y'] * self.screen_height)
-                self.mouse.position = (x, y)
-
-            # Mouse click
-            elif t == MSG_MOUSE_CLICK:
-                x = int(data['x'] * self.screen_width)
-                y = int(data['y'] * self.screen_height)
-                btn = Button.left if data.get('button') == 'left' else Button.right
-                clicks = data.get('clicks', 1)
-                # move first in case
-                self.mouse.position = (x, y)
-                for _ in range(clicks):
-                    self.mouse.click(btn)
-
-            # Key press
-            elif t == MSG_KEY_PRESS:
-                key_str = data.get('key')
-                key = KEY_MAP.get(key_str, key_str)
-                self.keyboard.press(key)
-
-            # Key release
-            elif t == MSG_KEY_RELEASE:
-                key_str = data.get('key')
-                key = KEY_MAP.get(key_str, key_str)
-                self.keyboard.release(key)
+            # Take everything that piled up while the last batch was applied
+            while True:
+                try:
+                    events.append(self.input_queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            self.apply_inputs(events)
+            # The screen is about to change; capture the result now and at the full rate from then on
+            self.wake_capture(self.control_stream())
+
+    def apply_inputs(self, events):
+        coalesced = coalesce_input(events)
+        self.input_moves_skipped += len(events) - len(coalesced)
+        recorder = self.recorder
+        for event in coalesced:
+            self.apply_input(event)
+            if recorder is not None:
+                recorder.record_input(event)
+
+    def apply_input(self, data):
+        t = data.get('type')
+        # Mouse move
+        if t == MSG_MOUSE_MOVE:
+            self.input_sink.move(*self.screen_position(data['x'], data['y']))
+
+        # Mouse click
+        elif t == MSG_MOUSE_CLICK:
+            x, y = self.screen_position(data['x'], data['y'])
+            self.input_sink.click(x, y, data.get('button'), data.get('clicks', 1))
+
+        # Key press
+        elif t == MSG_KEY_PRESS:
+            self.input_sink.press(data.get('key'))
+
+        # Key release
+        elif t == MSG_KEY_RELEASE:
+            self.input_sink.release(data.get('key'))
+
+    def add_stage_cpu(self, stage, seconds):
+        with self.stage_cpu_lock:
+            self.stage_cpu[stage] += seconds
+
+    def stats(self):
+        """Runtime statistics, including the bitrate controller's decisions"""
+        return {
+            'frames_encoded': self.frame_seq,
+            'captures_dropped': sum(stream.capture_queue.dropped for stream in self.streams),
+            'captures_skipped': self.idle_skip_count.value,
+            'idle_monitors': [stream.index for stream in self.streams if stream.scheduler.idle],
+            'video_monitors': [stream.index for stream in self.streams if stream.encoder.video_active],
+            'input_moves_skipped': self.input_moves_skipped,
+            'stage_cpu': dict(self.stage_cpu),
+            'bitrate': self.bitrate.stats() if self.bitrate else None,
+            'viewers': [viewer.stats() for viewer in list(self.viewers)],
+        }
 
     def stop(self):
         self.running = False
+        for stream in self.streams:
+            stream.capture_queue.close()
+            stream.wake.set()
         self.network.close()
+        for viewer in list(self.viewers):
+            self.disconnect(viewer)
+        for stream in self.streams:
+            stream.encoder.close()
+        self.stop_recording()
         print("Remote host stopped")
 
 
@@ -157,15 +1331,48 @@ def main():
     parser.add_argument('--port', type=int, default=9999)
     parser.add_argument('--quality', type=int, default=70)
     parser.add_argument('--fps', type=int, default=15)
+    parser.add_argument('--no-delta', action='store_true')
+    parser.add_argument('--no-move-detection', action='store_true')
+    parser.add_argument('--no-video', action='store_true')
+    parser.add_argument('--tile-size', type=int, default=DEFAULT_TILE_SIZE)
+    parser.add_argument('--keyframe-interval', type=int, default=DEFAULT_KEYFRAME_INTERVAL)
+    parser.add_argument('--encode-workers', type=int, default=DEFAULT_ENCODE_WORKERS)
+    parser.add_argument('--no-adaptive', action='store_true')
+    parser.add_argument('--min-quality', type=int, default=30)
+    parser.add_argument('--min-fps', type=int, default=5)
+    parser.add_argument('--max-downscale', type=int, default=2)
+    parser.add_argument('--max-viewers', type=int, default=DEFAULT_MAX_VIEWERS)
+    parser.add_argument('--stats-interval', type=float, default=DEFAULT_STATS_INTERVAL)
+    parser.add_argument('--metrics')
+    parser.add_argument('--receive-dir', help='Accept files from the controlling viewer into this directory')
+    parser.add_argument('--recording', metavar='PATH', help="Record the controller's screen and input to this file")
     args = parser.parse_args()
 
     host = RemoteHost(
         host=args.host,
         port=args.port,
         quality=args.quality,
-        frame_rate=args.fps
+        frame_rate=args.fps,
+        delta=not args.no_delta,
+        tile_size=args.tile_size,
+        keyframe_interval=args.keyframe_interval,
+        encode_workers=args.encode_workers,
+        adaptive=not args.no_adaptive,
+        min_quality=args.min_quality,
+        min_fps=args.min_fps,
+        max_downscale=args.max_downscale,
+        max_viewers=args.max_viewers,
+        detect_moves=not args.no_move_detection,
+        receive_dir=args.receive_dir,
+        record=args.recording,
+        video=not args.no_video
     )
 
+    if args.stats_interval > 0:
+        StatsLogger(interval=args.stats_interval, prefix="host").start()
+    if args.metrics:
+        start_metrics_server(args.metrics)
+
     try:
         if host.start():
             print("Press Ctrl+C to stop")
@@ -0,0 +1,98 @@
+import sys
+import os
+
+# Add parent dir for common modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.imaging import TILE_CACHED, TILE_STORE
+from common.recording import RecordingWriter
+from common.tile_cache import TileCache, DEFAULT_TILE_CACHE_MB
+from common.video import video_available
+
+
+class SessionRecorder:
+    """Records what the controller sees and does to a file, from the frames already encoded for viewers
+
+    It takes part in the encode fan-out like a viewer of the controller's
+    monitor: it is offered every frame of that monitor and pointer updates,
+    and needs a keyframe to start and whenever it loses track, e.g. when the
+    controller switches monitor. The controller's input is recorded as it is
+    applied.
+
+    Nothing is re-encoded. Tile cache references are replaced with the
+    encoded tile they refer to, which it keeps from the frame that stored
+    it, so every keyframe in the file can be played from without a cache.
+    """
+
+    def __init__(self, host, path, budget=DEFAULT_TILE_CACHE_MB * 1024 * 1024):
+        self.host = host
+        self.writer = RecordingWriter(path)
+        self.stream = host.streams[0]
+        self.needs_keyframe = True
+
+        # Encoded tiles by cache key, sized by their encoded bytes. Whether
+        # tiles are cached at all is up to the viewers: with no viewer cache
+        # there are no stores or references to follow.
+        self.stored_tiles = TileCache(budget)
+
+        # Video tiles are kept as they were sent; playing them back needs PyAV too
+        self.video = video_available()
+
+        self.last_cursor = None
+        self.cursor_shapes = set()
+        self.frames = 0
+
+    def follow(self, stream):
+        """Record stream from its next keyframe on"""
+        if stream is not self.stream:
+            self.stream = stream
+            self.needs_keyframe = True
+
+    def offer(self, stream, frame_data):
+        if frame_data is None or stream is not self.stream:
+            return
+        if frame_data['keyframe']:
+            self.needs_keyframe = False
+        elif self.needs_keyframe:
+            return
+
+        tiles = self.resolve(frame_data['tiles'])
+        if tiles is None:
+            # A reference this recording cannot resolve; start over from a keyframe
+            self.needs_keyframe = True
+            self.host.wake_capture(stream)
+            return
+        self.writer.write(dict(frame_data, tiles=tiles, cache_reset=False))
+        self.frames += 1
+
+    def resolve(self, tiles):
+        """A frame's tiles without cache operations; None if a referenced tile is unknown"""
+        resolved = []
+        for tile in tiles:
+            x, y, w, h, codec, data = tile
+            if codec == TILE_STORE:
+                # Stores follow the tile they store
+                self.stored_tiles.put(data, resolved[-1], len(resolved[-1][5]))
+            elif codec == TILE_CACHED:
+                stored = self.stored_tiles.get(data)
+                if stored is None or stored[2:4] != (w, h):
+                    return None
+                resolved.append((x, y, w, h) + stored[4:])
+            else:
+                resolved.append(tile)
+        return resolved
+
+    def offer_cursor(self, cursor, shape):
+        if cursor == self.last_cursor:
+            return
+        self.last_cursor = cursor
+        if shape is not None and shape['shape'] not in self.cursor_shapes:
+            self.cursor_shapes.add(shape['shape'])
+            self.writer.write(shape)
+        self.writer.write(cursor)
+
+    def record_input(self, event):
+        self.writer.write(event)
+
+    def close(self):
+        self.writer.close()
+        print(f"Recorded {self.frames} frames to {self.writer.path}")
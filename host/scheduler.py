@@ -0,0 +1,61 @@
+import zlib
+
+# Change detection samples every SAMPLE_STEP-th row of a capture
+SAMPLE_STEP = 4
+
+# Unchanged captures in a row before the rate starts backing off, and the
+# longest the screen then goes between probes
+IDLE_AFTER = 8
+IDLE_INTERVAL = 0.5
+
+
+class CaptureScheduler:
+    """Decides how long to wait between captures, slowing down while the screen is unchanged
+
+    Each capture is checked against earlier ones with a CRC of every
+    SAMPLE_STEP-th row, starting one row further down each time, so every
+    row is looked at once per SAMPLE_STEP captures at the cost of hashing a
+    fraction of the frame. After idle_after unchanged captures the interval
+    doubles with each further one, up to idle_interval; a change, or input
+    reported through wake(), brings back the full rate at once.
+
+    While idle, captures whose sample matches are not worth encoding: the
+    encoder would find nothing, or with delta encoding off send the same
+    image again. A change confined to rows the sample skipped is picked up
+    within SAMPLE_STEP probes.
+    """
+
+    def __init__(self, step=SAMPLE_STEP, idle_after=IDLE_AFTER, idle_interval=IDLE_INTERVAL):
+        self.step = step
+        self.idle_after = idle_after
+        self.idle_interval = idle_interval
+        self.samples = [None] * step  # Per starting row: (frame shape, CRC) when last sampled
+        self.phase = 0
+        self.unchanged = 0  # Captures in a row whose sample matched
+
+    @property
+    def idle(self):
+        return self.unchanged > self.idle_after
+
+    def changed(self, frame):
+        """Sample a capture; True if it differs from what the same rows held last time"""
+        rows = frame[self.phase::self.step]
+        sample = (frame.shape, zlib.crc32(rows if rows.flags.c_contiguous else rows.copy()))
+        changed = sample != self.samples[self.phase]
+        self.samples[self.phase] = sample
+        self.phase = (self.phase + 1) % self.step
+
+        self.unchanged = 0 if changed else self.unchanged + 1
+        return changed
+
+    def wake(self):
+        """Something is about to change, e.g. input arrived; go back to the full rate"""
+        self.unchanged = 0
+
+    def interval(self, frame_interval):
+        """Seconds until the next capture, given the full-rate interval"""
+        backoff = self.unchanged - self.idle_after
+        if backoff <= 0:
+            return frame_interval
+        # Capped well before the power of two could overflow a float
+        return min(frame_interval * 2 ** min(backoff, 32), max(self.idle_interval, frame_interval))
@@ -0,0 +1,253 @@
+import math
+import time
+
+import numpy as np
+
+from host.host import CaptureSource
+
+# Glyphs are random bitmaps: close enough to text for codecs and diffing
+GLYPH_WIDTH, GLYPH_HEIGHT, LINE_HEIGHT = 7, 12, 16
+GLYPH_COUNT = 64
+
+BACKGROUND = (250, 250, 250)
+INK = (40, 40, 40)
+
+
+def bgrx(color):
+    """(r, g, b) -> BGRX pixel value"""
+    r, g, b = color
+    return np.array([b, g, r, 255], dtype=np.uint8)
+
+
+def glyph_atlas(rng):
+    """GLYPH_COUNT coverage bitmaps; glyph 0 is a space"""
+    atlas = rng.random((GLYPH_COUNT, GLYPH_HEIGHT, GLYPH_WIDTH)) > 0.55
+    atlas[:, :, -1] = False  # Letter spacing
+    atlas[:, :2] = False  # Ascender gap
+    atlas[0] = False
+    return atlas
+
+
+def random_text(rng, lines, columns):
+    """Glyph ids for ragged lines of words, with blank lines between paragraphs"""
+    text = rng.integers(1, GLYPH_COUNT, size=(lines, columns))
+    text[rng.random((lines, columns)) < 0.18] = 0  # Word gaps
+    lengths = rng.integers(columns // 3, columns, size=lines)
+    lengths[rng.random(lines) < 0.1] = 0
+    text[np.arange(columns) >= lengths[:, None]] = 0
+    return text
+
+
+def render_text(atlas, text):
+    """Coverage mask of (lines * LINE_HEIGHT, columns * GLYPH_WIDTH) for a grid of glyph ids"""
+    lines, columns = text.shape
+    glyphs = atlas[text]  # lines, columns, GLYPH_HEIGHT, GLYPH_WIDTH
+    mask = np.zeros((lines, LINE_HEIGHT, columns, GLYPH_WIDTH), dtype=bool)
+    mask[:, :GLYPH_HEIGHT] = glyphs.transpose(0, 2, 1, 3)
+    return mask.reshape(lines * LINE_HEIGHT, columns * GLYPH_WIDTH)
+
+
+def paint(frame, mask, color, x=0, y=0):
+    """Fill the pixels under mask, placed at (x, y), with color"""
+    h, w = mask.shape
+    frame[y:y + h, x:x + w][mask] = bgrx(color)
+
+
+def desktop(width, height, rng):
+    """Wallpaper, a couple of windows and a taskbar"""
+    ys = np.linspace(0, 1, height, dtype=np.float32)[:, None]
+    xs = np.linspace(0, 1, width, dtype=np.float32)[None, :]
+    frame = np.empty((height, width, 4), dtype=np.uint8)
+    frame[..., 0] = 120 + 100 * ys
+    frame[..., 1] = 60 + 80 * xs * ys
+    frame[..., 2] = 40 + 60 * xs
+    frame[..., 3] = 255
+
+    atlas = glyph_atlas(rng)
+    for left, top, right, bottom in ((0.05, 0.08, 0.55, 0.7), (0.4, 0.25, 0.92, 0.88)):
+        x, y = int(left * width), int(top * height)
+        w, h = int((right - left) * width), int((bottom - top) * height)
+        frame[y:y + h, x:x + w] = bgrx(BACKGROUND)
+        frame[y:y + 24, x:x + w] = bgrx((60, 90, 150))
+        text = random_text(rng, (h - 40) // LINE_HEIGHT, (w - 20) // GLYPH_WIDTH)
+        paint(frame, render_text(atlas, text), INK, x + 10, y + 32)
+
+    frame[height - 32:] = bgrx((30, 30, 36))
+    return frame
+
+
+def arrow_cursor():
+    """A white-outlined black arrow as (hot_x, hot_y, width, height, straight-alpha BGRA)"""
+    height, width = 19, 12
+    ys, xs = np.mgrid[0:height, 0:width]
+    outline = (xs <= ys * 0.65) & (ys < height - 2)
+    fill = (xs >= 1) & (xs <= ys * 0.65 - 1.3) & (ys < height - 3)
+    pixels = np.zeros((height, width, 4), dtype=np.uint8)
+    pixels[outline] = (255, 255, 255, 255)
+    pixels[fill] = (0, 0, 0, 255)
+    return 0, 0, width, height, pixels.tobytes()
+
+
+class SyntheticSource(CaptureSource):
+    """Deterministic generated screen content for running the host without a display
+
+    The pointer circles the middle of the screen unless cursor is False.
+    """
+
+    def __init__(self, width=1280, height=720, seed=0, cursor=True):
+        self.width = width
+        self.height = height
+        self.rng = np.random.default_rng(seed)
+        self.frame_index = 0
+        self.pointer_shape = arrow_cursor() if cursor else None
+
+    def grab(self):
+        frame = self.render(self.frame_index)
+        self.frame_index += 1
+        return frame
+
+    def cursor(self):
+        if self.pointer_shape is None:
+            return None
+        angle = time.time() * 1.5
+        radius = min(self.width, self.height) / 4
+        x = int(self.width / 2 + radius * math.cos(angle))
+        y = int(self.height / 2 + radius * math.sin(angle))
+        return x, y, self.pointer_shape
+
+    def render(self, index):
+        raise NotImplementedError
+
+
+class StaticDesktopSource(SyntheticSource):
+    """An idle desktop: the same image every frame"""
+
+    def __init__(self, width=1280, height=720, seed=0, cursor=True):
+        super().__init__(width, height, seed, cursor)
+        self.frame = desktop(width, height, self.rng)
+        self.frame.flags.writeable = False
+
+    def render(self, index):
+        # Never modified, so handing out the same buffer is safe
+        return self.frame
+
+
+class TypingSource(SyntheticSource):
+    """Someone typing in a full-screen editor with a blinking cursor"""
+
+    def __init__(self, width=1280, height=720, seed=0, chars_per_frame=1, cursor=True):
+        super().__init__(width, height, seed, cursor)
+        self.chars_per_frame = chars_per_frame
+        self.atlas = glyph_atlas(self.rng)
+        self.columns = (width - 40) // GLYPH_WIDTH
+        self.lines = (height - 40) // LINE_HEIGHT
+        self.text = random_text(self.rng, self.lines, self.columns).ravel()
+        self.typed = 0
+        self.page = np.empty((height, width, 4), dtype=np.uint8)
+        self.page[:] = bgrx(BACKGROUND)
+
+    def render(self, index):
+        for _ in range(self.chars_per_frame):
+            if self.typed == len(self.text):
+                # Page full; start a new one
+                self.page[:] = bgrx(BACKGROUND)
+                self.typed = 0
+            line, column = divmod(self.typed, self.columns)
+            x, y = self.cursor_position(line, column)
+            paint(self.page, render_text(self.atlas, self.text[self.typed:self.typed + 1, None]), INK, x, y)
+            self.typed += 1
+
+        frame = self.page.copy()
+        if index // 8 % 2 == 0:
+            x, y = self.cursor_position(*divmod(self.typed, self.columns))
+            if y + GLYPH_HEIGHT <= self.height:
+                frame[y:y + GLYPH_HEIGHT, x:x + 1] = bgrx(INK)
+        return frame
+
+    def cursor_position(self, line, column):
+        return 20 + column * GLYPH_WIDTH, 20 + line * LINE_HEIGHT
+
+
+class ScrollingSource(SyntheticSource):
+    """A long text page scrolling under a fixed browser toolbar"""
+
+    TOOLBAR_HEIGHT = 64
+
+    def __init__(self, width=1280, height=720, seed=0, pixels_per_frame=8, cursor=True):
+        super().__init__(width, height, seed, cursor)
+        self.pixels_per_frame = pixels_per_frame
+        atlas = glyph_atlas(self.rng)
+        lines = 4 * height // LINE_HEIGHT
+        text = random_text(self.rng, lines, (width - 80) // GLYPH_WIDTH)
+        self.document = np.empty((lines * LINE_HEIGHT, width, 4), dtype=np.uint8)
+        self.document[:] = bgrx(BACKGROUND)
+        paint(self.document, render_text(atlas, text), INK, 40, 0)
+        self.toolbar = np.empty((self.TOOLBAR_HEIGHT, width, 4), dtype=np.uint8)
+        self.toolbar[:] = bgrx((222, 225, 230))
+
+    def render(self, index):
+        view_height = self.height - self.TOOLBAR_HEIGHT
+        span = len(self.document) - view_height
+        top = index * self.pixels_per_frame % span
+        frame = np.empty((self.height, self.width, 4), dtype=np.uint8)
+        frame[:self.TOOLBAR_HEIGHT] = self.toolbar
+        frame[self.TOOLBAR_HEIGHT:] = self.document[top:top + view_height]
+        return frame
+
+
+class VideoSource(SyntheticSource):
+    """Full-motion content: every pixel changes every frame"""
+
+    BLOCK = 8  # The pattern is computed at 1/BLOCK resolution and blown up
+
+    def __init__(self, width=1280, height=720, seed=0, cursor=True):
+        super().__init__(width, height, seed, cursor)
+        rows, cols = -(-height // self.BLOCK), -(-width // self.BLOCK)
+        self.ys, self.xs = np.mgrid[0:rows, 0:cols].astype(np.float32) / 16
+        self.grain = self.rng.integers(0, 12, size=(height, width), dtype=np.uint8)
+
+    def render(self, index):
+        t = index / 10
+        plasma = (np.sin(self.xs + t) + np.sin(self.ys * 1.3 - t) + np.sin((self.xs + self.ys) / 2 + t * 0.7))
+        level = ((plasma + 3) * 40).astype(np.uint8)
+        full = level.repeat(self.BLOCK, 0).repeat(self.BLOCK, 1)[:self.height, :self.width]
+        # Grain shifted per frame so even flat areas never repeat
+        grain = np.roll(self.grain, index * 7, axis=1)
+
+        frame = np.empty((self.height, self.width, 4), dtype=np.uint8)
+        frame[..., 0] = full + grain
+        frame[..., 1] = 255 - full
+        frame[..., 2] = (full >> 1) + grain
+        frame[..., 3] = 255
+        return frame
+
+
+class AppSwitchSource(SyntheticSource):
+    """Alt-tabbing between a few full-screen windows, so every screen seen comes back
+
+    Windows switch on the clock rather than per capture, as a person would,
+    since the host captures an unchanged screen less often.
+    """
+
+    def __init__(self, width=1280, height=720, seed=0, windows=3, seconds_per_window=0.5, cursor=True):
+        super().__init__(width, height, seed, cursor)
+        self.seconds_per_window = seconds_per_window
+        self.windows = [desktop(width, height, self.rng) for _ in range(windows)]
+        for window in self.windows:
+            window.flags.writeable = False
+        self.started = None
+
+    def render(self, index):
+        if self.started is None:
+            self.started = time.time()
+        window = int((time.time() - self.started) / self.seconds_per_window)
+        return self.windows[window % len(self.windows)]
+
+
+SCENES = {
+    'static': StaticDesktopSource,
+    'typing': TypingSource,
+    'scrolling': ScrollingSource,
+    'video': VideoSource,
+    'switching': AppSwitchSource,
+}
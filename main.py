@@ -1,10 +1,13 @@
 import sys
 import argparse
+import asyncio
+
+from common.imaging import DEFAULT_ENCODE_WORKERS
 
 
 def main():
     parser = argparse.ArgumentParser(description='Remote Access and Control MVP')
-    parser.add_argument('mode', choices=['host', 'client'], help='Start as host or client')
+    parser.add_argument('mode', choices=['host', 'client', 'play'], help='Start as host or client, or play a recording')
 
     # Host-specific arguments
     parser.add_argument('--host', default='0.0.0.0',
@@ -12,6 +15,40 @@ def main():
     parser.add_argument('--port', type=int, default=9999, help='Port to use')
     parser.add_argument('--quality', type=int, default=70, help='[Host only] JPEG compression quality (0-100)')
     parser.add_argument('--fps', type=int, default=15, help='[Host only] Target frames per second')
+    parser.add_argument('--no-delta', action='store_true',
+                        help='[Host only] Send every frame in full instead of only changed tiles')
+    parser.add_argument('--no-move-detection', action='store_true',
+                        help='[Host only] Re-encode scrolled or dragged content instead of copying it')
+    parser.add_argument('--no-video', action='store_true',
+                        help='[Host only] Keep full-motion areas on the tile codecs instead of streaming them as H.264')
+    parser.add_argument('--tile-size', type=int, default=64, help='[Host only] Tile size in pixels for delta encoding')
+    parser.add_argument('--keyframe-interval', type=int, default=150,
+                        help='[Host only] Frames between full keyframes in delta mode')
+    parser.add_argument('--encode-workers', type=int, default=DEFAULT_ENCODE_WORKERS,
+                        help='[Host only] Threads used to encode frame tiles in parallel')
+    parser.add_argument('--no-adaptive', action='store_true',
+                        help='[Host only] Keep --quality and --fps fixed instead of adapting them to the link')
+    parser.add_argument('--min-quality', type=int, default=30, help='[Host only] Lowest JPEG quality when adapting')
+    parser.add_argument('--min-fps', type=int, default=5, help='[Host only] Lowest frame rate when adapting')
+    parser.add_argument('--max-downscale', type=int, default=2,
+                        help='[Host only] Largest capture downscale factor when adapting (1 disables)')
+    parser.add_argument('--max-viewers', type=int, default=8,
+                        help='[Host only] Clients that may watch at once; the first one has control')
+    parser.add_argument('--receive-dir',
+                        help='[Host only] Accept files from the controlling client into this directory')
+    parser.add_argument('--recording', metavar='PATH',
+                        help="[Host] Record the controlling client's screen and input to this file; "
+                             "[play] the recording to play")
+    parser.add_argument('--asyncio', action='store_true',
+                        help='[Host only] Run the host on an asyncio event loop instead of threads')
+    parser.add_argument('--gpu', action='store_true',
+                        help='[Client only] Scale the remote screen with OpenGL when available')
+    parser.add_argument('--tile-cache-mb', type=int, default=64,
+                        help='[Client only] Megabytes of tiles kept for the host to refer back to (0 disables)')
+    parser.add_argument('--stats-interval', type=float, default=10,
+                        help='Seconds between per-stage timing log lines (0 disables)')
+    parser.add_argument('--metrics', metavar='ADDRESS',
+                        help='Serve Prometheus metrics on host:port or unix:/path')
 
     args = parser.parse_args()
 
@@ -19,15 +56,44 @@ def main():
         # Import and run host
         try:
             from host.host import RemoteHost
+            host_class = RemoteHost
+            if args.asyncio:
+                from host.async_host import AsyncRemoteHost
+                host_class = AsyncRemoteHost
 
-            host = RemoteHost(
+            host = host_class(
                 host=args.host,
                 port=args.port,
                 quality=args.quality,
-                frame_rate=args.fps
+                frame_rate=args.fps,
+                delta=not args.no_delta,
+                tile_size=args.tile_size,
+                keyframe_interval=args.keyframe_interval,
+                encode_workers=args.encode_workers,
+                adaptive=not args.no_adaptive,
+                min_quality=args.min_quality,
+                min_fps=args.min_fps,
+                max_downscale=args.max_downscale,
+                max_viewers=args.max_viewers,
+                detect_moves=not args.no_move_detection,
+                receive_dir=args.receive_dir,
+                record=args.recording,
+                video=not args.no_video
             )
 
-            if host.start():
+            from common.logging_utils import StatsLogger, start_metrics_server
+            if args.stats_interval > 0:
+                StatsLogger(interval=args.stats_interval, prefix="host").start()
+            if args.metrics:
+                start_metrics_server(args.metrics)
+
+            if args.asyncio:
+                print("Press Ctrl+C to stop the server")
+                try:
+                    asyncio.run(host.run())
+                except KeyboardInterrupt:
+                    print("\nStopping server...")
+            elif host.start():
                 print("Press Ctrl+C to stop the server")
                 try:
                     while host.running:
@@ -45,7 +111,17 @@ def main():
         # Import and run client
         try:
             from client.client import main as client_main
-            client_main()
+            client_main(args.stats_interval, args.metrics, args.gpu, args.tile_cache_mb)
+        except ImportError:
+            print("Error: Could not import client module. Make sure all dependencies are installed.")
+            return 1
+
+    elif args.mode == 'play':
+        if not args.recording:
+            parser.error("play needs --recording")
+        try:
+            from client.player import main as player_main
+            player_main(args.recording, args.gpu)
         except ImportError:
             print("Error: Could not import client module. Make sure all dependencies are installed.")
             return 1